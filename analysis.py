@@ -0,0 +1,101 @@
+"""Pure computations behind the concrete composition analysis.
+
+Nothing in this module touches Streamlit, so results can be cached by the
+app against a content hash of the dataset and reused across reruns.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import regression
+from covariance import CovarianceIndex
+from ingest import NUMERIC_COLUMNS
+
+AVG_COLUMNS = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'PGR (см)', 'W_B']
+
+STRENGTH_PARAMS = [
+    ('Rc28 (МПа)', 'Прочность на сжатие'),
+    ('Rt (МПа)', 'Прочность на растяжение'),
+    ('Rras (МПа)', 'Прочность на раскалывание'),
+]
+
+CORR_COLUMNS = NUMERIC_COLUMNS
+
+
+def dataset_hash(df):
+    """Return a stable content hash of a data frame (values and column names)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def aggregate(df):
+    """Average every measured parameter per cement share."""
+    return df.groupby('Cement_share (%)').agg(
+        {col: 'mean' for col in AVG_COLUMNS}
+    ).reset_index()
+
+
+def summarize(df_avg):
+    """Pick the optimal composition and the ranges used by the metric cards."""
+    best = df_avg.loc[df_avg['Rc28 (МПа)'].idxmax()]
+    return {
+        'max_cement': best['Cement_share (%)'],
+        'max_rc28': df_avg['Rc28 (МПа)'].max(),
+        'max_rt': df_avg['Rt (МПа)'].max(),
+        'max_rras': df_avg['Rras (МПа)'].max(),
+        'min_cement': df_avg['Cement_share (%)'].min(),
+        'min_rc28': df_avg['Rc28 (МПа)'].min(),
+        'min_rt': df_avg['Rt (МПа)'].min(),
+        'min_rras': df_avg['Rras (МПа)'].min(),
+        'optimal_wb': best['W_B'],
+        'optimal_pgr': best['PGR (см)'],
+    }
+
+
+def fit_regressions(df):
+    """Fit a linear trend of every strength parameter against cement share.
+
+    All parameters are fitted together on the raw specimen rows; the trend
+    lines carry 95% prediction intervals.
+    """
+    params = [param for param, _ in STRENGTH_PARAMS]
+    model = regression.fit(df, ['Cement_share (%)'], params)
+
+    x = df['Cement_share (%)'].to_numpy(np.float64, na_value=np.nan)
+    x_line = np.linspace(np.nanmin(x), np.nanmax(x), 100)
+    y_line, y_low, y_high = model.predict(x_line[:, None], alpha=0.05)
+
+    regression_data = []
+    for k, (param, name) in enumerate(STRENGTH_PARAMS):
+        regression_data.append({
+            'param': param,
+            'name': name,
+            'slope': model.coef[1, k],
+            'intercept': model.coef[0, k],
+            'r_squared': model.r_squared[k],
+            'x_line': x_line,
+            'y_line': y_line[:, k],
+            'y_low': y_low[:, k],
+            'y_high': y_high[:, k]
+        })
+
+    return regression_data
+
+
+def correlation(df, columns=CORR_COLUMNS):
+    """Pearson correlation matrix of the given columns, NaNs handled pairwise."""
+    return CovarianceIndex.from_frame(df, columns).correlation()
+
+
+def analyze(df):
+    """Run the whole analysis of one dataset, as the app and the batch CLI do."""
+    df_avg = aggregate(df)
+    return {
+        'df_avg': df_avg,
+        'summary': summarize(df_avg),
+        'regression_data': fit_regressions(df),
+        'correlation': correlation(df),
+    }
@@ -1,12 +1,22 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import time
-from io import BytesIO
-import numpy as np
-from scipy import stats
+import os
+from functools import partial
+
+from analysis import dataset_hash
+from ingest import SUPPORTED_TYPES, MissingColumnsError, content_hash, load_upload
+from outliers import detect
+from paging import (DEFAULT_PAGE_SIZE, PAGE_SIZES, TableQuery, merge_edits, page_count, page_positions,
+                    select_rows, with_page_ids)
+from shared_cache import MB, deep_size, get_cache, get_registry
+from store import ExperimentStore
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from validation import ACTIONS, apply_action, validate
+
+# The working frames are shared between reruns and sessions rather than
+# copied; pandas 3 always copies on write, pandas 2 needs the option.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 st.set_page_config(
     page_title="Анализ состава бетона",
@@ -19,94 +29,214 @@ if 'analyze_clicked' not in st.session_state:
     st.session_state.analyze_clicked = False
 
 
-data = {
-    '№': [1, 2, 3, 4, 5, 6, 7, 8],
-    'Cement_share (%)': [50, 60, 70, 80, 50, 60, 70, 80],
-    'W_B': [0.429, 0.429, 0.358, 0.286, 0.429, 0.429, 0.322, 0.268],
-    'Additive (%)': [0.09, 0.09, 0.10, 0.10, 0.09, 0.09, 0.10, 0.10],
-    'Fiber (%)': [0.40, 0.40, 0.40, 0.40, 0.40, 0.40, 0.40, 0.40],
-    'Rc28 (МПа)': [17.7, 18.1, 20.3, 22.9, 17.1, 18.3, 19.8, 22.6],
-    'Rt (МПа)': [1.7, 1.9, 2.1, 3.2, 1.6, 2.0, 2.3, 3.4],
-    'Rras (МПа)': [0.9, 1.0, 1.9, 2.5, 0.9, 1.1, 1.8, 2.9],
-    'PGR (см)': [7.2, 7.2, 7.4, 7.3, 7.3, 7.1, 7.5, 7.4],
-    'Experiment': ['Опыт 1', 'Опыт 1', 'Опыт 1', 'Опыт 1', 
-                   'Опыт 2', 'Опыт 2', 'Опыт 2', 'Опыт 2']
-}
+@st.cache_resource
+def experiment_store():
+    store = ExperimentStore()
+    store.seed()
+    return store
 
-df = pd.DataFrame(data)
 
+store = experiment_store()
 
-df_avg = df.groupby('Cement_share (%)').agg({
-    'Rc28 (МПа)': 'mean',
-    'Rt (МПа)': 'mean',
-    'Rras (МПа)': 'mean',
-    'PGR (см)': 'mean',
-    'W_B': 'mean'
-}).reset_index()
+# Results shared by every session of this server process; see shared_cache.py.
+shared = get_cache()
 
 
 st.subheader("Экспериментальные данные")
 
-# Excel file uploader
+# Lab data uploader: Excel workbooks are streamed, CSV and Parquet read in chunks
 uploaded_file = st.file_uploader(
-    "Загрузите Excel файл с данными (опционально)",
-    type=['xlsx', 'xls'],
-    help="Файл должен содержать колонки: Cement_share (%), W_B, Additive (%), Fiber (%), Rc28 (МПа), Rt (МПа), Rras (МПа), PGR (см), Experiment"
+    "Загрузите файл с данными: Excel, CSV или Parquet (опционально)",
+    type=SUPPORTED_TYPES,
+    help="Файл должен содержать колонки: Cement_share (%), W_B, Additive (%), Fiber (%), Rc28 (МПа), Rt (МПа), Rras (МПа), PGR (см), Experiment. Необязательно: прочность в другом возрасте Rc1, Rc3, Rc7, Rc14, Rc90 (МПа)"
 )
 
+
+@shared.memoize(on_miss=lambda: st.spinner("Читаем файл..."))
+def cached_upload(file_hash, file_name, _data):
+    return load_upload(file_name, _data)
+
+
+@shared.memoize
+def cached_validation(file_hash, _df, _unparsable):
+    return validate(_df, unparsable=_unparsable)
+
+
+REPORT_LIMIT = 1000
+
+# Specimens loaded by default; bigger histories open with the newest batches only.
+DEFAULT_LOAD_ROWS = 200_000
+
+
 if uploaded_file is not None:
     try:
-        # Read Excel file
-        df_uploaded = pd.read_excel(uploaded_file)
-        
-        # Check if required columns exist
-        required_columns = ['Cement_share (%)', 'W_B', 'Additive (%)', 'Fiber (%)', 
-                          'Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'PGR (см)', 'Experiment']
-        
-        if all(col in df_uploaded.columns for col in required_columns):
-            # Remove № column from uploaded data if exists
-            if '№' in df_uploaded.columns:
-                df_uploaded = df_uploaded.drop(columns=['№'])
-            
-            # Data validation
-            warnings = []
-            if (df_uploaded['Cement_share (%)'] < 0).any() or (df_uploaded['Cement_share (%)'] > 100).any():
-                warnings.append("⚠️ Доля цемента должна быть от 0% до 100%")
-            if (df_uploaded['W_B'] <= 0).any():
-                warnings.append("⚠️ Водовяжущее отношение должно быть положительным")
-            if (df_uploaded[['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)']] < 0).any().any():
-                warnings.append("⚠️ Значения прочности не могут быть отрицательными")
-            
-            if warnings:
-                for warning in warnings:
-                    st.warning(warning)
-            
-            # Add uploaded data to existing data
-            df = pd.concat([df, df_uploaded], ignore_index=True)
-            # Recalculate № column
-            df['№'] = range(1, len(df) + 1)
-            st.success(f"✅ Добавлено {len(df_uploaded)} строк из Excel файла! Данные отображены в таблице ниже.")
-        else:
-            missing_cols = [col for col in required_columns if col not in df_uploaded.columns]
-            st.error(f"В файле отсутствуют колонки: {', '.join(missing_cols)}")
-            st.info("Используются данные по умолчанию. Проверьте формат Excel файла.")
+        file_bytes = uploaded_file.getvalue()
+        df_uploaded, unparsable = cached_upload(content_hash(file_bytes), uploaded_file.name, file_bytes)
+
+        # Data validation
+        validation = cached_validation(content_hash(file_bytes), df_uploaded, unparsable)
+        if not validation.ok:
+            n_invalid = int(validation.invalid.sum())
+            st.warning(f"⚠️ Найдено строк с ошибками: {n_invalid} из {len(df_uploaded)}")
+            with st.expander("Отчет о проверке данных"):
+                st.dataframe(validation.summary(), use_container_width=True, hide_index=True)
+                st.dataframe(validation.report(limit=REPORT_LIMIT), use_container_width=True, hide_index=True)
+                if n_invalid > REPORT_LIMIT:
+                    st.caption(f"Показаны первые {REPORT_LIMIT} строк с ошибками")
+
+            action = st.radio(
+                "Что сделать со строками с ошибками?",
+                options=list(ACTIONS),
+                format_func=ACTIONS.get,
+                horizontal=True
+            )
+            df_uploaded, quarantined = apply_action(df_uploaded, validation, action)
+            if len(quarantined):
+                with st.expander(f"Карантин: {len(quarantined)} строк"):
+                    st.dataframe(quarantined, use_container_width=True, hide_index=True)
+
+        # Save the upload as a batch; re-sending the same rows is a no-op
+        store.put_batch(content_hash(file_bytes), uploaded_file.name, df_uploaded,
+                        data_hash=dataset_hash(df_uploaded))
+        st.success(f"✅ Добавлено {len(df_uploaded)} строк из файла в базу испытаний! Данные отображены в таблице ниже.")
+    except MissingColumnsError as e:
+        st.error(f"В файле отсутствуют колонки: {', '.join(e.missing)}")
+        st.info("Используются данные из базы испытаний. Проверьте формат файла.")
     except Exception as e:
         st.error(f"Ошибка при чтении файла: {str(e)}")
-        st.info("Используются данные по умолчанию.")
+        st.info("Используются данные из базы испытаний.")
+
+
+@shared.memoize(on_miss=lambda: st.spinner("Загружаем данные из базы..."))
+def cached_slice(revision, batch_ids, experiments):
+    return store.load(batch_ids=batch_ids, experiments=experiments or None)
+
+
+@shared.memoize
+def cached_history(revision):
+    return store.batches(), store.group_means()
+
+
+@shared.memoize
+def cached_rows(data_key, query, _df):
+    return select_rows(_df, query)
+
+
+@shared.memoize(on_miss=lambda: st.spinner("Ищем выбросы..."))
+def cached_outliers(data_key, _df):
+    return detect(_df)
+
+
+def table_query(df):
+    """Filter and sort controls of the specimen tables."""
+    col1, col2, col3 = st.columns(3)
+    shares = col1.multiselect("Доли цемента (пусто - все)",
+                              options=sorted(df['Cement_share (%)'].dropna().unique().tolist()))
+    experiments = col2.multiselect("Опыты в таблице (пусто - все)",
+                                   options=df['Experiment'].dropna().unique().tolist())
+    strength = df['Rc28 (МПа)'].dropna()
+    strength_range = None
+    if len(strength) and strength.min() < strength.max():
+        bounds = (float(strength.min()), float(strength.max()))
+        selected = col3.slider("Rc28 (МПа)", *bounds, value=bounds)
+        if selected != bounds:
+            strength_range = selected
+    col4, col5, col6 = st.columns(3)
+    sort_by = col4.selectbox("Сортировать по", options=[None] + [col for col in df.columns if col != '№'],
+                             format_func=lambda col: "порядку в базе" if col is None else col)
+    descending = col5.checkbox("По убыванию", disabled=sort_by is None)
+    page_size = col6.selectbox("Строк на странице", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
+    query = TableQuery(cement_shares=tuple(shares), experiments=tuple(experiments),
+                       strength_range=strength_range, sort_by=sort_by, ascending=not descending)
+    return query, page_size
+
+
+def table_page(df, positions, page_size, key):
+    """Page selector for ``df[positions]``; returns the positions of the rows of the chosen page."""
+    n_pages = page_count(len(positions), page_size)
+    page = 1
+    if n_pages > 1:
+        # Keyed on the page count, so a new filter starts again from the first page.
+        page = st.number_input(f"Страница из {n_pages}", min_value=1, max_value=n_pages, step=1,
+                               key=f"{key}_{n_pages}")
+    start = (page - 1) * page_size
+    st.caption(f"Строки {min(start + 1, len(positions))}–{min(start + page_size, len(positions))} "
+               f"из {len(positions)} (всего в выборке: {len(df)})")
+    return page_positions(positions, page, page_size)
+
+
+def default_batches(batches):
+    """Newest batches that together fit into ``DEFAULT_LOAD_ROWS`` (at least one)."""
+    fits = batches['n_rows'].cumsum() <= DEFAULT_LOAD_ROWS
+    fits.iloc[:1] = True
+    return batches.loc[fits, 'id'].tolist()
+
+
+revision = store.revision
+batches, history_means = cached_history(revision)
+batch_labels = {row.id: f"{row.source} ({row.created_on}, {row.n_rows} обр.)"
+                for row in batches.itertuples()}
+
+with st.expander("База испытаний"):
+    selected_batches = st.multiselect(
+        "Серии испытаний",
+        options=list(batch_labels),
+        default=default_batches(batches),
+        format_func=batch_labels.get
+    )
+    selected_experiments = st.multiselect(
+        "Опыты (пусто - все)",
+        options=store.experiments()
+    )
+    st.dataframe(
+        batches.rename(columns={'source': 'Источник', 'created_on': 'Добавлена', 'n_rows': 'Образцов',
+                                'first_test': 'Первое испытание', 'last_test': 'Последнее испытание'}),
+        use_container_width=True,
+        hide_index=True,
+        column_config={'id': None}
+    )
+    st.markdown("**Средние по всей базе:**")
+    st.dataframe(history_means, use_container_width=True, hide_index=True)
+
+# The cached slice is shared with other sessions: number the rows of a shallow copy.
+df = cached_slice(revision, tuple(selected_batches), tuple(selected_experiments)).copy(deep=False)
+df.insert(0, '№', range(1, len(df) + 1))
 
 st.markdown("""
 Ниже представлены результаты лабораторных испытаний образцов мелкозернистого бетона 
 с различным содержанием цемента (50%, 60%, 70%, 80%).
 
 **Инструкции:**
-- **Импорт Excel:** загрузите файл выше - данные сразу появятся в таблице
+- **Импорт Excel:** загрузите файл выше - данные сохранятся в базе и сразу появятся в таблице
 - **Редактировать:** двойной клик по ячейке
 - **Добавить строку:** кнопка + внизу таблицы
 - **Удалить строку:** наведите на номер строки и кликните на значок корзины
+- **Сохранить:** кнопка «Сохранить изменения в базе» под таблицей - правки сохранятся между сессиями
+- **Страницы:** в таблице показана одна страница выборки; сохраните правки перед переходом на другую страницу или сменой фильтра
 """)
 
-edited_df = st.data_editor(
-    df,
+query, page_size = table_query(df)
+mark_outliers = st.checkbox(
+    "Отмечать выбросы",
+    value=True,
+    help="Колонка «Выброс» показывает образцы, выпадающие из повторов своего состава, "
+         "и составы со слишком большим разбросом"
+)
+slice_key = (revision, tuple(selected_batches), tuple(selected_experiments))
+page_rows = table_page(df, cached_rows(slice_key, query, df), page_size, key='editor_page')
+page = df.iloc[page_rows]
+editor_page = page.reset_index(drop=True)
+if mark_outliers:
+    slice_outliers = cached_outliers(slice_key, df)
+    editor_page.insert(1, 'Выброс', slice_outliers.describe(slice_outliers.codes[page_rows]))
+
+# The editor reports edits by row position within the page, so its state must
+# not outlive the page: the key changes with the specimens shown (whatever
+# the page number, filter or sort that selected them) and with the data.
+editor_key = f"editor_{revision}_{content_hash(page.index.to_numpy().tobytes())}"
+edited_page = st.data_editor(
+    editor_page,
+    key=editor_key,
     use_container_width=True,
     height=310,
     hide_index=True,
@@ -121,352 +251,553 @@ edited_df = st.data_editor(
         'Rt (МПа)': st.column_config.NumberColumn("Rt (МПа)", format="%.1f"),
         'Rras (МПа)': st.column_config.NumberColumn("Rras (МПа)", format="%.1f"),
         'PGR (см)': st.column_config.NumberColumn("PGR (см)", format="%.1f"),
+        'Выброс': st.column_config.TextColumn("Выброс", disabled=True),
     }
 )
+edited_page = with_page_ids(page, edited_page)
+
+if st.button("Сохранить изменения в базе"):
+    n_changed = store.apply_edits(page, edited_page)
+    st.toast(f"Сохранено строк: {n_changed}")
+    st.rerun()
 
 col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
 with col_btn2:
     if st.button("Анализировать данные", type="primary", use_container_width=True):
         st.session_state.analyze_clicked = True
 
+# Session state that is rebuilt on demand and can be dropped when a session
+# holds more memory than allowed.
+REBUILDABLE_STATE = ('group_indexes', 'correlation_index')
+
+
+def account_session(*working):
+    """Report the memory this session holds outside the shared cache; trim it over the limit.
+
+    Counted are the session state and the given frames of the current run;
+    results in the shared cache belong to every session and are excluded,
+    down to the array buffers that views of them share.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    registry = get_registry()
+    seen = shared.value_ids()
+    held = [*st.session_state.to_dict().values(), *working]
+    nbytes = sum(deep_size(value, seen) for value in held)
+    if registry.report(ctx.session_id, nbytes):
+        for key in REBUILDABLE_STATE:
+            st.session_state.pop(key, None)
+        registry.report(ctx.session_id, nbytes, trimmed=True)
+        st.warning(f"Сессия занимает {nbytes / MB:.0f} МБ при лимите {registry.max_bytes / MB:.0f} МБ: "
+                   "промежуточные результаты сброшены. Выберите меньше серий испытаний.")
+
+
+# The editor only reports changes of the visible page; the analysis sees them
+# applied to the whole slice.
+edited_df = merge_edits(df, page, edited_page, st.session_state[editor_key])
+
+# ``edited_df`` is ``df`` until something is edited, and after that shares
+# every column that was not changed with it and with the cached slice.
+account_session(edited_df)
+
 if not st.session_state.analyze_clicked:
     st.stop()
 
-analysis_container = st.empty()
+# Everything below only runs after the analyze button was clicked, so the
+# plotting, statistics and report stacks are not imported for the first paint.
+import plotly.graph_objects as go
+
+from analysis import CORR_COLUMNS, STRENGTH_PARAMS, fit_regressions, summarize
+from covariance import CovarianceIndex
+from doe import DESIGNS, plan
+from export import (EXPORT_FORMATS, POLL_SECONDS, REPORT_FIGURES, build_html_report, build_pdf_report,
+                    get_exports, pdf_available, to_csv, to_parquet)
+from figures import (POINTS_3D, FigureFactory, control_chart_figure, experiment_scatter, figure_timings,
+                     maturity_figure, prediction_figure)
+from groupstats import MIX_FACTORS, GroupStatsIndex
+from maturity import MODELS, age_columns, has_curing_ages, mix_labels, predict_rc28
+from optimizer import SURFACE_RESPONSES, Constraints, factor_bounds, optimize_mix
+from perf import StageTimer
+import regression
+from rendering import DEFAULT_POINT_BUDGET, reduce_frame
+from report import EXCEL_MIME, build_excel_report
+from resampling import bootstrap, permutation_test
+import spc
+
+def group_index(df, keys):
+    """Return the session's statistics index for ``keys``, brought up to date with ``df``.
+
+    Only the rows that differ from the frame seen on the previous rerun are
+    applied, so cell edits do not trigger a new groupby over the whole table.
+    """
+    indexes = st.session_state.setdefault('group_indexes', {})
+    entry = indexes.get(tuple(keys))
+    if entry is None:
+        index = GroupStatsIndex.from_frame(df, keys)
+    else:
+        index, seen = entry
+        if seen is not df:
+            index.update(seen, df)
+    indexes[tuple(keys)] = (index, df)
+    return index
+
+
+def correlation_index(df):
+    """Return the session's covariance index, brought up to date with ``df``."""
+    entry = st.session_state.get('correlation_index')
+    if entry is None:
+        index = CovarianceIndex.from_frame(df, CORR_COLUMNS)
+    else:
+        index, seen = entry
+        if seen is not df:
+            index.update(seen, df)
+    st.session_state.correlation_index = (index, df)
+    return index
+
+
+def ci_help(index, metric, unit):
+    """Tooltip with the mean and 95% confidence interval of the best group."""
+    described = index.describe(metric)
+    best = described.loc[described['mean'].idxmax()]
+    if best['n'] < 2:
+        return f"Среднее {best['mean']:.2f} {unit}, n = 1: доверительный интервал не определен"
+    return (f"Среднее {best['mean']:.2f} ± {best['ci_high'] - best['mean']:.2f} {unit} "
+            f"(95% ДИ), σ = {best['std']:.2f}, n = {int(best['n'])}")
+
+
+# Cached wrappers: the leading-underscore arguments are not part of the key,
+# the dataset content hash is.  Results are shared by all sessions, so they
+# must not be modified by the callers.
+
+@shared.memoize
+def cached_regressions(data_hash, _df):
+    return fit_regressions(_df)
+
+
+@shared.memoize
+def cached_model(data_hash, factors, degree, interactions, _df):
+    model = regression.fit(_df, factors, degree=degree, interactions=interactions)
+    fit_table = pd.DataFrame({
+        'Параметр': model.responses,
+        'R²': model.r_squared,
+        'σ остатков': model.sigma,
+        'Наблюдений': model.n_obs,
+    })
+    return fit_table, model.table()
 
-with analysis_container:
-    with st.spinner('Анализируем данные...'):
-        progress_bar = st.progress(0)
-        for percent_complete in range(100):
-            time.sleep(0.01)
-            progress_bar.progress(percent_complete + 1)
-        time.sleep(0.2)
 
-analysis_container.success('Анализ завершен!')
-time.sleep(0.5)
-analysis_container.empty()
+@st.cache_resource
+def figure_factory():
+    # Layout templates do not depend on the data, so all sessions share them.
+    return FigureFactory()
+
+
+@shared.memoize
+def cached_points(data_hash, point_budget, _df):
+    return reduce_frame(_df, POINTS_3D, point_budget)
+
+
+@shared.memoize
+def cached_optimization(data_hash, constraints, target, resolution, n_starts, processes, _df):
+    return optimize_mix(_df, constraints, target=target, resolution=resolution,
+                        n_starts=n_starts, processes=processes)
+
+
+@shared.memoize
+def cached_plan(data_hash, kind, n, levels, target, bounds, _df):
+    return plan(_df, kind, n=n, levels=levels, target=target, bounds=bounds)
+
+
+# Worker processes one computation may start.  Every session that misses the
+# cache starts its own pool, so by default a few cores are left to the rest.
+WORKER_PROCESSES = int(os.environ.get('CONCRETE_WORKERS', min(4, os.cpu_count() or 1)))
 
-df = edited_df.copy()
 
-df_avg = df.groupby('Cement_share (%)').agg({
-    'Rc28 (МПа)': 'mean',
-    'Rt (МПа)': 'mean',
-    'Rras (МПа)': 'mean',
-    'PGR (см)': 'mean',
-    'W_B': 'mean'
-}).reset_index()
+@shared.memoize
+def cached_bootstrap(data_hash, _df):
+    # Small datasets are resampled in-process; see resampling.BLOCK_CELLS.
+    return bootstrap(_df, processes=WORKER_PROCESSES)
+
+
+@shared.memoize
+def cached_permutation_test(data_hash, experiments, _df):
+    return permutation_test(_df, experiments)
+
+
+@shared.memoize
+def cached_maturity(data_hash, model, max_age, keys, _df):
+    return predict_rc28(_df, model=model, max_age=max_age, keys=keys)
+
+
+@shared.memoize
+def cached_experiment_scatter(data_hash, point_budget, _df):
+    return experiment_scatter(_df, point_budget)
+
+
+@shared.memoize
+def cached_excel_report(data_hash, _df, _df_avg, _summary):
+    return build_excel_report(_df, _df_avg, _summary)
+
 
 st.sidebar.header("Настройки визуализации")
 show_individual = st.sidebar.checkbox("Показать отдельные эксперименты", value=False)
-highlight_80 = st.sidebar.checkbox("Выделить 80% цемента", value=True)
+highlight_optimum = st.sidebar.checkbox("Выделить оптимальную долю цемента", value=True)
+point_budget = st.sidebar.number_input(
+    "Максимум точек на графиках",
+    min_value=500,
+    max_value=200_000,
+    value=DEFAULT_POINT_BUDGET,
+    step=500,
+    help="Большие наборы данных прореживаются на сервере до этого числа точек"
+)
+show_uncertainty = st.sidebar.checkbox(
+    "Доверительные интервалы выводов",
+    value=True,
+    help="Бутстреп-оценка неопределенности оптимума, приростов прочности и трендов"
+)
+exclude_outliers = st.sidebar.checkbox(
+    "Исключить выбросы из расчетов",
+    value=False,
+    help="Образцы, отмеченные тестами медиана/MAD, Граббса или Диксона, не входят в средние, "
+         "регрессии и выводы"
+)
+show_perf = st.sidebar.checkbox("Показать производительность", value=False)
 
-col1, col2, col3, col4 = st.columns(4)
+analysis_stages = [
+    "Агрегация данных",
+    "Регрессионный анализ",
+    "Корреляционная матрица",
+    "Построение графиков",
+]
+
+analysis_container = st.empty()
+progress_bar = analysis_container.progress(0.0, text="Анализируем данные...")
+
+
+def update_progress(fraction, stage_name):
+    progress_bar.progress(fraction, text=f"Анализируем данные: {stage_name}")
+
+
+timer = StageTimer(analysis_stages, on_progress=update_progress, track_memory=show_perf)
+
+# No defensive copy: with copy-on-write a later write to df copies only what it touches.
+df = edited_df
+data_hash = dataset_hash(df)
+outliers = cached_outliers(data_hash, df)
+if exclude_outliers and outliers.outliers.any():
+    df = df[~outliers.outliers]
+    data_hash = dataset_hash(df)
+
+with timer.stage("Агрегация данных"):
+    cement_index = group_index(df, ['Cement_share (%)'])
+    df_avg = cement_index.means()
+    summary = summarize(df_avg)
+
+with timer.stage("Регрессионный анализ"):
+    regression_data = cached_regressions(data_hash, df)
+
+with timer.stage("Корреляционная матрица"):
+    correlation_matrix = correlation_index(df).correlation()
+
+with timer.stage("Построение графиков"):
+    points = cached_points(data_hash, point_budget, df)
+    figures, figure_seconds = figure_factory().build_all(
+        df_avg, regression_data, correlation_matrix, points,
+        optimum=summary['max_cement'] if highlight_optimum else None
+    )
+    if show_individual:
+        fig4 = cached_experiment_scatter(data_hash, point_budget, df)
+
+analysis_container.empty()
+st.toast('Анализ завершен!')
+
+if show_perf:
+    st.sidebar.subheader("Производительность")
+    st.sidebar.dataframe(
+        timer.to_frame(),
+        hide_index=True,
+        column_config={
+            'Время (мс)': st.column_config.NumberColumn(format="%.1f"),
+            'Пик памяти (МБ)': st.column_config.NumberColumn(format="%.2f"),
+        }
+    )
+    st.sidebar.caption(f"Всего: {timer.total_seconds * 1000:.1f} мс")
+    st.sidebar.dataframe(
+        figure_timings(figures, figure_seconds),
+        hide_index=True,
+        column_config={
+            'Построение (мс)': st.column_config.NumberColumn(format="%.1f"),
+            'Сериализация (мс)': st.column_config.NumberColumn(format="%.1f"),
+        }
+    )
 
-max_cement = df_avg.loc[df_avg['Rc28 (МПа)'].idxmax(), 'Cement_share (%)']
-max_rc28 = df_avg['Rc28 (МПа)'].max()
-max_rt = df_avg['Rt (МПа)'].max()
-max_rras = df_avg['Rras (МПа)'].max()
+col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     st.metric(
         label="Оптимальная доля цемента",
-        value=f"{int(max_cement)}%",
+        value=f"{int(summary['max_cement'])}%",
         delta="Рекомендуется"
     )
 
 with col2:
     st.metric(
         label="Прочность на сжатие (Rc28)",
-        value=f"{max_rc28:.1f} МПа",
-        delta=f"+{max_rc28 - df_avg['Rc28 (МПа)'].min():.1f} МПа"
+        value=f"{summary['max_rc28']:.1f} МПа",
+        delta=f"+{summary['max_rc28'] - summary['min_rc28']:.1f} МПа",
+        help=ci_help(cement_index, 'Rc28 (МПа)', "МПа")
     )
 
 with col3:
     st.metric(
         label="Прочность на растяжение (Rt)",
-        value=f"{max_rt:.1f} МПа",
-        delta=f"+{max_rt - df_avg['Rt (МПа)'].min():.1f} МПа"
+        value=f"{summary['max_rt']:.1f} МПа",
+        delta=f"+{summary['max_rt'] - summary['min_rt']:.1f} МПа",
+        help=ci_help(cement_index, 'Rt (МПа)', "МПа")
     )
 
 with col4:
     st.metric(
         label="Прочность на раскалывание (Rras)",
-        value=f"{max_rras:.1f} МПа",
-        delta=f"+{max_rras - df_avg['Rras (МПа)'].min():.1f} МПа"
+        value=f"{summary['max_rras']:.1f} МПа",
+        delta=f"+{summary['max_rras'] - summary['min_rras']:.1f} МПа",
+        help=ci_help(cement_index, 'Rras (МПа)', "МПа")
     )
 
 
 st.subheader("Зависимость прочностных характеристик от доли цемента")
-
-fig = make_subplots(
-    rows=2, cols=2,
-    subplot_titles=(
-        'Прочность на сжатие после 28 суток (Rc28)',
-        'Прочность на растяжение (Rt)',
-        'Прочность на раскалывание (Rras)',
-        'Подвижность смеси (PGR)'
-    ),
-    vertical_spacing=0.18,
-    horizontal_spacing=0.15
-)
-
-colors = ['#3498db' if x != 80 else '#e74c3c' for x in df_avg['Cement_share (%)']]
-if not highlight_80:
-    colors = ['#3498db'] * len(df_avg)
-
-fig.add_trace(
-    go.Bar(
-        x=df_avg['Cement_share (%)'],
-        y=df_avg['Rc28 (МПа)'],
-        name='Rc28',
-        marker_color=colors,
-        text=df_avg['Rc28 (МПа)'].round(1),
-        textposition='outside',
-        showlegend=False
-    ),
-    row=1, col=1
-)
-
-fig.add_trace(
-    go.Bar(
-        x=df_avg['Cement_share (%)'],
-        y=df_avg['Rt (МПа)'],
-        name='Rt',
-        marker_color=colors,
-        text=df_avg['Rt (МПа)'].round(1),
-        textposition='outside',
-        showlegend=False
-    ),
-    row=1, col=2
-)
-
-fig.add_trace(
-    go.Bar(
-        x=df_avg['Cement_share (%)'],
-        y=df_avg['Rras (МПа)'],
-        name='Rras',
-        marker_color=colors,
-        text=df_avg['Rras (МПа)'].round(1),
-        textposition='outside',
-        showlegend=False
-    ),
-    row=2, col=1
-)
-
-fig.add_trace(
-    go.Bar(
-        x=df_avg['Cement_share (%)'],
-        y=df_avg['PGR (см)'],
-        name='PGR',
-        marker_color=colors,
-        text=df_avg['PGR (см)'].round(1),
-        textposition='outside',
-        showlegend=False
-    ),
-    row=2, col=2
-)
-
-fig.update_xaxes(title_text="Доля цемента (%)", row=1, col=1)
-fig.update_xaxes(title_text="Доля цемента (%)", row=1, col=2)
-fig.update_xaxes(title_text="Доля цемента (%)", row=2, col=1)
-fig.update_xaxes(title_text="Доля цемента (%)", row=2, col=2)
-
-fig.update_yaxes(title_text="МПа", row=1, col=1)
-fig.update_yaxes(title_text="МПа", row=1, col=2)
-fig.update_yaxes(title_text="МПа", row=2, col=1)
-fig.update_yaxes(title_text="см", row=2, col=2)
-
-fig.update_layout(height=700, showlegend=False)
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(figures['strength'], use_container_width=True)
+
+st.subheader("Набор прочности во времени")
+if has_curing_ages(df):
+    early_ages = [age for age in age_columns(df)[0] if age < 28]
+    col_maturity1, col_maturity2, col_maturity3 = st.columns(3)
+    with col_maturity1:
+        maturity_model = st.selectbox("Модель набора прочности", options=list(MODELS), format_func=MODELS.get)
+    with col_maturity2:
+        maturity_age = st.selectbox(
+            "Прогноз Rc28 по испытаниям до (сут)",
+            options=early_ages,
+            index=len(early_ages) - 1,
+            format_func=lambda age: f"{age:g}"
+        )
+    with col_maturity3:
+        maturity_keys = st.multiselect(
+            "Составы различаются по",
+            options=MIX_FACTORS + ['Experiment'],
+            default=['Cement_share (%)']
+        )
+
+    if maturity_keys:
+        maturity = cached_maturity(data_hash, maturity_model, maturity_age, tuple(maturity_keys), df)
+        labels = mix_labels(maturity['mixes'])
+        col_curves, col_prediction = st.columns(2)
+        with col_curves:
+            st.plotly_chart(maturity_figure(maturity, labels, maturity_age), use_container_width=True)
+        with col_prediction:
+            st.plotly_chart(prediction_figure(maturity['table'], labels), use_container_width=True)
+        error = maturity['table']['Ошибка (%)'].abs()
+        if error.notna().any():
+            st.caption(f"Средняя абсолютная ошибка прогноза Rc28: {error.mean():.1f}% "
+                       f"по {int(error.notna().sum())} составам.")
+        with st.expander("Прогноз Rc28 по составам"):
+            st.dataframe(maturity['table'], use_container_width=True, hide_index=True,
+                         column_config={col: st.column_config.NumberColumn(format="%.2f")
+                                        for col in ['Rc28 факт', 'Rc28 прогноз', 'Ошибка (%)']})
+else:
+    st.caption("Добавьте в данные прочность в другом возрасте (колонки Rc1, Rc3, Rc7, Rc14 или Rc90 (МПа)), "
+               "чтобы построить кривые набора прочности и прогноз Rc28 по ранним испытаниям.")
 
 st.subheader("Сравнительный анализ всех прочностных характеристик")
-
-fig2 = go.Figure()
-
-fig2.add_trace(go.Scatter(
-    x=df_avg['Cement_share (%)'],
-    y=df_avg['Rc28 (МПа)'],
-    mode='lines+markers',
-    name='Rc28 (сжатие)',
-    line=dict(width=3),
-    marker=dict(size=12)
-))
-
-fig2.add_trace(go.Scatter(
-    x=df_avg['Cement_share (%)'],
-    y=df_avg['Rt (МПа)'],
-    mode='lines+markers',
-    name='Rt (растяжение)',
-    line=dict(width=3),
-    marker=dict(size=12)
-))
-
-fig2.add_trace(go.Scatter(
-    x=df_avg['Cement_share (%)'],
-    y=df_avg['Rras (МПа)'],
-    mode='lines+markers',
-    name='Rras (раскалывание)',
-    line=dict(width=3),
-    marker=dict(size=12)
-))
-
-if highlight_80:
-    fig2.add_vline(x=80, line_dash="dash", line_color="red", 
-                   annotation_text="Оптимум: 80%", 
-                   annotation_position="top")
-
-fig2.update_layout(
-    xaxis_title="Доля цемента (%)",
-    yaxis_title="Прочность (МПа)",
-    height=500,
-    hovermode='x unified',
-    legend=dict(
-        orientation="h",
-        yanchor="bottom",
-        y=1.02,
-        xanchor="right",
-        x=1
-    )
-)
-
-st.plotly_chart(fig2, use_container_width=True)
+st.plotly_chart(figures['comparison'], use_container_width=True)
 
 st.subheader("Зависимость водовяжущего отношения от доли цемента")
-
-fig3 = go.Figure()
-
-fig3.add_trace(go.Scatter(
-    x=df_avg['Cement_share (%)'],
-    y=df_avg['W_B'],
-    mode='lines+markers',
-    name='W/B',
-    line=dict(width=3, color='#9b59b6'),
-    marker=dict(size=12),
-    fill='tozeroy'
-))
-
-if highlight_80:
-    fig3.add_vline(x=80, line_dash="dash", line_color="red",
-                   annotation_text="Оптимальное значение",
-                   annotation_position="top")
-
-fig3.update_layout(
-    xaxis_title="Доля цемента (%)",
-    yaxis_title="Водовяжущее отношение (W/B)",
-    height=400,
-    showlegend=False
-)
-
-st.plotly_chart(fig3, use_container_width=True)
+st.plotly_chart(figures['wb'], use_container_width=True)
 
 
 st.subheader("Регрессионный анализ")
+st.markdown("Линейные тренды построены по всем образцам; заливка показывает 95% интервал прогноза.")
+st.plotly_chart(figures['regression'], use_container_width=True)
+
+with st.expander("Многофакторная модель"):
+    model_factors = st.multiselect(
+        "Факторы модели",
+        options=MIX_FACTORS,
+        default=['Cement_share (%)', 'W_B']
+    )
+    col_degree, col_interactions = st.columns(2)
+    with col_degree:
+        model_degree = st.selectbox("Степень полинома", options=[1, 2, 3], index=0)
+    with col_interactions:
+        model_interactions = st.checkbox("Парные взаимодействия факторов", value=False)
+
+    if model_factors:
+        fit_table, coef_table = cached_model(
+            data_hash, tuple(model_factors), model_degree, model_interactions, df
+        )
+        st.dataframe(fit_table, use_container_width=True, hide_index=True,
+                     column_config={'R²': st.column_config.NumberColumn(format="%.3f"),
+                                    'σ остатков': st.column_config.NumberColumn(format="%.3f")})
+        st.dataframe(coef_table, use_container_width=True, hide_index=True,
+                     column_config={'Коэффициент': st.column_config.NumberColumn(format="%.4g"),
+                                    'Ст. ошибка': st.column_config.NumberColumn(format="%.3g")})
+        st.caption("Члены модели, линейно зависимые от предыдущих (например, неизменный фактор), "
+                   "исключаются: их коэффициент равен 0, а стандартная ошибка не определена.")
 
-x = df_avg['Cement_share (%)'].values
-regression_data = []
-
-for param, name in [('Rc28 (МПа)', 'Прочность на сжатие'), 
-                     ('Rt (МПа)', 'Прочность на растяжение'),
-                     ('Rras (МПа)', 'Прочность на раскалывание')]:
-    y = df_avg[param].values
-    slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
-    r_squared = r_value**2
-    
-    x_line = np.linspace(x.min(), x.max(), 100)
-    y_line = slope * x_line + intercept
-    
-    regression_data.append({
-        'param': param,
-        'name': name,
-        'slope': slope,
-        'intercept': intercept,
-        'r_squared': r_squared,
-        'x_line': x_line,
-        'y_line': y_line
-    })
+st.markdown("**Корреляционная матрица:**")
+st.plotly_chart(figures['correlation'], use_container_width=True)
 
-fig_reg = make_subplots(
-    rows=1, cols=3,
-    subplot_titles=[r['name'] for r in regression_data],
-    horizontal_spacing=0.12
-)
 
-colors_reg = ['#3498db', '#e74c3c', '#2ecc71']
-
-for idx, reg in enumerate(regression_data, 1):
-    fig_reg.add_trace(
-        go.Scatter(
-            x=df_avg['Cement_share (%)'],
-            y=df_avg[reg['param']],
-            mode='markers',
-            name=reg['name'],
-            marker=dict(size=12, color=colors_reg[idx-1]),
-            showlegend=False
-        ),
-        row=1, col=idx
-    )
-    
-    fig_reg.add_trace(
-        go.Scatter(
-            x=reg['x_line'],
-            y=reg['y_line'],
-            mode='lines',
-            name=f"Тренд",
-            line=dict(color=colors_reg[idx-1], width=2, dash='dash'),
-            showlegend=False
-        ),
-        row=1, col=idx
-    )
-    
-    equation = f"y = {reg['slope']:.3f}x + {reg['intercept']:.2f}<br>R² = {reg['r_squared']:.3f}"
-    xref = 'x domain' if idx == 1 else f'x{idx} domain'
-    yref = 'y domain' if idx == 1 else f'y{idx} domain'
-    
-    fig_reg.add_annotation(
-        x=0.5,
-        y=0.95,
-        xref=xref,
-        yref=yref,
-        text=equation,
-        showarrow=False,
-        font=dict(size=10),
-        bgcolor="rgba(255, 255, 255, 0.8)",
-        bordercolor=colors_reg[idx-1],
-        borderwidth=1
-    )
+st.subheader("Оптимизация состава")
+st.markdown("""
+Поверхности отклика Rc28, Rt, Rras и PGR строятся по всем факторам состава, после чего
+перебирается сетка составов в пределах испытанных диапазонов с учетом ограничений и стоимости.
+""")
 
-fig_reg.update_xaxes(title_text="Доля цемента (%)")
-fig_reg.update_yaxes(title_text="МПа", row=1, col=1)
-fig_reg.update_yaxes(title_text="МПа", row=1, col=2)
-fig_reg.update_yaxes(title_text="МПа", row=1, col=3)
+with st.form("optimization_form"):
+    col_opt1, col_opt2, col_opt3 = st.columns(3)
+    with col_opt1:
+        opt_target = st.selectbox("Целевой показатель", options=SURFACE_RESPONSES[:3])
+        opt_min_pgr = st.number_input("Минимальная подвижность PGR (см)", min_value=0.0,
+                                      value=float(df['PGR (см)'].min()), step=0.1)
+    with col_opt2:
+        opt_wb_min = st.number_input("W/B не менее", min_value=0.0,
+                                     value=float(df['W_B'].min()), step=0.01, format="%.3f")
+        opt_wb_max = st.number_input("W/B не более", min_value=0.0,
+                                     value=float(df['W_B'].max()), step=0.01, format="%.3f")
+    with col_opt3:
+        opt_resolution = st.slider("Уровней сетки на фактор", min_value=5, max_value=60, value=25)
+        opt_parallel = st.checkbox("Локальное уточнение в нескольких процессах", value=False)
+
+    st.markdown("**Цены компонентов (₽/кг):**")
+    col_price1, col_price2, col_price3, col_price4 = st.columns(4)
+    with col_price1:
+        price_cement = st.number_input("Цемент", min_value=0.0, value=8.0)
+    with col_price2:
+        price_filler = st.number_input("Минеральный наполнитель", min_value=0.0, value=2.0)
+    with col_price3:
+        price_additive = st.number_input("Добавка", min_value=0.0, value=150.0)
+    with col_price4:
+        price_fiber = st.number_input("Фибра", min_value=0.0, value=250.0)
+
+    run_optimization = st.form_submit_button("Найти оптимальный состав")
+
+if run_optimization:
+    st.session_state.optimization_params = {
+        'constraints': Constraints(
+            min_pgr=opt_min_pgr,
+            wb_min=opt_wb_min,
+            wb_max=opt_wb_max,
+            price_cement=price_cement,
+            price_filler=price_filler,
+            price_additive=price_additive,
+            price_fiber=price_fiber,
+        ),
+        'target': opt_target,
+        'resolution': opt_resolution,
+        'n_starts': 8 if opt_parallel else 0,
+        'processes': WORKER_PROCESSES if opt_parallel else None,
+    }
 
-fig_reg.update_layout(height=400, showlegend=False)
-st.plotly_chart(fig_reg, use_container_width=True)
+if 'optimization_params' in st.session_state:
+    with st.spinner("Ищем оптимальный состав..."):
+        optimization = cached_optimization(data_hash, **st.session_state.optimization_params, _df=df)
+
+    st.caption(f"Проверено составов: {optimization['evaluated']:_}, "
+               f"удовлетворяют ограничениям: {optimization['feasible']:_}".replace('_', ' '))
+    best_mix = optimization['best']
+    if best_mix is None:
+        st.warning("Ни один состав не удовлетворяет ограничениям. Ослабьте ограничения.")
+    else:
+        target_name = st.session_state.optimization_params['target']
+        col_best1, col_best2, col_best3, col_best4 = st.columns(4)
+        col_best1.metric("Доля цемента", f"{best_mix['Cement_share (%)']:.1f}%")
+        col_best2.metric("W/B", f"{best_mix['W_B']:.3f}")
+        col_best3.metric(f"Прогноз {target_name}", f"{best_mix[f'{target_name} прогноз']:.1f}")
+        col_best4.metric("Стоимость, ₽/т вяжущего", f"{best_mix['Стоимость']:_.0f}".replace('_', ' '))
+
+        pareto = optimization['pareto']
+        fig_pareto = go.Figure(go.Scatter(
+            x=pareto['Стоимость'],
+            y=pareto[f'{target_name} прогноз'],
+            mode='lines+markers',
+            line=dict(shape='hv', color='#e67e22'),
+            customdata=pareto[['Cement_share (%)', 'W_B']],
+            hovertemplate='Стоимость: %{x:.0f} ₽/т<br>Прогноз: %{y:.1f}<br>'
+                          'Цемент: %{customdata[0]:.1f}%<br>W/B: %{customdata[1]:.3f}<extra></extra>'
+        ))
+        fig_pareto.update_layout(
+            title="Фронт Парето: прочность против стоимости",
+            xaxis_title="Стоимость (₽ за тонну вяжущего)",
+            yaxis_title=target_name,
+            height=400
+        )
+        st.plotly_chart(fig_pareto, use_container_width=True)
+        with st.expander("Составы фронта Парето"):
+            st.dataframe(pareto, use_container_width=True, hide_index=True)
+
+
+st.subheader("Планирование экспериментов")
+st.markdown("""
+План следующей серии испытаний: классические планы (полный факторный, латинский гиперкуб,
+D-оптимальный с учетом уже испытанных составов) или составы с наибольшим ожидаемым улучшением
+целевой прочности по модели поверхности отклика, уточненной гауссовским процессом.
+""")
 
-st.markdown("**Корреляционная матрица:**")
-corr_cols = ['Cement_share (%)', 'Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'W_B']
-correlation_matrix = df[corr_cols].corr()
-
-fig_corr = go.Figure(data=go.Heatmap(
-    z=correlation_matrix.values,
-    x=corr_cols,
-    y=corr_cols,
-    colorscale='RdBu',
-    zmid=0,
-    text=correlation_matrix.values.round(2),
-    texttemplate='%{text}',
-    textfont={"size": 12},
-    colorbar=dict(title="Корреляция")
-))
-
-fig_corr.update_layout(
-    title="Матрица корреляций между параметрами",
-    height=500,
-    xaxis_title="",
-    yaxis_title=""
-)
+tested_bounds = factor_bounds(df)
+with st.form("doe_form"):
+    col_doe1, col_doe2, col_doe3 = st.columns(3)
+    with col_doe1:
+        doe_kind = st.selectbox("Тип плана", options=list(DESIGNS), format_func=DESIGNS.get)
+    with col_doe2:
+        doe_n = st.number_input("Составов в плане", min_value=1, max_value=50, value=6)
+        doe_levels = st.slider("Уровней на фактор (факторный план)", min_value=2, max_value=5, value=3)
+    with col_doe3:
+        doe_target = st.selectbox("Целевой показатель плана", options=SURFACE_RESPONSES[:3])
+
+    st.markdown("**Диапазоны факторов** (по умолчанию - испытанные):")
+    doe_bounds = []
+    for column, factor, (low, high) in zip(st.columns(len(MIX_FACTORS)), MIX_FACTORS, tested_bounds):
+        with column:
+            doe_bounds.append((st.number_input(f"{factor} от", value=float(low), format="%.3f"),
+                               st.number_input(f"{factor} до", value=float(high), format="%.3f")))
+
+    run_doe = st.form_submit_button("Предложить составы")
+
+if run_doe:
+    st.session_state.doe_params = {
+        'kind': doe_kind,
+        'n': int(doe_n),
+        'levels': doe_levels,
+        'target': doe_target,
+        'bounds': tuple((min(low, high), max(low, high)) for low, high in doe_bounds),
+    }
 
-st.plotly_chart(fig_corr, use_container_width=True)
+if 'doe_params' in st.session_state:
+    with st.spinner("Составляем план испытаний..."):
+        doe_result = cached_plan(data_hash, **st.session_state.doe_params, _df=df)
+    doe_table = doe_result['table']
+    if st.session_state.doe_params['kind'] == 'active':
+        st.caption(f"Оценено составов-кандидатов: {doe_result['evaluated']:_}; лучший испытанный состав "
+                   f"по модели: {doe_result['best']:.1f}. Ожидаемое улучшение учитывает уже выбранные "
+                   "составы плана, поэтому убывает по строкам.".replace('_', ' '))
+    if doe_table.empty:
+        st.warning("Не найдено ни одного состава для плана.")
+    else:
+        tested_mixes = reduce_frame(df, ['Cement_share (%)', 'W_B'], point_budget)
+        fig_doe = go.Figure([
+            go.Scatter(x=tested_mixes['Cement_share (%)'], y=tested_mixes['W_B'], mode='markers', name="Испытанные",
+                       marker=dict(color='#95a5a6', size=6)),
+            go.Scatter(x=doe_table['Cement_share (%)'], y=doe_table['W_B'], mode='markers', name="План",
+                       marker=dict(color='#e74c3c', size=11, symbol='diamond')),
+        ])
+        fig_doe.update_layout(title="Испытанные и планируемые составы", xaxis_title="Cement_share (%)",
+                              yaxis_title="W_B", height=400)
+        st.plotly_chart(fig_doe, use_container_width=True)
+        st.dataframe(doe_table, use_container_width=True, hide_index=True)
+        st.download_button("Скачать план (CSV)", doe_table.to_csv(index=False).encode('utf-8-sig'),
+                           file_name="plan.csv", mime="text/csv")
 
 
 st.subheader("3D Визуализация")
@@ -474,141 +805,218 @@ st.markdown("""
 Интерактивная 3D диаграмма показывает зависимость прочности на сжатие от доли цемента и водовяжущего отношения.  
 *Используйте мышь для вращения графика*
 """)
-
-fig_3d = go.Figure(data=[go.Scatter3d(
-    x=df['Cement_share (%)'],
-    y=df['W_B'],
-    z=df['Rc28 (МПа)'],
-    mode='markers+text',
-    marker=dict(
-        size=df['Rt (МПа)'] * 3, 
-        color=df['Cement_share (%)'], 
-        colorscale='Viridis',
-        showscale=True,
-        colorbar=dict(title="Cement %"),
-        line=dict(width=0.5, color='white')
-    ),
-    text=[f"Опыт {i+1}" for i in range(len(df))],
-    textposition="top center",
-    hovertemplate=
-    '<b>Cement:</b> %{x}%<br>' +
-    '<b>W/B:</b> %{y:.3f}<br>' +
-    '<b>Rc28:</b> %{z:.1f} МПа<br>' +
-    '<extra></extra>'
-)])
-
-fig_3d.update_layout(
-    scene=dict(
-        xaxis=dict(title='Доля цемента (%)', backgroundcolor="rgb(230, 230,230)"),
-        yaxis=dict(title='Водовяжущее отношение (W/B)', backgroundcolor="rgb(230, 230,230)"),
-        zaxis=dict(title='Прочность Rc28 (МПа)', backgroundcolor="rgb(230, 230,230)"),
-    ),
-    height=600,
-    margin=dict(l=0, r=0, b=0, t=0)
-)
-
-st.plotly_chart(fig_3d, use_container_width=True)
+st.plotly_chart(figures['3d'], use_container_width=True)
 
 
 if show_individual:
     st.subheader("Сравнение отдельных экспериментов")
-    
-    fig4 = px.scatter(df, x='Cement_share (%)', y='Rc28 (МПа)', 
-                      color='Experiment',
-                      size='Rt (МПа)',
-                      hover_data=['Rras (МПа)', 'W_B'],
-                      title='Прочность на сжатие: Эксперимент 1 vs Эксперимент 2')
-    
-    fig4.update_layout(height=500)
     st.plotly_chart(fig4, use_container_width=True)
 
 
+@st.cache_resource
+def spc_index():
+    return spc.SpcIndex()
+
+
+def mix_label(mix):
+    cement, wb, additive, fiber = mix
+    return f"{cement:g}% цемента, W/B {wb:.3f}, добавка {additive:g}%, фибра {fiber:g}%"
+
+
+st.subheader("Контроль стабильности во времени")
+st.markdown("""
+Контрольные карты по каждому составу: подгруппа - образцы одного состава из одной серии испытаний.
+Пределы X̄-R рассчитываются по последним подгруппам без сигналов, EWMA и CUSUM замечают небольшие
+устойчивые сдвиги. Используются все серии базы испытаний, а не только выбранные выше.
+""")
+control = spc_index()
+with st.spinner("Обновляем контрольные карты..."):
+    control.update(store)
+
+col_spc1, col_spc2 = st.columns([1, 3])
+with col_spc1:
+    spc_metric = st.selectbox("Показатель", spc.METRICS, key="spc_metric")
+spc_mixes = control.mixes(spc_metric)
+if spc_mixes.empty:
+    st.info("В базе нет испытаний для контрольных карт.")
+else:
+    mix_options = list(spc_mixes[MIX_FACTORS].itertuples(index=False, name=None))
+    subgroup_counts = dict(zip(mix_options, spc_mixes['Подгрупп']))
+    with col_spc2:
+        spc_mix = st.selectbox("Состав", mix_options,
+                               format_func=lambda mix: f"{mix_label(mix)} ({subgroup_counts[mix]} подгрупп)")
+    signalling = spc_mixes[spc_mixes['Сигнал в последней подгруппе']]
+    if len(signalling):
+        st.warning("Сигнал в последней серии: " + "; ".join(
+            mix_label(mix) for mix in signalling[MIX_FACTORS].itertuples(index=False, name=None)))
+    if subgroup_counts[spc_mix] <= spc.MIN_BASELINE:
+        st.info(f"Пределы появляются после {spc.MIN_BASELINE} серий испытаний состава; "
+                f"сейчас серий: {subgroup_counts[spc_mix]}.")
+    st.plotly_chart(control_chart_figure(control.frame(spc_mix, spc_metric), spc_metric, point_budget,
+                                         cusum_limit=spc.CUSUM_H),
+                    use_container_width=True)
+    with st.expander("Сигналы контрольных карт"):
+        st.dataframe(control.alerts(), use_container_width=True, hide_index=True,
+                     column_config={'Среднее': st.column_config.NumberColumn(format="%.2f")})
+        st.markdown("**Составы:**")
+        st.dataframe(spc_mixes, use_container_width=True, hide_index=True)
+
+
 st.subheader("Исходные данные")
 
-st.markdown("**Средние значения по долям цемента:**")
-st.dataframe(df_avg, use_container_width=True, hide_index=True)
+group_keys = st.multiselect(
+    "Группировать средние значения по факторам состава",
+    options=MIX_FACTORS,
+    default=['Cement_share (%)']
+)
+
+if group_keys == ['Cement_share (%)']:
+    st.markdown("**Средние значения по долям цемента:**")
+    st.dataframe(df_avg, use_container_width=True, hide_index=True)
+elif group_keys:
+    st.markdown(f"**Средние значения по группам: {', '.join(group_keys)}**")
+    st.dataframe(group_index(df, group_keys).means(), use_container_width=True, hide_index=True)
 
 st.markdown("**Все экспериментальные данные:**")
-st.dataframe(df, use_container_width=True, hide_index=True)
+data_page = table_page(df, cached_rows(data_hash, query, df), page_size, key='data_page')
+st.dataframe(df.iloc[data_page], use_container_width=True, hide_index=True)
 
+with st.expander(f"Выбросы и согласованность повторов ({int(outliers.outliers.sum())} обр.)"):
+    if outliers.flagged.any():
+        if exclude_outliers:
+            st.caption(f"Из расчетов исключено образцов: {int(outliers.outliers.sum())}")
+        st.dataframe(outliers.summary(), use_container_width=True, hide_index=True)
+        st.markdown("**Составы с выбросами или разбросом выше предела:**")
+        st.dataframe(outliers.mix_table(), use_container_width=True, hide_index=True)
+    else:
+        st.info("Выбросов не найдено, разброс повторов в пределах нормы.")
 
-st.subheader("Выводы")
 
-min_cement = df_avg['Cement_share (%)'].min()
-min_rc28 = df_avg['Rc28 (МПа)'].min()
-min_rt = df_avg['Rt (МПа)'].min()
-min_rras = df_avg['Rras (МПа)'].min()
+st.subheader("Выводы")
 
-optimal_wb = df_avg[df_avg['Cement_share (%)'] == max_cement]['W_B'].values[0]
-optimal_pgr = df_avg[df_avg['Cement_share (%)'] == max_cement]['PGR (см)'].values[0]
+gain_notes = {param: "" for param, _ in STRENGTH_PARAMS}
+optimum_note = ""
+if show_uncertainty:
+    with st.spinner("Оцениваем неопределенность выводов..."):
+        uncertainty = cached_bootstrap(data_hash, df)
+    for param in gain_notes:
+        low, high = uncertainty.interval(('gain', param))
+        gain_notes[param] = f", 95% ДИ: {low * 100:+.1f}…{high * 100:+.1f}%"
+    frequency = uncertainty.optimum_frequencies().get(summary['max_cement'], 0.0)
+    optimum_note = f"\n\nОптимум подтверждается в {frequency:.0%} бутстреп-выборок."
 
 st.success(f"""
-### Оптимальный состав: **{int(max_cement)}% цемента**
+### Оптимальный состав: **{int(summary['max_cement'])}% цемента**{optimum_note}
 
-**Преимущества состава с {int(max_cement)}% цемента:**
--   Максимальная прочность на сжатие: **{max_rc28:.1f} МПа** (+{((max_rc28/min_rc28 - 1) * 100):.1f}% по сравнению с {int(min_cement)}%)
--   Максимальная прочность на растяжение: **{max_rt:.1f} МПа** (+{((max_rt/min_rt - 1) * 100):.1f}% по сравнению с {int(min_cement)}%)
--   Максимальная прочность на раскалывание: **{max_rras:.1f} МПа** (+{((max_rras/min_rras - 1) * 100):.1f}% по сравнению с {int(min_cement)}%)
--   Оптимальное водовяжущее отношение: **{optimal_wb:.3f}**
--   Хорошая подвижность смеси: **{optimal_pgr:.1f} см**
+**Преимущества состава с {int(summary['max_cement'])}% цемента:**
+-   Максимальная прочность на сжатие: **{summary['max_rc28']:.1f} МПа** (+{((summary['max_rc28']/summary['min_rc28'] - 1) * 100):.1f}% по сравнению с {int(summary['min_cement'])}%{gain_notes['Rc28 (МПа)']})
+-   Максимальная прочность на растяжение: **{summary['max_rt']:.1f} МПа** (+{((summary['max_rt']/summary['min_rt'] - 1) * 100):.1f}% по сравнению с {int(summary['min_cement'])}%{gain_notes['Rt (МПа)']})
+-   Максимальная прочность на раскалывание: **{summary['max_rras']:.1f} МПа** (+{((summary['max_rras']/summary['min_rras'] - 1) * 100):.1f}% по сравнению с {int(summary['min_cement'])}%{gain_notes['Rras (МПа)']})
+-   Оптимальное водовяжущее отношение: **{summary['optimal_wb']:.3f}**
+-   Хорошая подвижность смеси: **{summary['optimal_pgr']:.1f} см**
 
 """)
 
+if show_uncertainty:
+    with st.expander("Неопределенность выводов"):
+        st.caption(f"Бутстреп с повторной выборкой образцов внутри каждой доли цемента: "
+                   f"{uncertainty.n_resamples} выборок, 95% процентильные интервалы.")
+        st.dataframe(uncertainty.table(), use_container_width=True, hide_index=True,
+                     column_config={col: st.column_config.NumberColumn(format="%.4g")
+                                    for col in ['Оценка', 'Нижняя граница', 'Верхняя граница']})
+        st.markdown("**Вероятность оптимальности каждой доли цемента:**")
+        st.bar_chart(uncertainty.optimum_frequencies())
+        st.markdown("**Средние значения по долям цемента с 95% интервалами:**")
+        st.dataframe(uncertainty.means_table(), use_container_width=True, hide_index=True)
+
+        experiment_names = sorted(df['Experiment'].dropna().unique())
+        if len(experiment_names) >= 2:
+            st.markdown("**Перестановочный тест между экспериментами:**")
+            col_exp1, col_exp2 = st.columns(2)
+            with col_exp1:
+                experiment_a = st.selectbox("Эксперимент A", experiment_names, index=0, key="experiment_a")
+            with col_exp2:
+                experiment_b = st.selectbox("Эксперимент B", experiment_names, index=1, key="experiment_b")
+            if experiment_a == experiment_b:
+                st.info("Выберите два разных эксперимента.")
+            else:
+                permutation = cached_permutation_test(data_hash, (experiment_a, experiment_b), df)
+                st.dataframe(permutation, use_container_width=True, hide_index=True,
+                             column_config={'Разность средних': st.column_config.NumberColumn(format="%.3f"),
+                                            'p-значение': st.column_config.NumberColumn(format="%.4f")})
+                st.caption("Метки экспериментов перемешиваются внутри каждой доли цемента; "
+                           "p-значение ниже 0.05 указывает на значимое различие средних A − B.")
+
 st.divider()
 st.subheader("📥 Скачать отчет")
 
-def create_excel_report():
-    """Create Excel report with all data and analysis"""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Экспериментальные данные', index=False)
-
-        df_avg.to_excel(writer, sheet_name='Средние значения', index=False)
-
-        conclusions_data = {
-            'Параметр': [
-                'Оптимальная доля цемента (%)',
-                'Максимальная прочность Rc28 (МПа)',
-                'Максимальная прочность Rt (МПа)',
-                'Максимальная прочность Rras (МПа)',
-                'Водовяжущее отношение W/B',
-                'Подвижность смеси PGR (см)',
-                'Улучшение Rc28 (%)',
-                'Улучшение Rt (%)',
-                'Улучшение Rras (%)'
-            ],
-            'Значение': [
-                f"{int(max_cement)}%",
-                f"{max_rc28:.1f}",
-                f"{max_rt:.1f}",
-                f"{max_rras:.1f}",
-                f"{optimal_wb:.3f}",
-                f"{optimal_pgr:.1f}",
-                f"+{((max_rc28/min_rc28 - 1) * 100):.1f}%",
-                f"+{((max_rt/min_rt - 1) * 100):.1f}%",
-                f"+{((max_rras/min_rras - 1) * 100):.1f}%"
-            ]
-        }
-        pd.DataFrame(conclusions_data).to_excel(writer, sheet_name='Выводы', index=False)
-    
-    output.seek(0)
-    return output
-
-excel_report = create_excel_report()
-
 col_download1, col_download2, col_download3 = st.columns([1, 2, 1])
 with col_download2:
     st.download_button(
         label="📊 Скачать полный отчет (Excel)",
-        data=excel_report,
-        file_name=f"Анализ_бетона_{int(max_cement)}%_цемента.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        # The report is only built when the button is clicked, on Streamlit's
+        # download thread, and is then cached against the dataset hash.
+        data=partial(cached_excel_report, data_hash, df, df_avg, summary),
+        file_name=f"Анализ_бетона_{int(summary['max_cement'])}%_цемента.xlsx",
+        mime=EXCEL_MIME,
+        on_click="ignore",
         use_container_width=True,
         type="primary"
     )
 
 st.info("Отчет содержит 3 листа: экспериментальные данные, средние значения и выводы анализа")
 
+st.markdown("**Другие форматы:**")
+exports = get_exports()
+report_figures = {name: figures[name] for name in REPORT_FIGURES}
+# Data exports depend on the data only; the report also on the chart settings.
+export_keys = {'parquet': data_hash, 'csv': data_hash,
+               'html': (data_hash, highlight_optimum, point_budget),
+               'pdf': (data_hash, highlight_optimum, point_budget)}
+export_builders = {
+    'parquet': partial(to_parquet, df),
+    'csv': partial(to_csv, df),
+    'html': partial(build_html_report, df, df_avg, summary, report_figures),
+    'pdf': partial(build_pdf_report, df, df_avg, summary, report_figures),
+}
+
+
+def export_panel():
+    """Prepare buttons, progress and downloads of the background exports."""
+    for column, (fmt, (label, mime, extension)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+        key = export_keys[fmt]
+        job = exports.job(fmt, key)
+        if job is not None and job.running:
+            column.progress(job.fraction, text=f"{label}: {job.stage}")
+        elif exports.artifact(fmt, key) is not None:
+            column.download_button(
+                label=f"Скачать: {label}",
+                data=partial(exports.artifact, fmt, key),
+                file_name=f"Анализ_бетона.{extension}",
+                mime=mime,
+                on_click="ignore",
+                use_container_width=True,
+                key=f"download_{fmt}"
+            )
+        else:
+            if job is not None and job.error is not None:
+                column.error(f"{label}: {job.error}")
+            unavailable = fmt == 'pdf' and not pdf_available()
+            if column.button(f"Подготовить: {label}", key=f"prepare_{fmt}", use_container_width=True,
+                             disabled=unavailable,
+                             help="Нужны пакеты kaleido и weasyprint" if unavailable else None):
+                exports.submit(fmt, key, export_builders[fmt])
+                st.rerun()
+    # Polling fragments are replaced by a static one once every job is done.
+    if polling and not exports.running(export_keys.items()):
+        st.rerun()
+
+
+polling = exports.running(export_keys.items())
+st.fragment(export_panel, run_every=POLL_SECONDS if polling else None)()
+st.caption("Файлы готовятся в фоне, страницей можно пользоваться; готовые файлы доступны всем сессиям "
+           "с теми же данными.")
+
 # Footer
 st.markdown("""
 <div style='text-align: center; color: gray;'>
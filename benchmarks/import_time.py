@@ -0,0 +1,120 @@
+"""Cold-start profile of the Streamlit app.
+
+Measures, each in a fresh interpreter:
+
+* the ``-X importtime`` profile of the imports the app executes before
+  its ``st.stop()`` (read from app.py, so the benchmark follows the code),
+  with the slowest modules by cumulative import time;
+* time to first paint: a cold process running the app script once
+  headlessly up to the analyze button.
+
+    python benchmarks/import_time.py --runs 5 --json import_time.json
+"""
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / 'app.py'
+
+FIRST_PAINT = f"""
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({str(APP)!r}, default_timeout=120)
+at.run()
+assert not at.exception, at.exception
+"""
+
+
+def _is_stop_guard(node):
+    """True for the top-level ``if ...: st.stop()`` that ends the first paint."""
+    if not isinstance(node, ast.If):
+        return False
+    for child in ast.walk(node):
+        if (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)
+                and child.func.attr == 'stop'):
+            return True
+    return False
+
+
+def first_paint_imports(path=APP):
+    """Source of the top-level import statements executed before ``st.stop()``."""
+    source = path.read_text(encoding='utf-8')
+    statements = []
+    for node in ast.parse(source).body:
+        if _is_stop_guard(node):
+            break
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(ast.get_source_segment(source, node))
+    return '\n'.join(statements)
+
+
+def import_profile(code, top=15):
+    """Total and slowest modules (cumulative microseconds) of ``-X importtime``."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = line.replace(':', '|', 1).split('|')
+        # Nested imports are indented by two spaces per level after "| ".
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append({'module': name.strip(), 'self_us': int(self_us),
+                        'cumulative_us': int(cumulative_us), 'depth': depth})
+    total = sum(m['cumulative_us'] for m in modules if m['depth'] == 0)
+    slowest = sorted((m for m in modules if m['depth'] == 0),
+                     key=lambda m: m['cumulative_us'], reverse=True)[:top]
+    return total, slowest
+
+
+def wall_time(code, runs):
+    """Wall-clock seconds of running ``code`` in a fresh interpreter, per run."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=3, help="cold runs per measurement (default: 3)")
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list (default: 15)")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    imports = first_paint_imports()
+    total_us, slowest = import_profile(imports, args.top)
+    import_runs = wall_time(imports, args.runs)
+    paint_runs = wall_time(FIRST_PAINT, args.runs)
+
+    print("Imports before st.stop():")
+    print('\n'.join('  ' + line for line in imports.splitlines()))
+    print(f"\nimporttime total: {total_us / 1000:.0f} ms")
+    for module in slowest:
+        print(f"  {module['cumulative_us'] / 1000:8.1f} ms  {module['module']}")
+    print(f"\nimports, cold process: {statistics.median(import_runs):.2f} s (median of {args.runs})")
+    print(f"first paint, cold process: {statistics.median(paint_runs):.2f} s (median of {args.runs})")
+
+    if args.json:
+        results = {
+            'benchmark': 'import_time',
+            'python': sys.version.split()[0],
+            'imports': imports.splitlines(),
+            'importtime_total_ms': total_us / 1000,
+            'slowest': slowest,
+            'import_seconds': import_runs,
+            'first_paint_seconds': paint_runs,
+        }
+        Path(args.json).write_text(json.dumps(results, indent=1), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
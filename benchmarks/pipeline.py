@@ -0,0 +1,223 @@
+"""Timing of every stage of the analysis pipeline at several data scales.
+
+For each size a synthetic dataset is written to a file and then pushed
+through the same steps the app runs after an upload: ingest, validate,
+aggregate, regress, correlate, build (and serialise) the figures and
+build the Excel report.  Stages are timed with the app's ``StageTimer``;
+results go to a JSON file per commit, and ``--compare`` reports the
+stages that got slower against an earlier result file.
+
+    python benchmarks/pipeline.py --sizes 1e2,1e4,1e6
+    python benchmarks/pipeline.py --sizes 1e7 --stages ingest,aggregate,regress
+    python benchmarks/pipeline.py --compare benchmarks/results/<old commit>.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import plotly.io as pio  # noqa: E402
+
+from analysis import correlation, fit_regressions, summarize  # noqa: E402
+from figures import POINTS_3D, FigureFactory  # noqa: E402
+from groupstats import GroupStatsIndex  # noqa: E402
+from ingest import load_upload  # noqa: E402
+from perf import StageTimer  # noqa: E402
+from rendering import DEFAULT_POINT_BUDGET, reduce_frame  # noqa: E402
+from report import build_excel_report  # noqa: E402
+from synthetic import generate, write  # noqa: E402
+from validation import validate  # noqa: E402
+
+STAGES = ['ingest', 'validate', 'aggregate', 'regress', 'correlate', 'figures', 'excel']
+
+DEFAULT_SIZES = '1e2,1e4,1e6'
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# An .xlsx sheet holds 1,048,576 rows including the header.
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def commit_id():
+    """Short hash of HEAD, marked ``-dirty`` when the tree has local changes."""
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    if _git('status', '--porcelain', '--untracked-files=no'):
+        commit += '-dirty'
+    return commit
+
+
+def run_pipeline(file_name, data, stages, factory, timer):
+    """One pass through the pipeline, timing every stage listed in ``stages``."""
+    def stage(name):
+        return timer.stage(name) if name in stages else nullcontext()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with stage('ingest'):
+            # A fresh cache directory, so the file is really parsed every time.
+            df, unparsable = load_upload(file_name, data, cache_dir=cache_dir)
+    with stage('validate'):
+        validate(df, unparsable=unparsable)
+    with stage('aggregate'):
+        df_avg = GroupStatsIndex.from_frame(df, ['Cement_share (%)']).means()
+        summary = summarize(df_avg)
+    with stage('regress'):
+        regression_data = fit_regressions(df)
+    with stage('correlate'):
+        correlation_matrix = correlation(df)
+    if 'figures' in stages:
+        with stage('figures'):
+            points = reduce_frame(df, POINTS_3D, DEFAULT_POINT_BUDGET)
+            figures, _ = factory.build_all(df_avg, regression_data, correlation_matrix, points,
+                                           optimum=summary['max_cement'])
+            for figure in figures.values():
+                pio.to_json(figure, validate=False)
+    if 'excel' in stages and len(df) <= EXCEL_MAX_ROWS:
+        with stage('excel'):
+            build_excel_report(df, df_avg, summary)
+
+
+def bench_size(n, stages, file_format, repeat, track_memory, seed):
+    """Timings of every stage for ``n`` rows: a list of result records."""
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / f"synthetic_{n}.{file_format}"
+        write(generate(n, seed=seed), path)
+        data = path.read_bytes()
+
+    factory = FigureFactory()
+    if n <= 100_000:
+        # Warm-up: imports, figure templates and NumPy/BLAS initialisation.
+        run_pipeline(path.name, data, stages, factory, StageTimer(stages))
+
+    runs = {name: [] for name in stages}
+    peaks = {name: [] for name in stages}
+    for _ in range(repeat):
+        timer = StageTimer(stages, track_memory=track_memory)
+        run_pipeline(path.name, data, stages, factory, timer)
+        for record in timer.records:
+            runs[record['stage']].append(record['seconds'])
+            if record['peak_bytes'] is not None:
+                peaks[record['stage']].append(record['peak_bytes'] / 2**20)
+
+    results = []
+    for name in stages:
+        if not runs[name]:
+            continue
+        results.append({
+            'rows': n,
+            'stage': name,
+            'runs': runs[name],
+            'median': statistics.median(runs[name]),
+            'min': min(runs[name]),
+            'peak_mb': max(peaks[name]) if peaks[name] else None,
+        })
+    return results
+
+
+def default_repeat(n):
+    return max(1, min(10, 1_000_000 // n))
+
+
+def compare(current, baseline, threshold):
+    """Print per-stage ratios against ``baseline``; returns the regressed records."""
+    before = {(r['rows'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nCompared with {baseline['commit']}:")
+    for setting in ('format', 'memory'):
+        if baseline.get(setting) != current.get(setting):
+            print(f"  note: '{setting}' differs ({baseline.get(setting)} vs {current.get(setting)}), "
+                  "timings are not directly comparable")
+    print(f"{'rows':>10}  {'stage':<10} {'before':>10} {'now':>10} {'ratio':>7}")
+    for record in current['results']:
+        old = before.get((record['rows'], record['stage']))
+        if old is None:
+            continue
+        ratio = record['median'] / old['median'] if old['median'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressions.append(record)
+        elif ratio < 1 / (1 + threshold):
+            flag = '  faster'
+        print(f"{record['rows']:>10}  {record['stage']:<10} {old['median'] * 1000:>8.1f}ms "
+              f"{record['median'] * 1000:>8.1f}ms {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic data.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated row counts, e.g. 1e2,1e4,1e6,1e7 (default: {DEFAULT_SIZES})")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help="comma-separated stages to time (default: all)")
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'xlsx'],
+                        help="file format fed to the ingest stage (default: csv)")
+    parser.add_argument('--repeat', type=int, default=None,
+                        help="runs per size (default: 10 for small data, down to 1 from 10^6 rows)")
+    parser.add_argument('--memory', action='store_true',
+                        help="also record peak memory per stage (tracing slows every stage down)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+    stages = [name for name in args.stages.split(',') if name]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    if args.format == 'xlsx' and max(sizes) > EXCEL_MAX_ROWS:
+        parser.error("an .xlsx sheet holds at most 1,048,575 data rows; use csv or parquet")
+
+    current = {
+        'commit': commit_id(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'format': args.format,
+        'memory': args.memory,
+        'results': [],
+    }
+    for n in sizes:
+        repeat = args.repeat or default_repeat(n)
+        records = bench_size(n, stages, args.format, repeat, args.memory, args.seed)
+        current['results'].extend(records)
+        for record in records:
+            peak = f"  peak {record['peak_mb']:.1f} MB" if record['peak_mb'] is not None else ''
+            print(f"{n:>10} rows  {record['stage']:<10} {record['median'] * 1000:>10.1f} ms"
+                  f"  (min {record['min'] * 1000:.1f}, {len(record['runs'])} runs){peak}")
+        if 'excel' in stages and n > EXCEL_MAX_ROWS:
+            print(f"{n:>10} rows  excel      skipped: more rows than an .xlsx sheet holds")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{current['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(current, indent=1), encoding='utf-8')
+    print(f"\nResults: {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        if compare(current, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
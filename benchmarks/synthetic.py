@@ -0,0 +1,101 @@
+"""Synthetic concrete test data at any scale.
+
+Mix designs are drawn from the lab's usual grid (cement share in 10%
+steps, a handful of additive and fiber dosages) with a W/B ratio that
+falls as the cement share rises.  Rc28 follows Abrams' law in W/B and
+grows with cement share and fiber; Rt, Rras and PGR are derived from the
+same mix and share a per-batch latent term, so all four responses are
+correlated the way real specimens are.  A small fraction of rows can be
+made invalid to exercise the validation path.  Optionally every specimen
+also gets the strengths at the other curing ages, following a hyperbolic
+strength-gain curve whose rate constant rises with the cement share.
+
+Rows are generated in chunks as compact float32 columns, so 10⁷ rows fit
+in well under a gigabyte.
+"""
+import numpy as np
+import pandas as pd
+
+from ingest import AGE_COLUMNS, NUMERIC_COLUMNS
+
+CEMENT_LEVELS = np.array([40, 50, 60, 70, 80, 90], dtype=np.float32)
+ADDITIVE_LEVELS = np.array([0.05, 0.08, 0.09, 0.10, 0.12], dtype=np.float32)
+FIBER_LEVELS = np.array([0.0, 0.2, 0.4, 0.6], dtype=np.float32)
+
+# Specimens cast from one batch of mix; they share the latent batch effect.
+BATCH_SIZE = 6
+
+CHUNK_ROWS = 1_000_000
+
+
+def _curing_ages(rng, cement, rc28):
+    """Strength at every curing age, ``S(t) = Su·kt / (1 + kt)`` through Rc28."""
+    rate = 0.12 * np.exp(0.012 * (cement - 60) + rng.normal(0, 0.15, len(cement)))
+    ultimate = rc28 * (1 + 28 * rate) / (28 * rate)
+    columns = {}
+    for age, col in AGE_COLUMNS.items():
+        if age != 28:
+            gain = rate * age / (1 + rate * age)
+            columns[col] = (ultimate * gain * (1 + rng.normal(0, 0.04, len(cement)))).astype(np.float32)
+    return columns
+
+
+def _chunk(rng, n, first_batch, ages=False):
+    cement = rng.choice(CEMENT_LEVELS, n)
+    additive = rng.choice(ADDITIVE_LEVELS, n)
+    fiber = rng.choice(FIBER_LEVELS, n)
+    wb = np.clip(0.62 - 0.0042 * cement + rng.normal(0, 0.02, n), 0.22, 0.65)
+
+    # Batch effect (curing, operator, cement lot) shared by every response.
+    local_batch = np.arange(n) // BATCH_SIZE
+    batch_effect = rng.normal(0, 1, n // BATCH_SIZE + 1)[local_batch]
+
+    rc28 = (48 / 7.5 ** wb) * (0.55 + 0.45 * cement / 100) * (1 + 0.12 * fiber)
+    rc28 *= 1 + 0.04 * batch_effect + rng.normal(0, 0.035, n)
+    rt = 0.26 * rc28 ** (2 / 3) * (1 + 0.35 * fiber) * (1 + rng.normal(0, 0.06, n))
+    rras = 0.09 * rc28 * (1 + 0.25 * fiber) * (1 + rng.normal(0, 0.08, n))
+    pgr = 4.0 + 7.5 * wb + 12 * additive - 1.5 * fiber + 0.1 * batch_effect + rng.normal(0, 0.15, n)
+
+    columns = dict(zip(NUMERIC_COLUMNS, (cement, wb, additive, fiber, rc28, rt, rras, pgr)))
+    frame = pd.DataFrame({name: values.astype(np.float32) for name, values in columns.items()})
+    experiment_codes = ((first_batch + local_batch) // 50) % 20
+    frame['Experiment'] = pd.Categorical.from_codes(
+        experiment_codes, categories=[f"Опыт {k + 1}" for k in range(20)]
+    )
+    if ages:
+        for col, values in _curing_ages(rng, cement, rc28).items():
+            frame[col] = values
+    return frame
+
+
+def generate(n, seed=0, invalid_fraction=0.0, chunk_rows=CHUNK_ROWS, ages=False):
+    """``n`` synthetic specimens in the layout of an ingested upload.
+
+    With ``ages`` the strengths at 1, 3, 7, 14 and 90 days are added.
+    """
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        chunks.append(_chunk(rng, size, start // BATCH_SIZE, ages))
+    frame = pd.concat(chunks, ignore_index=True) if chunks else _chunk(rng, 0, 0, ages)
+
+    if invalid_fraction:
+        bad = rng.random(n) < invalid_fraction
+        # Negative strengths and missing W/B are the typical data-entry slips.
+        frame.loc[bad & (rng.random(n) < 0.5), 'Rc28 (МПа)'] *= -1
+        frame.loc[bad & (rng.random(n) >= 0.5), 'W_B'] = np.nan
+    return frame
+
+
+def write(frame, path):
+    """Save ``frame`` as .csv, .parquet or .xlsx, as a lab would upload it."""
+    suffix = str(path).rsplit('.', 1)[-1].lower()
+    if suffix == 'csv':
+        frame.to_csv(path, index=False)
+    elif suffix == 'parquet':
+        frame.to_parquet(path, index=False)
+    elif suffix == 'xlsx':
+        frame.to_excel(path, index=False, engine='xlsxwriter')
+    else:
+        raise ValueError(f"Unsupported file type: {path}")
@@ -0,0 +1,169 @@
+"""Headless batch analysis of lab workbooks.
+
+Runs the same analysis as the app over every workbook in a directory,
+spread over a process pool, and writes one Excel report per file plus a
+combined summary workbook.  A manifest of content hashes in the output
+directory lets nightly runs skip files that have not changed since the
+previous run.
+
+    python cli.py lab_results/ -o reports/ -j 8
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from analysis import analyze
+from ingest import MissingColumnsError, content_hash, load_upload
+from report import build_excel_report, build_summary_report
+from validation import apply_action, validate
+
+MANIFEST_NAME = 'manifest.json'
+SUMMARY_NAME = 'Сводка.xlsx'
+
+# Summary key -> column of the combined summary workbook.
+SUMMARY_COLUMNS = {
+    'max_cement': 'Оптимальная доля цемента (%)',
+    'max_rc28': 'Rc28 max (МПа)',
+    'max_rt': 'Rt max (МПа)',
+    'max_rras': 'Rras max (МПа)',
+    'optimal_wb': 'W/B',
+    'optimal_pgr': 'PGR (см)',
+}
+
+
+def load_manifest(output_dir):
+    path = Path(output_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = Path(output_dir) / MANIFEST_NAME
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding='utf-8')
+    tmp.replace(path)
+
+
+def process_file(path, output_dir, invalid_action='drop'):
+    """Analyse one workbook and write its report; runs in a worker process.
+
+    Returns a manifest entry: the content hash, report name, row counts and
+    the analysis summary, or an ``error`` message.
+    """
+    path = Path(path)
+    data = path.read_bytes()
+    entry = {'hash': content_hash(data)}
+    try:
+        df, unparsable = load_upload(path.name, data)
+        validation = validate(df, unparsable=unparsable)
+        n_invalid = int(validation.invalid.sum())
+        if n_invalid:
+            df, _ = apply_action(df, validation, invalid_action)
+        if not len(df):
+            raise ValueError("no valid rows")
+
+        result = analyze(df)
+        report_name = f"{path.stem}_отчет.xlsx"
+        report = build_excel_report(df, result['df_avg'], result['summary'])
+        (Path(output_dir) / report_name).write_bytes(report)
+    except MissingColumnsError as e:
+        entry['error'] = f"missing columns: {', '.join(e.missing)}"
+        return entry
+    except Exception as e:
+        # One unreadable workbook must not stop a nightly run.
+        entry['error'] = f"{type(e).__name__}: {e}"
+        return entry
+
+    entry.update({
+        'report': report_name,
+        'rows': len(df),
+        'invalid': n_invalid,
+        'summary': {key: float(value) for key, value in result['summary'].items()},
+    })
+    return entry
+
+
+def summary_frame(manifest):
+    """One row per successfully analysed file, in file name order."""
+    rows = []
+    for name in sorted(manifest):
+        entry = manifest[name]
+        if 'error' in entry:
+            continue
+        row = {'Файл': name, 'Образцов': entry['rows'], 'Строк с ошибками': entry['invalid']}
+        row.update({label: entry['summary'][key] for key, label in SUMMARY_COLUMNS.items()})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['Файл', 'Образцов', 'Строк с ошибками', *SUMMARY_COLUMNS.values()])
+
+
+def run(input_dir, output_dir, pattern='*.xlsx', jobs=None, force=False, invalid_action='drop'):
+    """Analyse every changed workbook in ``input_dir``; returns the manifest."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    previous = load_manifest(output_dir)
+
+    files = sorted(Path(input_dir).glob(pattern))
+    manifest, pending = {}, []
+    for path in files:
+        old = previous.get(path.name)
+        unchanged = (
+            not force and old is not None and 'error' not in old
+            and (output_dir / old['report']).exists()
+            and old['hash'] == content_hash(path.read_bytes())
+        )
+        if unchanged:
+            manifest[path.name] = old
+        else:
+            pending.append(path)
+
+    print(f"{len(files)} files, {len(files) - len(pending)} unchanged, {len(pending)} to analyse")
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(process_file, path, output_dir, invalid_action): path
+                       for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                entry = future.result()
+                manifest[path.name] = entry
+                if 'error' in entry:
+                    print(f"  {path.name}: error: {entry['error']}", file=sys.stderr)
+                else:
+                    print(f"  {path.name}: {entry['rows']} rows -> {entry['report']}")
+
+    save_manifest(output_dir, manifest)
+    (output_dir / SUMMARY_NAME).write_bytes(build_summary_report(summary_frame(manifest)))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch analysis of concrete lab workbooks.")
+    parser.add_argument('input_dir', help="directory with lab workbooks")
+    parser.add_argument('-o', '--output-dir', default='reports',
+                        help="where reports, the summary and the manifest go (default: reports)")
+    parser.add_argument('-p', '--pattern', default='*.xlsx', help="file name pattern (default: *.xlsx)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="re-analyse unchanged files too")
+    parser.add_argument('--invalid', choices=['keep', 'drop', 'coerce'], default='drop',
+                        help="what to do with rows that fail validation (default: drop)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    manifest = run(args.input_dir, args.output_dir, args.pattern, args.jobs, args.force, args.invalid)
+    errors = sum('error' in entry for entry in manifest.values())
+    print(f"Done in {time.perf_counter() - start:.1f} s, {errors} errors; "
+          f"summary: {Path(args.output_dir) / SUMMARY_NAME}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Streaming covariance and correlation of the numeric columns.
+
+``CovarianceIndex`` keeps, for every pair of columns, the count of rows
+where both are present and the sums, sums of squares and cross products
+of those rows.  NaNs are therefore handled pairwise, exactly as
+``DataFrame.corr`` does.  Rows can be added and removed (the edits of the
+data editor), so keeping the correlation matrix up to date costs
+O(changed rows · columns²) instead of a pass over the whole table, and
+indexes built on separate chunks or in separate processes merge by
+addition.
+
+The sums are taken of values shifted by a fixed per-column reference
+close to the mean, which keeps the one-pass formulas free of the
+cancellation that raw sums suffer from.  Indexes with different shifts
+are brought to a common one before merging.
+"""
+import numpy as np
+import pandas as pd
+
+from groupstats import frame_delta
+from ingest import NUMERIC_COLUMNS
+
+# Rows converted to float64 at once when an index is built from a frame.
+CHUNK_ROWS = 200_000
+
+
+class CovarianceIndex:
+    """Pairwise-complete moment sums of ``columns``.
+
+    For columns ``i`` and ``j`` over the rows where both are present:
+    ``count[i, j]`` rows, ``sum[i, j]`` of ``x_i``, ``sumsq[i, j]`` of
+    ``x_i²`` and ``cross[i, j]`` of ``x_i·x_j``, all of ``x - shift``.
+    """
+
+    def __init__(self, columns=NUMERIC_COLUMNS, shift=None):
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.shift = None if shift is None else np.asarray(shift, dtype=np.float64)
+        self._count = np.zeros((p, p))
+        self._sum = np.zeros((p, p))
+        self._sumsq = np.zeros((p, p))
+        self._cross = np.zeros((p, p))
+
+    @classmethod
+    def from_frame(cls, df, columns=NUMERIC_COLUMNS, chunk_rows=CHUNK_ROWS):
+        """Build the index in chunks of ``chunk_rows`` rows."""
+        index = cls(columns)
+        for start in range(0, len(df), chunk_rows):
+            index.add(df.iloc[start:start + chunk_rows])
+        return index
+
+    def _values(self, rows):
+        values = rows[self.columns].to_numpy(np.float64, na_value=np.nan)
+        if self.shift is None:
+            present = ~np.isnan(values)
+            # The first rows seen fix the shift; all-NaN columns are not shifted.
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shift = np.where(present, values, 0.0).sum(axis=0) / present.sum(axis=0)
+            self.shift = np.where(np.isfinite(shift), shift, 0.0)
+        return values - self.shift
+
+    def _accumulate(self, d, sign):
+        present = ~np.isnan(d)
+        mask = present.astype(np.float64)
+        d = np.where(present, d, 0.0)
+        self._count += sign * (mask.T @ mask)
+        self._sum += sign * (d.T @ mask)
+        self._sumsq += sign * ((d * d).T @ mask)
+        self._cross += sign * (d.T @ d)
+
+    def add(self, rows):
+        if len(rows):
+            self._accumulate(self._values(rows), 1.0)
+
+    def remove(self, rows):
+        if len(rows):
+            self._accumulate(self._values(rows), -1.0)
+
+    def update(self, old, new):
+        """Move the index from frame ``old`` to frame ``new`` using only changed rows."""
+        removed, added = frame_delta(old, new, self.columns)
+        self.remove(removed)
+        self.add(added)
+        return len(removed) + len(added)
+
+    def reshift(self, shift):
+        """Re-express the sums relative to ``shift``; the statistics do not change."""
+        shift = np.asarray(shift, dtype=np.float64)
+        if self.shift is None:
+            self.shift = shift
+            return self
+        delta = self.shift - shift
+        di, dj = delta[:, None], delta[None, :]
+        # Sums of x - shift = (x - old shift) + delta over the same rows.
+        self._cross += dj * self._sum + di * self._sum.T + di * dj * self._count
+        self._sumsq += 2 * di * self._sum + di * di * self._count
+        self._sum += di * self._count
+        self.shift = shift
+        return self
+
+    def merge(self, other):
+        """Add the rows accumulated by ``other`` (e.g. another chunk or process)."""
+        if other.columns != self.columns:
+            raise ValueError("cannot merge covariance indexes of different columns")
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift.copy()
+        if not np.array_equal(other.shift, self.shift):
+            other = CovarianceIndex(other.columns, other.shift)._copy_from(other).reshift(self.shift)
+        self._count += other._count
+        self._sum += other._sum
+        self._sumsq += other._sumsq
+        self._cross += other._cross
+        return self
+
+    def _copy_from(self, other):
+        self._count = other._count.copy()
+        self._sum = other._sum.copy()
+        self._sumsq = other._sumsq.copy()
+        self._cross = other._cross.copy()
+        return self
+
+    @property
+    def counts(self):
+        """Number of rows where both columns are present, as a frame."""
+        return pd.DataFrame(np.rint(self._count).astype(int), index=self.columns, columns=self.columns)
+
+    def _centered(self):
+        n = np.rint(self._count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cross = self._cross - self._sum * self._sum.T / n
+            sq = self._sumsq - self._sum * self._sum / n
+        # Rows added and removed again leave rounding residue in the sums; a
+        # variance at that level (or a negative one) is a constant column.
+        shift = np.zeros(len(self.columns)) if self.shift is None else self.shift
+        residue = 1e-13 * (np.abs(self._sumsq) + n * shift[:, None] ** 2)
+        sq = np.where(sq <= residue, 0.0, sq)
+        return n, cross, sq
+
+    def covariance(self, min_periods=2):
+        """Pairwise-complete sample covariance, like ``DataFrame.cov``."""
+        n, cross, _ = self._centered()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = np.where(n >= max(min_periods, 2), cross / (n - 1), np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self, min_periods=1):
+        """Pairwise-complete Pearson correlation, like ``DataFrame.corr``."""
+        n, cross, sq = self._centered()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.clip(cross / np.sqrt(sq * sq.T), -1.0, 1.0)
+        corr[(n < max(min_periods, 1)) | (sq == 0) | (sq.T == 0)] = np.nan
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
@@ -0,0 +1,344 @@
+"""Design of experiments: which mixes to test next.
+
+Classical designs over the mix factors (cement share, W/B, additive and
+fiber) within given bounds:
+
+* full factorial, every combination of ``levels`` values per factor;
+* Latin hypercube, ``n`` mixes that cover every factor's range evenly;
+* D-optimal, ``n`` mixes picked from a factorial candidate grid by
+  Fedorov exchange so that the quadratic response surface is estimated
+  as precisely as possible, counting the mixes already tested.
+
+``propose_mixes`` runs one round of the sequential loop with the lab.
+The optimiser's quadratic response surface is fitted to the data, a
+Gaussian process models what the surface misses, and a large pool of
+candidate mixes is scored by the expected improvement of the target
+strength.  The batch is chosen greedily: after every pick the process is
+conditioned on that mix as if it had been tested at its predicted value
+("kriging believer"), which shrinks the uncertainty around it, so the
+batch spreads out instead of piling onto one optimum.  Testing the batch
+and uploading the results starts the next round.
+"""
+import numpy as np
+import pandas as pd
+
+from groupstats import MIX_FACTORS
+from optimizer import SURFACE_RESPONSES, candidate_grid, factor_bounds, fit_surfaces
+from regression import design_matrix
+from rendering import density_sample
+
+DESIGNS = {
+    'active': "Следующие составы (ожидаемое улучшение)",
+    'd_optimal': "D-оптимальный план",
+    'lhs': "Латинский гиперкуб",
+    'factorial': "Полный факторный план",
+}
+
+# Decimals a planned mix is rounded to, as it is weighed out in the lab.
+DECIMALS = {'Cement_share (%)': 0, 'W_B': 3, 'Additive (%)': 2, 'Fiber (%)': 2}
+
+# Candidate mixes scored per round, and how many of the best of them the
+# batch is then picked from.
+CANDIDATES = 20_000
+POOL = 2_000
+
+# Share of the candidates drawn around the best tested mixes rather than
+# over the whole space, and their spread as a fraction of every range.
+LOCAL_FRACTION = 0.5
+LOCAL_CENTERS = 10
+LOCAL_SPREAD = 0.05
+
+# Tested mixes the Gaussian process is fitted to; denser regions are thinned.
+MAX_GP_MIXES = 400
+
+# Hyperparameter grid: length scales on the unit cube and the signal
+# variance relative to the variance of the residuals.
+LENGTH_SCALES = np.geomspace(0.05, 2.0, 10)
+VARIANCE_RATIOS = np.geomspace(0.01, 10.0, 7)
+
+D_OPTIMAL_LEVELS = 5
+FEDOROV_ITERATIONS = 200
+
+# Keeps the information matrix invertible while a design has fewer mixes
+# than the model has terms.
+RIDGE = 1e-6
+
+# Candidates evaluated against the Gaussian process at once.
+CHUNK_ROWS = 20_000
+
+
+def _scale(X, bounds):
+    """Map mixes onto the unit cube; factors with an empty range map to 0."""
+    span = bounds[:, 1] - bounds[:, 0]
+    return np.where(span > 0, (X - bounds[:, 0]) / np.where(span > 0, span, 1.0), 0.0)
+
+
+def round_mixes(X):
+    """Round mixes to the precision they are weighed out with (``DECIMALS``)."""
+    return np.column_stack([np.round(X[:, j], DECIMALS[factor]) for j, factor in enumerate(MIX_FACTORS)])
+
+
+def _unique_rows(X):
+    """Rows of ``X`` without repeats, in their original order."""
+    return X[np.sort(np.unique(X, axis=0, return_index=True)[1])]
+
+
+def factorial_design(bounds, levels=3):
+    """Every combination of ``levels`` evenly spaced values of the varying factors."""
+    return candidate_grid(np.asarray(bounds, dtype=np.float64), levels)
+
+
+def latin_hypercube(bounds, n, seed=None):
+    """``n`` mixes whose values of every factor fall into ``n`` different strata."""
+    from scipy.stats import qmc
+
+    bounds = np.asarray(bounds, dtype=np.float64)
+    varying = bounds[:, 1] > bounds[:, 0]
+    U = np.zeros((n, len(bounds)))
+    if varying.any():
+        U[:, varying] = qmc.LatinHypercube(d=int(varying.sum()), seed=seed).random(n)
+    return bounds[:, 0] + U * (bounds[:, 1] - bounds[:, 0])
+
+
+def _model_rows(X, bounds, degree, interactions):
+    """Design rows of the response surface over the varying factors scaled to [-1, 1]."""
+    varying = bounds[:, 1] > bounds[:, 0]
+    Z = 2 * _scale(X, bounds)[:, varying] - 1
+    factors = [factor for factor, v in zip(MIX_FACTORS, varying) if v]
+    return design_matrix(Z, factors, degree, interactions)[0]
+
+
+def d_optimal_design(bounds, n, degree=2, interactions=True, levels=D_OPTIMAL_LEVELS, existing=None,
+                     seed=None, iterations=FEDOROV_ITERATIONS):
+    """``n`` mixes of the ``levels`` grid maximising ``det(FᵀF)`` of the response surface.
+
+    ``existing`` mixes (already tested) count towards the information
+    matrix, so the design fills the gaps they leave.  Every exchange
+    scores all (design point, candidate) swaps at once.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    candidates = candidate_grid(bounds, levels)
+    F = _model_rows(candidates, bounds, degree, interactions)
+    M = RIDGE * np.eye(F.shape[1])
+    if existing is not None and len(existing):
+        E = _model_rows(np.asarray(existing, dtype=np.float64), bounds, degree, interactions)
+        M += E.T @ E
+
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(candidates), size=n, replace=n > len(candidates))
+    M += F[chosen].T @ F[chosen]
+    for _ in range(iterations):
+        G = F @ np.linalg.inv(M)
+        d = np.einsum('ij,ij->i', G, F)
+        cross = G[chosen] @ F.T
+        d_out = d[chosen][:, None]
+        # Fedorov: swapping design point i for candidate j multiplies
+        # det(M) by 1 + delta[i, j].
+        delta = d[None, :] - d_out * d[None, :] + cross ** 2 - d_out
+        i, j = np.unravel_index(np.argmax(delta), delta.shape)
+        if delta[i, j] <= 1e-9:
+            break
+        M += np.outer(F[j], F[j]) - np.outer(F[chosen[i]], F[chosen[i]])
+        chosen[i] = j
+    return candidates[chosen]
+
+
+class GaussianProcess:
+    """Zero-mean Gaussian process with a squared-exponential kernel.
+
+    ``noise`` is the variance of every training value: the mean of a mix
+    tested on few specimens is noisier than that of a well-replicated one.
+    """
+
+    def __init__(self, X, y, noise, length, variance, correlation=None):
+        from scipy import linalg
+
+        self.X = X
+        self.length = length
+        self.variance = variance
+        R = self._correlation(X, X) if correlation is None else correlation
+        K = variance * R
+        K[np.diag_indices_from(K)] += noise
+        self.chol = linalg.cholesky(K, lower=True)
+        self.alpha = linalg.cho_solve((self.chol, True), y)
+        self.log_likelihood = (-0.5 * y @ self.alpha - np.log(np.diag(self.chol)).sum()
+                               - 0.5 * len(y) * np.log(2 * np.pi))
+
+    def _correlation(self, A, B):
+        sq = (A * A).sum(axis=1)[:, None] + (B * B).sum(axis=1)[None, :] - 2 * A @ B.T
+        return np.exp(-0.5 * np.maximum(sq, 0.0) / self.length ** 2)
+
+    def kernel(self, A, B):
+        return self.variance * self._correlation(A, B)
+
+    def cross(self, X):
+        """``L⁻¹ k(train, X)``: the posterior covariance at ``X`` is ``k(X, X) - crossᵀ cross``."""
+        from scipy import linalg
+
+        return linalg.solve_triangular(self.chol, self.kernel(self.X, X), lower=True)
+
+    def predict(self, X):
+        """Posterior mean and variance at the rows of ``X``."""
+        from scipy import linalg
+
+        mean, var = np.empty(len(X)), np.empty(len(X))
+        for start in range(0, len(X), CHUNK_ROWS):
+            block = slice(start, start + CHUNK_ROWS)
+            k = self.kernel(self.X, X[block])
+            mean[block] = k.T @ self.alpha
+            V = linalg.solve_triangular(self.chol, k, lower=True)
+            var[block] = np.maximum(self.variance - np.einsum('ij,ij->j', V, V), 0.0)
+        return mean, var
+
+
+def fit_gp(X, y, noise):
+    """Gaussian process with the kernel hyperparameters of highest marginal likelihood."""
+    scale = y.var() if y.var() > 0 else max(float(np.mean(noise)), 1e-12)
+    best = None
+    for length in LENGTH_SCALES:
+        R = None
+        for ratio in VARIANCE_RATIOS:
+            gp = GaussianProcess(X, y, noise, length, ratio * scale, R)
+            R = gp._correlation(X, X) if R is None else R
+            if best is None or gp.log_likelihood > best.log_likelihood:
+                best = gp
+    return best
+
+
+def expected_improvement(mean, std, best, xi=0.0):
+    """Expected amount by which a normal ``(mean, std)`` outcome exceeds ``best``."""
+    from scipy.stats import norm
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gain = mean - best - xi
+        z = gain / std
+        ei = gain * norm.cdf(z) + std * norm.pdf(z)
+    return np.where(std > 0, ei, np.maximum(gain, 0.0))
+
+
+def _mix_means(df, target):
+    """Tested mixes with the mean, count and variance of ``target`` per mix."""
+    stats = (df.groupby(MIX_FACTORS, observed=True, dropna=True)[target]
+             .agg(['mean', 'count', 'var'])
+             .dropna(subset=['mean']))
+    X = stats.index.to_frame(index=False).to_numpy(np.float64)
+    return X, stats['mean'].to_numpy(), stats['count'].to_numpy(np.float64), stats['var'].to_numpy()
+
+
+def _table(X, predicted):
+    return pd.DataFrame(np.column_stack([X, predicted]),
+                        columns=MIX_FACTORS + [f"{r} прогноз" for r in SURFACE_RESPONSES])
+
+
+def propose_mixes(df, n=6, target='Rc28 (МПа)', bounds=None, constraints=None,
+                  n_candidates=CANDIDATES, pool=POOL, seed=0):
+    """Propose the next ``n`` mixes to test, by expected improvement of ``target``.
+
+    Candidates are a Latin hypercube over ``bounds`` (the tested ranges by
+    default), rounded to lab precision and, with ``constraints``
+    (``optimizer.Constraints``), limited to the feasible ones.  Returns a
+    dict with the proposed mixes as a ``table`` (predicted responses, the
+    uncertainty of the target and the expected improvement when picked),
+    the ``best`` predicted mean of a tested mix, and the numbers of
+    ``evaluated`` and ``feasible`` candidates.
+    """
+    bounds = factor_bounds(df) if bounds is None else np.asarray(bounds, dtype=np.float64)
+    surfaces = fit_surfaces(df)
+    k = SURFACE_RESPONSES.index(target)
+
+    X, mean, count, var = _mix_means(df, target)
+    residual = mean - surfaces.predict(X)[:, k]
+    replicated = count > 1
+    if replicated.any():
+        within = ((count - 1) * var)[replicated].sum() / (count - 1)[replicated].sum()
+    else:
+        within = surfaces.sigma[k] ** 2
+    if not np.isfinite(within) or within <= 0:
+        within = max(float(residual.var()), 1e-6)
+    noise = within / count
+    keep, _ = density_sample(_scale(X, bounds), MAX_GP_MIXES)
+    gp = fit_gp(_scale(X[keep], bounds), residual[keep], noise[keep])
+    fitted = surfaces.predict(X)[:, k] + gp.predict(_scale(X, bounds))[0]
+    best = fitted.max()
+
+    # Half the candidates cover the whole space, half refine around the
+    # best tested mixes, where the improvements usually are.
+    rng = np.random.default_rng(seed)
+    n_local = int(n_candidates * LOCAL_FRACTION)
+    centers = X[np.argsort(fitted)[::-1][:LOCAL_CENTERS]]
+    local = (centers[rng.integers(len(centers), size=n_local)]
+             + rng.normal(scale=LOCAL_SPREAD, size=(n_local, len(bounds))) * (bounds[:, 1] - bounds[:, 0]))
+    candidates = np.concatenate([latin_hypercube(bounds, n_candidates - n_local, seed),
+                                 np.clip(local, bounds[:, 0], bounds[:, 1])])
+    candidates = _unique_rows(round_mixes(candidates))
+    evaluated = len(candidates)
+    predicted = surfaces.predict(candidates)
+    gp_mean, gp_var = gp.predict(_scale(candidates, bounds))
+    predicted[:, k] += gp_mean
+    if constraints is not None:
+        ok = constraints.feasible(candidates, predicted)
+        candidates, predicted, gp_var = candidates[ok], predicted[ok], gp_var[ok]
+
+    columns = MIX_FACTORS + [f"{r} прогноз" for r in SURFACE_RESPONSES] + ['σ прогноза', 'Ожидаемое улучшение']
+    result = {'best': best, 'evaluated': evaluated, 'feasible': len(candidates), 'mixes': len(X)}
+    if not len(candidates):
+        result['table'] = pd.DataFrame(columns=columns)
+        return result
+
+    ei = expected_improvement(predicted[:, k], np.sqrt(gp_var), best)
+    top = np.argsort(ei)[::-1][:pool]
+    P = _scale(candidates[top], bounds)
+    target_mean = predicted[top, k]
+    V = gp.cross(P)
+    var = gp_var[top].copy()
+    # A new mix would be tested on about as many specimens as a typical one.
+    pick_noise = within / np.median(count)
+    conditioned = []
+    picks, picked_std, picked_ei = [], [], []
+    for _ in range(min(n, len(top))):
+        std = np.sqrt(var)
+        score = expected_improvement(target_mean, std, best)
+        score[picks] = -np.inf
+        p = int(np.argmax(score))
+        picks.append(p)
+        picked_std.append(std[p])
+        picked_ei.append(score[p])
+        # Condition on the pick: the covariance of every pool mix with it,
+        # given the data and the earlier picks.
+        cov = gp.kernel(P, P[p:p + 1])[:, 0] - V.T @ V[:, p]
+        for u in conditioned:
+            cov -= u * u[p]
+        u = cov / np.sqrt(var[p] + pick_noise)
+        var = np.maximum(var - u * u, 0.0)
+        conditioned.append(u)
+        # The believed outcome raises the bar for the rest of the batch.
+        best = max(best, target_mean[p])
+
+    chosen = top[picks]
+    table = _table(candidates[chosen], predicted[chosen])
+    table['σ прогноза'] = picked_std
+    table['Ожидаемое улучшение'] = picked_ei
+    result['table'] = table
+    return result
+
+
+def plan(df, kind, n=6, levels=3, target='Rc28 (МПа)', bounds=None, constraints=None, seed=0):
+    """Mixes of a design of kind ``kind`` (see ``DESIGNS``) with their predicted responses.
+
+    Returns a dict like ``propose_mixes``; the factorial design has
+    ``levels`` values per factor whatever ``n`` is.
+    """
+    if kind not in DESIGNS:
+        raise ValueError(f"Unknown design: {kind}")
+    bounds = factor_bounds(df) if bounds is None else np.asarray(bounds, dtype=np.float64)
+    if kind == 'active':
+        return propose_mixes(df, n, target, bounds, constraints, seed=seed)
+    if kind == 'factorial':
+        X = factorial_design(bounds, levels)
+    elif kind == 'lhs':
+        X = latin_hypercube(bounds, n, seed)
+    else:
+        tested = df[MIX_FACTORS].dropna().drop_duplicates().to_numpy(np.float64)
+        X = d_optimal_design(bounds, n, existing=tested, seed=seed)
+    X = _unique_rows(round_mixes(X)) if kind == 'factorial' else round_mixes(X)
+    return {'table': _table(X, fit_surfaces(df).predict(X)), 'evaluated': len(X), 'feasible': len(X)}
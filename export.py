@@ -0,0 +1,272 @@
+"""Typed data exports and the HTML/PDF analysis report, built in the background.
+
+The specimen data is exported as Parquet (compact dtypes and categories
+kept) and as CSV in the lab's own dialect (``;`` and decimal commas, so
+that the file can be uploaded again).  The report is one self-contained
+HTML file: conclusions and means as typed tables plus the strength,
+regression, correlation and 3D figures.  With ``kaleido`` installed the
+figures are embedded as static SVG renders; otherwise they stay
+interactive, with plotly.js inlined once.  The PDF is the same document
+printed by ``weasyprint`` and needs both optional packages.
+
+Artifacts can take seconds for large datasets, so ``ExportQueue`` builds
+them on a small thread pool while the app keeps answering; each job
+reports its progress, and finished artifacts go into the shared cache
+under the key the caller chose (normally the dataset hash), where every
+session finds them.  A job is forgotten once its artifact is cached; a
+failed job is reported once and then forgotten, so that the export can be
+prepared again.
+"""
+import base64
+import datetime
+import html
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from io import BytesIO
+
+import plotly.io as pio
+
+from figures import FIGURE_NAMES
+from report import conclusions_table
+from shared_cache import get_cache
+
+# Format -> (label, MIME type, file extension).
+EXPORT_FORMATS = {
+    'parquet': ("Данные (Parquet)", "application/vnd.apache.parquet", 'parquet'),
+    'csv': ("Данные (CSV)", "text/csv", 'csv'),
+    'html': ("Отчет (HTML)", "text/html", 'html'),
+    'pdf': ("Отчет (PDF)", "application/pdf", 'pdf'),
+}
+
+REPORT_FIGURES = ('strength', 'regression', 'correlation', '3d')
+
+IMAGE_WIDTH = 1000
+IMAGE_HEIGHT = 560
+
+CSV_CHUNK_ROWS = 100_000
+
+EXPORT_WORKERS = 2
+
+# Finished jobs kept for their error or for an artifact too large for the
+# shared cache; the oldest are forgotten first.
+MAX_FINISHED_JOBS = 16
+
+# Interval at which the app refreshes the progress of running jobs.
+POLL_SECONDS = 1.0
+
+# Columns of the app's frame that only number the rows on screen.
+DISPLAY_COLUMNS = ['№']
+
+REPORT_STYLE = """
+body { font-family: "DejaVu Sans", Arial, sans-serif; margin: 2em auto; max-width: 1050px; color: #222; }
+h1 { font-size: 1.6em; } h2 { font-size: 1.25em; margin-top: 1.6em; }
+table { border-collapse: collapse; margin: 0.5em 0; font-size: 0.9em; }
+th, td { border: 1px solid #bbb; padding: 0.25em 0.6em; }
+th { background: #eef2f7; } td { text-align: right; }
+.figure { page-break-inside: avoid; margin: 1em 0; } .figure img { width: 100%; }
+.note { color: #666; font-size: 0.85em; }
+@page { size: A4; margin: 15mm; }
+"""
+
+
+def static_images_available():
+    return find_spec('kaleido') is not None
+
+
+def pdf_available():
+    return static_images_available() and find_spec('weasyprint') is not None
+
+
+def _report(progress, fraction, stage):
+    if progress is not None:
+        progress(fraction, stage)
+
+
+def data_frame(df):
+    """The specimen data without the display-only columns of the app."""
+    return df.drop(columns=[col for col in DISPLAY_COLUMNS if col in df])
+
+
+def to_parquet(df, progress=None):
+    _report(progress, 0.0, "запись Parquet")
+    output = BytesIO()
+    data_frame(df).to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def to_csv(df, progress=None):
+    """CSV in the dialect of the lab's files, written in chunks to report progress."""
+    frame = data_frame(df)
+    output = BytesIO()
+    n_rows = max(len(frame), 1)
+    for start in range(0, n_rows, CSV_CHUNK_ROWS):
+        _report(progress, start / n_rows, f"строки {start + 1}–{min(start + CSV_CHUNK_ROWS, len(frame))}")
+        frame.iloc[start:start + CSV_CHUNK_ROWS].to_csv(
+            output, sep=';', decimal=',', index=False, header=start == 0,
+            encoding='utf-8-sig' if start == 0 else 'utf-8'
+        )
+    return output.getvalue()
+
+
+def _figure_html(figure, static, first):
+    if static:
+        svg = pio.to_image(figure, format='svg', width=IMAGE_WIDTH, height=IMAGE_HEIGHT)
+        return f'<img src="data:image/svg+xml;base64,{base64.b64encode(svg).decode()}">'
+    return pio.to_html(figure, full_html=False, include_plotlyjs=first, validate=False)
+
+
+def _table_html(frame, formatters=None):
+    return frame.to_html(index=False, border=0, na_rep='—', float_format='{:.2f}'.format,
+                         formatters=formatters)
+
+
+def build_html_report(df, df_avg, summary, figures, static=None, progress=None):
+    """Self-contained HTML report, returned as bytes.
+
+    ``figures`` maps names of ``REPORT_FIGURES`` to plotly figures; they
+    are rendered to SVG when ``static`` (by default whenever kaleido is
+    installed).
+    """
+    static = static_images_available() if static is None else static
+    conclusions = conclusions_table(summary)
+    conclusions['Значение'] = [f"{value:g}" for value in conclusions['Значение']]
+    parts = [
+        "<h1>Анализ мелкозернистого бетона</h1>",
+        f'<p class="note">Отчет от {datetime.date.today():%d.%m.%Y}, образцов: {len(df)}. '
+        f"Исходные данные - в экспорте Parquet или CSV.</p>",
+        f"<h2>Выводы: оптимальная доля цемента {int(summary['max_cement'])}%</h2>",
+        _table_html(conclusions),
+        "<h2>Средние значения по долям цемента</h2>",
+        _table_html(df_avg, {'W_B': '{:.3f}'.format}),
+    ]
+    names = [name for name in REPORT_FIGURES if name in figures]
+    for position, name in enumerate(names):
+        _report(progress, position / (len(names) + 1), f"график «{FIGURE_NAMES.get(name, name)}»")
+        parts.append(f'<div class="figure"><h2>{html.escape(FIGURE_NAMES.get(name, name))}</h2>'
+                     f'{_figure_html(figures[name], static, position == 0)}</div>')
+
+    _report(progress, len(names) / (len(names) + 1), "сборка документа")
+    document = (f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">'
+                f'<title>Анализ мелкозернистого бетона</title><style>{REPORT_STYLE}</style></head>'
+                f'<body>{"".join(parts)}</body></html>')
+    return document.encode('utf-8')
+
+
+def build_pdf_report(df, df_avg, summary, figures, progress=None):
+    """The HTML report with static figures, printed to PDF by weasyprint."""
+    from weasyprint import HTML
+
+    document = build_html_report(df, df_avg, summary, figures, static=True,
+                                 progress=lambda fraction, stage: _report(progress, fraction * 0.7, stage))
+    _report(progress, 0.7, "печать PDF")
+    return HTML(string=document.decode('utf-8')).write_pdf()
+
+
+class ExportJob:
+    """One artifact being built; its progress is updated from the worker thread."""
+
+    def __init__(self):
+        self.fraction = 0.0
+        self.stage = "в очереди"
+        self.future = None
+
+    def update(self, fraction, stage):
+        self.fraction = min(max(fraction, 0.0), 1.0)
+        self.stage = stage
+
+    @property
+    def running(self):
+        return not self.future.done()
+
+    @property
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+
+class ExportQueue:
+    """Builds export artifacts on a thread pool and keeps the finished ones in the shared cache."""
+
+    def __init__(self, cache, max_workers=EXPORT_WORKERS):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _namespace(fmt):
+        return f"{__name__}.{fmt}"
+
+    def submit(self, fmt, key, build):
+        """Start building ``build(progress)`` unless it is cached or already running."""
+        with self._lock:
+            job = self._jobs.get((fmt, key))
+            if job is not None and job.running:
+                return job
+            self._jobs.pop((fmt, key), None)
+            job = self._jobs[(fmt, key)] = ExportJob()
+            job.future = self._executor.submit(self._build, fmt, key, job, build)
+            return job
+
+    def _build(self, fmt, key, job, build):
+        """Run on a worker thread: build and cache the artifact, then retire the job."""
+        failed = True
+        try:
+            value = self.cache.get_or_compute(self._namespace(fmt), key, lambda: build(progress=job.update))
+            failed = False
+            return value
+        finally:
+            self._finished(fmt, key, job, failed)
+
+    def _finished(self, fmt, key, job, failed):
+        """Forget a job whose artifact is cached; keep a bounded number of the others."""
+        with self._lock:
+            if self._jobs.get((fmt, key)) is not job:
+                return
+            if not failed and self.cache.contains(self._namespace(fmt), key):
+                del self._jobs[(fmt, key)]
+                return
+            self._jobs.move_to_end((fmt, key))
+            finished = [pair for pair, other in self._jobs.items() if other is job or not other.running]
+            for pair in finished[:-MAX_FINISHED_JOBS]:
+                del self._jobs[pair]
+
+    def job(self, fmt, key):
+        """The job of ``(fmt, key)``, if any; a failed job is returned once and then forgotten."""
+        with self._lock:
+            job = self._jobs.get((fmt, key))
+            if job is not None and job.error is not None:
+                del self._jobs[(fmt, key)]
+            return job
+
+    def artifact(self, fmt, key):
+        """The finished artifact, or None while it is missing or being built."""
+        value = self.cache.get(self._namespace(fmt), key)
+        if value is not None:
+            return value
+        # Artifacts larger than the whole cache are only held by their job.
+        with self._lock:
+            job = self._jobs.get((fmt, key))
+        if job is not None and not job.running and job.error is None:
+            return job.future.result()
+        return None
+
+    def running(self, keys):
+        """Whether any of the ``(format, key)`` pairs is still being built."""
+        with self._lock:
+            jobs = [self._jobs.get(pair) for pair in keys]
+        return any(job is not None and job.running for job in jobs)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_exports():
+    """The export queue of this server process."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ExportQueue(get_cache())
+        return _queue
@@ -0,0 +1,460 @@
+"""Figure factory for the analysis charts.
+
+Creating a Plotly figure validates every property, and figures cached with
+``st.cache_data`` are validated again each time they are unpickled.  The
+chart layouts here depend only on the shape of the data (which response
+goes into which subplot), not on its values, so ``FigureFactory`` builds
+each layout once as a validated template and keeps it as a plain dict.
+On later reruns it copies only the parts of the template that change,
+swaps in the new trace arrays as NumPy arrays and the highlight colours,
+and wraps the result in a figure without validating it again.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from rendering import TEXT_LIMIT, WEBGL_THRESHOLD, lttb, reduce_frame
+
+BASE_COLOR = '#3498db'
+HIGHLIGHT_COLOR = '#e74c3c'
+
+STRENGTH_PANELS = [('Rc28 (МПа)', 'Rc28', 1, 1, "МПа"),
+                   ('Rt (МПа)', 'Rt', 1, 2, "МПа"),
+                   ('Rras (МПа)', 'Rras', 2, 1, "МПа"),
+                   ('PGR (см)', 'PGR', 2, 2, "см")]
+
+COMPARISON_LINES = [('Rc28 (МПа)', 'Rc28 (сжатие)'),
+                    ('Rt (МПа)', 'Rt (растяжение)'),
+                    ('Rras (МПа)', 'Rras (раскалывание)')]
+
+REGRESSION_COLORS = ['#3498db', '#e74c3c', '#2ecc71']
+
+POINTS_3D = ['Cement_share (%)', 'W_B', 'Rc28 (МПа)']
+
+# Mixes drawn on the strength-gain chart, those with the most specimens first.
+MATURITY_CURVES = 8
+
+FIGURE_NAMES = {
+    'strength': "Показатели по доле цемента",
+    'comparison': "Сравнение прочностей",
+    'wb': "Водовяжущее отношение",
+    'regression': "Регрессия",
+    'correlation': "Корреляции",
+    '3d': "3D-диаграмма",
+}
+
+
+def _merged(base, update):
+    """Copy of ``base`` with ``update`` applied; only touched nested dicts are copied."""
+    out = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = _merged(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+
+def _values(series):
+    return series.to_numpy(np.float64, na_value=np.nan)
+
+
+def _vline(fig):
+    # Placeholder position and text; the factory fills both in on every render.
+    fig.add_vline(x=0, line_dash="dash", line_color="red",
+                  annotation_text="", annotation_position="top")
+
+
+def _strength_template(_key):
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=(
+            'Прочность на сжатие после 28 суток (Rc28)',
+            'Прочность на растяжение (Rt)',
+            'Прочность на раскалывание (Rras)',
+            'Подвижность смеси (PGR)'
+        ),
+        vertical_spacing=0.18,
+        horizontal_spacing=0.15
+    )
+    for _, name, row, col, unit in STRENGTH_PANELS:
+        fig.add_trace(
+            go.Bar(name=name, marker_color=BASE_COLOR, textposition='outside', showlegend=False),
+            row=row, col=col
+        )
+        fig.update_yaxes(title_text=unit, row=row, col=col)
+    fig.update_xaxes(title_text="Доля цемента (%)")
+    fig.update_layout(height=700, showlegend=False)
+    return fig
+
+
+def _comparison_template(highlight):
+    fig = go.Figure()
+    for _, name in COMPARISON_LINES:
+        fig.add_trace(go.Scatter(mode='lines+markers', name=name,
+                                 line=dict(width=3), marker=dict(size=12)))
+    fig.update_layout(
+        xaxis_title="Доля цемента (%)",
+        yaxis_title="Прочность (МПа)",
+        height=500,
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    if highlight:
+        _vline(fig)
+    return fig
+
+
+def _wb_template(highlight):
+    fig = go.Figure(go.Scatter(
+        mode='lines+markers',
+        name='W/B',
+        line=dict(width=3, color='#9b59b6'),
+        marker=dict(size=12),
+        fill='tozeroy'
+    ))
+    fig.update_layout(
+        xaxis_title="Доля цемента (%)",
+        yaxis_title="Водовяжущее отношение (W/B)",
+        height=400,
+        showlegend=False
+    )
+    if highlight:
+        _vline(fig)
+    return fig
+
+
+def _regression_template(names):
+    fig = make_subplots(rows=1, cols=len(names), subplot_titles=list(names),
+                        horizontal_spacing=0.12)
+    for idx, name in enumerate(names, 1):
+        color = REGRESSION_COLORS[(idx - 1) % len(REGRESSION_COLORS)]
+        fig.add_trace(go.Scatter(mode='markers', name=name,
+                                 marker=dict(size=12, color=color), showlegend=False),
+                      row=1, col=idx)
+        fig.add_trace(go.Scatter(fill='toself', fillcolor=color, opacity=0.15,
+                                 line=dict(width=0), name="95% интервал прогноза",
+                                 hoverinfo='skip', showlegend=False),
+                      row=1, col=idx)
+        fig.add_trace(go.Scatter(mode='lines', name="Тренд",
+                                 line=dict(color=color, width=2, dash='dash'), showlegend=False),
+                      row=1, col=idx)
+        suffix = '' if idx == 1 else str(idx)
+        fig.add_annotation(x=0.5, y=0.95, xref=f'x{suffix} domain', yref=f'y{suffix} domain',
+                           text="", showarrow=False, font=dict(size=10),
+                           bgcolor="rgba(255, 255, 255, 0.8)", bordercolor=color, borderwidth=1)
+    fig.update_xaxes(title_text="Доля цемента (%)")
+    fig.update_yaxes(title_text="МПа")
+    fig.update_layout(height=400, showlegend=False)
+    return fig
+
+
+def _correlation_template(columns):
+    fig = go.Figure(go.Heatmap(
+        x=list(columns),
+        y=list(columns),
+        colorscale='RdBu',
+        zmid=0,
+        texttemplate='%{text}',
+        textfont={"size": 12},
+        colorbar=dict(title="Корреляция")
+    ))
+    fig.update_layout(
+        title="Матрица корреляций между параметрами",
+        height=500,
+        xaxis_title="",
+        yaxis_title=""
+    )
+    return fig
+
+
+def _scatter_3d_template(show_text):
+    fig = go.Figure(go.Scatter3d(
+        mode='markers+text' if show_text else 'markers',
+        marker=dict(
+            colorscale='Viridis',
+            showscale=True,
+            colorbar=dict(title="Cement %"),
+            line=dict(width=0.5, color='white')
+        ),
+        textposition="top center",
+    ))
+    fig.update_layout(
+        scene=dict(
+            xaxis=dict(title='Доля цемента (%)', backgroundcolor="rgb(230, 230,230)"),
+            yaxis=dict(title='Водовяжущее отношение (W/B)', backgroundcolor="rgb(230, 230,230)"),
+            zaxis=dict(title='Прочность Rc28 (МПа)', backgroundcolor="rgb(230, 230,230)"),
+        ),
+        height=600,
+        margin=dict(l=0, r=0, b=0, t=0)
+    )
+    return fig
+
+
+class FigureFactory:
+    """Builds the analysis figures from cached, pre-validated layout templates.
+
+    Templates are read-only once built, so one factory can be shared by all
+    sessions of the app.
+    """
+
+    def __init__(self):
+        self._templates = {}
+
+    def _template(self, build, key):
+        template = self._templates.get((build, key))
+        if template is None:
+            template = build(key).to_dict()
+            self._templates[(build, key)] = template
+        return template
+
+    def _render(self, template, traces=(), layout=None):
+        traces = list(traces) + [{}] * (len(template['data']) - len(traces))
+        data = [_merged(trace, update) for trace, update in zip(template['data'], traces)]
+        figure = {'data': data, 'layout': _merged(template['layout'], layout or {})}
+        return go.Figure(figure, _validate=False)
+
+    @staticmethod
+    def _highlight(template, optimum, text):
+        """Layout update moving the template's optimum line to ``optimum``."""
+        layout = template['layout']
+        *others, note = layout['annotations']
+        return {'shapes': [dict(layout['shapes'][0], x0=optimum, x1=optimum)],
+                'annotations': others + [dict(note, x=optimum, text=text)]}
+
+    def strength(self, df_avg, optimum=None):
+        template = self._template(_strength_template, None)
+        x = _values(df_avg['Cement_share (%)'])
+        color = BASE_COLOR
+        if optimum is not None:
+            color = np.where(x == optimum, HIGHLIGHT_COLOR, BASE_COLOR)
+        traces = []
+        for param, *_ in STRENGTH_PANELS:
+            y = _values(df_avg[param])
+            traces.append({'x': x, 'y': y, 'text': np.round(y, 1), 'marker': {'color': color}})
+        return self._render(template, traces)
+
+    def comparison(self, df_avg, optimum=None):
+        template = self._template(_comparison_template, optimum is not None)
+        x = _values(df_avg['Cement_share (%)'])
+        traces = [{'x': x, 'y': _values(df_avg[param])} for param, _ in COMPARISON_LINES]
+        layout = None
+        if optimum is not None:
+            layout = self._highlight(template, optimum, f"Оптимум: {optimum:g}%")
+        return self._render(template, traces, layout)
+
+    def wb(self, df_avg, optimum=None):
+        template = self._template(_wb_template, optimum is not None)
+        traces = [{'x': _values(df_avg['Cement_share (%)']), 'y': _values(df_avg['W_B'])}]
+        layout = None
+        if optimum is not None:
+            layout = self._highlight(template, optimum, "Оптимальное значение")
+        return self._render(template, traces, layout)
+
+    def regression(self, df_avg, regression_data):
+        template = self._template(_regression_template, tuple(r['name'] for r in regression_data))
+        x = _values(df_avg['Cement_share (%)'])
+        traces = []
+        annotations = list(template['layout']['annotations'])
+        n_titles = len(annotations) - len(regression_data)
+        for idx, reg in enumerate(regression_data):
+            traces.append({'x': x, 'y': _values(df_avg[reg['param']])})
+            traces.append({'x': np.concatenate([reg['x_line'], reg['x_line'][::-1]]),
+                           'y': np.concatenate([reg['y_high'], reg['y_low'][::-1]])})
+            traces.append({'x': reg['x_line'], 'y': reg['y_line']})
+            equation = f"y = {reg['slope']:.3f}x + {reg['intercept']:.2f}<br>R² = {reg['r_squared']:.3f}"
+            annotations[n_titles + idx] = dict(annotations[n_titles + idx], text=equation)
+        return self._render(template, traces, {'annotations': annotations})
+
+    def correlation(self, correlation_matrix):
+        # Constant columns (e.g. a single fiber dosage) correlate with nothing.
+        correlation_matrix = correlation_matrix.dropna(how='all').dropna(axis=1, how='all')
+        template = self._template(_correlation_template, tuple(correlation_matrix.columns))
+        z = correlation_matrix.to_numpy(np.float64)
+        return self._render(template, [{'z': z, 'text': np.round(z, 2)}])
+
+    def scatter_3d(self, points):
+        """3D cloud of (possibly density-reduced) specimens from ``reduce_frame``."""
+        counts = points['Образцов'].to_numpy()
+        reduced = bool(len(counts)) and counts.max() > 1
+        show_text = not reduced and len(points) <= TEXT_LIMIT
+        template = self._template(_scatter_3d_template, show_text)
+        cement = _values(points['Cement_share (%)'])
+        trace = {
+            'x': cement,
+            'y': _values(points['W_B']),
+            'z': _values(points['Rc28 (МПа)']),
+            'marker': {'size': _values(points['Rt (МПа)']) * 3, 'color': cement},
+            'customdata': counts,
+            'hovertemplate': (
+                '<b>Cement:</b> %{x}%<br>'
+                '<b>W/B:</b> %{y:.3f}<br>'
+                '<b>Rc28:</b> %{z:.1f} МПа<br>'
+                + ('<b>Образцов в ячейке:</b> %{customdata}<br>' if reduced else '')
+                + '<extra></extra>'
+            ),
+        }
+        if show_text:
+            trace['text'] = [f"Опыт {i+1}" for i in range(len(points))]
+        return self._render(template, [trace])
+
+    def build_all(self, df_avg, regression_data, correlation_matrix, points, optimum=None):
+        """Every analysis figure plus the construction time of each, in seconds."""
+        builders = {
+            'strength': lambda: self.strength(df_avg, optimum),
+            'comparison': lambda: self.comparison(df_avg, optimum),
+            'wb': lambda: self.wb(df_avg, optimum),
+            'regression': lambda: self.regression(df_avg, regression_data),
+            'correlation': lambda: self.correlation(correlation_matrix),
+            '3d': lambda: self.scatter_3d(points),
+        }
+        figures, seconds = {}, {}
+        for name, build in builders.items():
+            start = time.perf_counter()
+            figures[name] = build()
+            seconds[name] = time.perf_counter() - start
+        return figures, seconds
+
+
+def figure_timings(figures, build_seconds):
+    """Construction and JSON serialisation time of every figure, for the perf panel."""
+    rows = []
+    for name, figure in figures.items():
+        start = time.perf_counter()
+        pio.to_json(figure, validate=False)
+        rows.append({
+            'График': FIGURE_NAMES.get(name, name),
+            'Построение (мс)': build_seconds.get(name, float('nan')) * 1000,
+            'Сериализация (мс)': (time.perf_counter() - start) * 1000,
+        })
+    return pd.DataFrame(rows)
+
+
+def experiment_scatter(df, point_budget):
+    points = reduce_frame(df, ['Cement_share (%)', 'Rc28 (МПа)'], point_budget, groups='Experiment')
+    hover_data = ['Rras (МПа)', 'W_B']
+    if len(points) < len(df):
+        hover_data.append('Образцов')
+
+    fig = px.scatter(points, x='Cement_share (%)', y='Rc28 (МПа)',
+                     color='Experiment',
+                     size='Rt (МПа)',
+                     hover_data=hover_data,
+                     render_mode='webgl' if len(points) > WEBGL_THRESHOLD else 'svg',
+                     title='Прочность на сжатие: Эксперимент 1 vs Эксперимент 2')
+
+    fig.update_layout(height=500)
+    return fig
+
+
+def maturity_figure(maturity, labels, max_age, limit=MATURITY_CURVES):
+    """Measured mean strength by age against the curves fitted on the early ages."""
+    fit, ages, observed = maturity['fit'], maturity['ages'], maturity['observed']
+    shown = np.argsort(-maturity['count'].max(axis=1), kind='stable')[:limit]
+    t = np.geomspace(1, max(ages.max(), 28), 60)
+    curves = fit.predict(t)
+    colors = px.colors.qualitative.Plotly
+
+    fig = go.Figure()
+    for position, mix in enumerate(shown):
+        color = colors[position % len(colors)]
+        fig.add_trace(go.Scatter(x=ages, y=observed[mix], mode='markers', name=labels[mix],
+                                 legendgroup=str(mix), marker=dict(color=color, size=9)))
+        fig.add_trace(go.Scatter(x=t, y=curves[mix], mode='lines', name=labels[mix],
+                                 legendgroup=str(mix), showlegend=False,
+                                 line=dict(color=color, dash='dash')))
+    fig.add_vline(x=max_age, line_dash="dot", line_color="gray",
+                  annotation_text=f"подгонка до {max_age:g} сут", annotation_position="top")
+    fig.update_layout(
+        title="Набор прочности: измерения (точки) и прогноз по ранним испытаниям (линии)",
+        xaxis=dict(title="Возраст (сут)", type='log', tickvals=list(ages)),
+        yaxis_title="Прочность на сжатие (МПа)",
+        height=500,
+    )
+    return fig
+
+
+def prediction_figure(table, labels):
+    """Predicted against measured Rc28 for every mix, with the line of perfect agreement."""
+    known = table[['Rc28 факт', 'Rc28 прогноз']].notna().all(axis=1).to_numpy()
+    actual = _values(table['Rc28 факт'])[known]
+    predicted = _values(table['Rc28 прогноз'])[known]
+    scatter = go.Scattergl if known.sum() > WEBGL_THRESHOLD else go.Scatter
+    fig = go.Figure(scatter(
+        x=actual, y=predicted, mode='markers',
+        text=np.asarray(labels, dtype=object)[known],
+        marker=dict(color=BASE_COLOR, size=9),
+        hovertemplate='%{text}<br>Факт: %{x:.1f} МПа<br>Прогноз: %{y:.1f} МПа<extra></extra>',
+    ))
+    if known.any():
+        low, high = min(actual.min(), predicted.min()), max(actual.max(), predicted.max())
+        fig.add_trace(go.Scatter(x=[low, high], y=[low, high], mode='lines', showlegend=False,
+                                 line=dict(color='gray', dash='dash'), hoverinfo='skip'))
+    fig.update_layout(
+        title="Прогноз Rc28 против измеренной прочности",
+        xaxis_title="Rc28 измеренная (МПа)",
+        yaxis_title="Rc28 прогноз (МПа)",
+        showlegend=False,
+        height=500,
+    )
+    return fig
+
+
+def control_chart_figure(chart, metric, point_budget, cusum_limit=None):
+    """X̄, R, EWMA and CUSUM panels of one ``spc.ControlChart`` frame.
+
+    Long histories are reduced to ``point_budget`` subgroups with LTTB on
+    the subgroup means; subgroups that broke a rule are always drawn.
+    """
+    if len(chart) > point_budget:
+        kept = lttb(np.arange(len(chart)), chart['mean'].to_numpy(np.float64), point_budget)
+        kept = np.union1d(kept, np.flatnonzero(chart['rules'].to_numpy() != 0))
+        chart = chart.iloc[kept]
+    x = chart['date'].to_numpy()
+    alarm = chart['rules'].to_numpy() != 0
+    scatter = go.Scattergl if len(chart) > WEBGL_THRESHOLD else go.Scatter
+
+    fig = make_subplots(rows=4, cols=1, shared_xaxes=True, vertical_spacing=0.04,
+                        subplot_titles=(f"X̄: {metric}", "Размах R", "EWMA (в стандартных ошибках)",
+                                        "CUSUM (в стандартных ошибках)"))
+
+    def limit_lines(row, columns):
+        for column, dash in columns:
+            fig.add_trace(go.Scatter(x=x, y=chart[column].to_numpy(np.float64), mode='lines',
+                                     line=dict(color='gray', dash=dash, shape='hv', width=1),
+                                     showlegend=False, hoverinfo='skip'), row=row, col=1)
+
+    limit_lines(1, [('ucl', 'dash'), ('center', 'solid'), ('lcl', 'dash')])
+    fig.add_trace(scatter(x=x, y=chart['mean'].to_numpy(np.float64), mode='lines+markers', name="Среднее",
+                          line=dict(color=BASE_COLOR), marker=dict(size=5)), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x[alarm], y=chart['mean'].to_numpy(np.float64)[alarm], mode='markers',
+                             name="Сигнал", marker=dict(color=HIGHLIGHT_COLOR, size=9)), row=1, col=1)
+
+    limit_lines(2, [('range_ucl', 'dash'), ('range_center', 'solid'), ('range_lcl', 'dash')])
+    fig.add_trace(scatter(x=x, y=chart['range'].to_numpy(np.float64), mode='lines+markers', name="Размах",
+                          line=dict(color=BASE_COLOR), marker=dict(size=4), showlegend=False), row=2, col=1)
+
+    ewma_bound = chart['ewma_limit'].to_numpy(np.float64)
+    for sign in (1, -1):
+        fig.add_trace(go.Scatter(x=x, y=sign * ewma_bound, mode='lines', showlegend=False, hoverinfo='skip',
+                                 line=dict(color='gray', dash='dash', width=1)), row=3, col=1)
+    fig.add_trace(scatter(x=x, y=chart['ewma'].to_numpy(np.float64), mode='lines', name="EWMA",
+                          line=dict(color='#8e44ad')), row=3, col=1)
+
+    fig.add_trace(scatter(x=x, y=chart['cusum_high'].to_numpy(np.float64), mode='lines', name="CUSUM C+",
+                          line=dict(color='#27ae60')), row=4, col=1)
+    fig.add_trace(scatter(x=x, y=-chart['cusum_low'].to_numpy(np.float64), mode='lines', name="CUSUM −C−",
+                          line=dict(color='#e67e22')), row=4, col=1)
+    if cusum_limit is not None:
+        for sign in (1, -1):
+            fig.add_hline(y=sign * cusum_limit, line_dash="dash", line_color="gray", row=4, col=1)
+
+    fig.update_layout(height=900, hovermode='x unified',
+                      legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1))
+    return fig
+
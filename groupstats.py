@@ -0,0 +1,172 @@
+"""Incremental per-group statistics for the mix factors.
+
+``GroupStatsIndex`` keeps the count, sum and sum of squares of every
+metric for every group of a chosen set of mix factors.  It is built in a
+single pass over the data and afterwards updated only with the rows that
+changed, so edits in the data editor cost O(changed rows) instead of a new
+``groupby`` over the whole table.  Means, standard deviations and
+confidence intervals are derived from the three accumulators.
+"""
+import numpy as np
+import pandas as pd
+
+MIX_FACTORS = ['Cement_share (%)', 'W_B', 'Additive (%)', 'Fiber (%)']
+
+METRICS = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'PGR (см)', 'W_B']
+
+
+def frame_delta(old, new, columns):
+    """Rows to retract from ``old`` and to insert from ``new`` to turn one into the other.
+
+    Rows are matched by index label and ``columns`` must be numeric.  Rows
+    whose values changed appear in both results, so applying the removal
+    and then the insertion is always exact, whatever the editor did to the
+    index.
+    """
+    if old.index.equals(new.index):
+        before, after = old, new
+        removed, added = old.iloc[:0][columns], new.iloc[:0][columns]
+    else:
+        common = old.index.intersection(new.index)
+        before, after = old.loc[common], new.loc[common]
+        removed = old.loc[old.index.difference(new.index), columns]
+        added = new.loc[new.index.difference(old.index), columns]
+
+    changed = np.zeros(len(before), dtype=bool)
+    for col in columns:
+        a = before[col].to_numpy(np.float64, na_value=np.nan)
+        b = after[col].to_numpy(np.float64, na_value=np.nan)
+        changed |= (a != b) & ~(np.isnan(a) & np.isnan(b))
+
+    removed = pd.concat([removed, before.loc[changed, columns]])
+    added = pd.concat([added, after.loc[changed, columns]])
+    return removed, added
+
+
+class GroupStatsIndex:
+    """Count, sum and sum of squares of ``metrics`` per group of ``keys``."""
+
+    def __init__(self, keys, metrics=METRICS):
+        self.keys = list(keys)
+        self.metrics = list(metrics)
+        self._slots = {}
+        self._labels = []
+        self._count = np.zeros((0, len(self.metrics)))
+        self._sum = np.zeros((0, len(self.metrics)))
+        self._sumsq = np.zeros((0, len(self.metrics)))
+
+    @property
+    def columns(self):
+        return list(dict.fromkeys(self.keys + self.metrics))
+
+    @classmethod
+    def from_frame(cls, df, keys, metrics=METRICS):
+        """Build the index with one grouped pass over ``df``."""
+        index = cls(keys, metrics)
+        grouper = df.groupby(index.keys, sort=True, dropna=True)
+        codes = grouper.ngroup().to_numpy()
+        labels = grouper.size().index
+        labels = list(labels) if isinstance(labels, pd.MultiIndex) else [(k,) for k in labels]
+
+        index._grow(len(labels))
+        for slot, label in enumerate(labels):
+            index._slots[label] = slot
+        index._labels = labels
+
+        valid = codes >= 0
+        values = df.loc[valid, index.metrics].to_numpy(np.float64, na_value=np.nan)
+        index._accumulate(codes[valid], values, 1.0)
+        return index
+
+    def _grow(self, n_groups):
+        extra = n_groups - len(self._count)
+        if extra <= 0:
+            return
+        extra = max(extra, len(self._count))
+        pad = np.zeros((extra, len(self.metrics)))
+        self._count = np.vstack([self._count, pad])
+        self._sum = np.vstack([self._sum, pad])
+        self._sumsq = np.vstack([self._sumsq, pad])
+
+    def _slot(self, label):
+        slot = self._slots.get(label)
+        if slot is None:
+            slot = len(self._labels)
+            self._slots[label] = slot
+            self._labels.append(label)
+            self._grow(slot + 1)
+        return slot
+
+    def _accumulate(self, slots, values, sign):
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+        np.add.at(self._count, slots, sign * present)
+        np.add.at(self._sum, slots, sign * values)
+        np.add.at(self._sumsq, slots, sign * values * values)
+
+    def _apply(self, rows, sign):
+        if rows.empty:
+            return
+        keys = rows[self.keys]
+        valid = keys.notna().all(axis=1).to_numpy()
+        labels = keys[valid].itertuples(index=False, name=None)
+        slots = np.fromiter((self._slot(label) for label in labels), dtype=np.intp,
+                            count=int(valid.sum()))
+        values = rows.loc[valid, self.metrics].to_numpy(np.float64, na_value=np.nan)
+        self._accumulate(slots, values, sign)
+
+    def add(self, rows):
+        self._apply(rows, 1.0)
+
+    def remove(self, rows):
+        self._apply(rows, -1.0)
+
+    def update(self, old, new):
+        """Move the index from frame ``old`` to frame ``new`` using only changed rows."""
+        removed, added = frame_delta(old, new, self.columns)
+        self.remove(removed)
+        self.add(added)
+        return len(removed) + len(added)
+
+    def _live(self):
+        """Slots of groups that still hold at least one row, in key order."""
+        n = len(self._labels)
+        alive = [slot for slot in range(n) if self._count[slot].max() > 0.5]
+        return sorted(alive, key=lambda slot: self._labels[slot])
+
+    def _key_frame(self, slots):
+        return pd.DataFrame([self._labels[slot] for slot in slots], columns=self.keys)
+
+    def means(self):
+        """Group means in the layout of ``df.groupby(keys).mean().reset_index()``."""
+        slots = self._live()
+        count = self._count[slots]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0.5, self._sum[slots] / count, np.nan)
+        out = self._key_frame(slots)
+        for position, metric in enumerate(self.metrics):
+            if metric not in self.keys:
+                out[metric] = mean[:, position]
+        return out
+
+    def describe(self, metric, confidence=0.95):
+        """Count, mean, standard deviation and confidence interval of one metric per group."""
+        from scipy import stats
+
+        slots = self._live()
+        position = self.metrics.index(metric)
+        n = np.rint(self._count[slots, position])
+        total = self._sum[slots, position]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / n
+            # Cancellation can leave tiny negative variances; clamp them to zero.
+            var = np.maximum(self._sumsq[slots, position] - total * mean, 0.0) / (n - 1)
+            std = np.sqrt(var)
+            half = stats.t.ppf(0.5 + confidence / 2, n - 1) * std / np.sqrt(n)
+        out = self._key_frame(slots)
+        out['n'] = n.astype(int)
+        out['mean'] = mean
+        out['std'] = np.where(n > 1, std, np.nan)
+        out['ci_low'] = mean - half
+        out['ci_high'] = mean + half
+        return out
@@ -0,0 +1,343 @@
+"""Chunked ingestion of uploaded lab data.
+
+Workbooks are streamed row by row through openpyxl's ``read_only`` mode,
+CSV files are read in chunks and Parquet files column-wise.  Every chunk
+is converted straight into typed NumPy columns, and the final frame is
+compacted (float32 measurements, uint8 cement shares, categorical
+``Experiment``) and stored in a Parquet cache keyed by the file's content
+hash, so the same upload is only ever parsed once.
+"""
+import csv
+import hashlib
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = ['Cement_share (%)', 'W_B', 'Additive (%)', 'Fiber (%)',
+                    'Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'PGR (см)', 'Experiment']
+
+NUMERIC_COLUMNS = REQUIRED_COLUMNS[:-1]
+
+# Compressive strength by curing age in days.  Rc28 is required; the other
+# ages are optional and kept whenever a file has them.
+AGE_COLUMNS = {1: 'Rc1 (МПа)', 3: 'Rc3 (МПа)', 7: 'Rc7 (МПа)', 14: 'Rc14 (МПа)',
+               28: 'Rc28 (МПа)', 90: 'Rc90 (МПа)'}
+
+OPTIONAL_COLUMNS = [col for col in AGE_COLUMNS.values() if col not in REQUIRED_COLUMNS]
+
+# Short internal key of every column: the specimens table column and the
+# column name in cache files.  Frames handed to the app keep the display names.
+KEYS = {
+    'Cement_share (%)': 'cement_share',
+    'W_B': 'w_b',
+    'Additive (%)': 'additive',
+    'Fiber (%)': 'fiber',
+    'Rc28 (МПа)': 'rc28',
+    'Rt (МПа)': 'rt',
+    'Rras (МПа)': 'rras',
+    'PGR (см)': 'pgr',
+    'Experiment': 'experiment',
+    'Rc1 (МПа)': 'rc1',
+    'Rc3 (МПа)': 'rc3',
+    'Rc7 (МПа)': 'rc7',
+    'Rc14 (МПа)': 'rc14',
+    'Rc90 (МПа)': 'rc90',
+}
+
+COLUMNS_BY_KEY = {key: col for col, key in KEYS.items()}
+
+SUPPORTED_TYPES = ['xlsx', 'xls', 'csv', 'parquet']
+
+CACHE_DIR = Path(__file__).parent / '.cache' / 'ingest'
+
+CHUNK_ROWS = 50_000
+
+# Significant digits a float32 measurement is written out with: enough to
+# tell any two float32 values of lab precision apart, and 22.8f becomes 22.8
+# rather than 22.799999237.
+FLOAT32_DIGITS = 7
+
+# Part of the cache file name; bumped whenever the parsed layout changes so
+# that files parsed by an older version are read again.
+CACHE_VERSION = 4
+
+
+class MissingColumnsError(ValueError):
+    """Raised when an uploaded file lacks some of the required columns."""
+
+    def __init__(self, missing):
+        self.missing = list(missing)
+        super().__init__(f"Missing columns: {', '.join(self.missing)}")
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _check_columns(columns):
+    missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing:
+        raise MissingColumnsError(missing)
+
+
+def optional_columns(columns):
+    """The optional columns among ``columns``, in canonical order."""
+    present = set(columns)
+    return [col for col in OPTIONAL_COLUMNS if col in present]
+
+
+def _to_float32(values):
+    """Convert a column chunk to float32, turning unparsable cells into NaN.
+
+    Returns the array and a mask of the cells that held something other
+    than a number, or None when every cell parsed.
+    """
+    try:
+        return np.asarray(values, dtype=np.float32), None
+    except (TypeError, ValueError):
+        cells = pd.Series(values, dtype=object)
+        parsed = pd.to_numeric(cells, errors='coerce').to_numpy(np.float32)
+        present = cells.notna() & cells.astype(str).str.strip().ne('')
+        return parsed, np.isnan(parsed) & present.to_numpy(bool)
+
+
+def _numeric_chunk(cells, offset, unparsable):
+    """Convert the numeric ``cells`` of one chunk (``{column: values}``) to float32.
+
+    Cells that are not numbers are appended to ``unparsable`` as a
+    ``(row, column, value)`` frame, rows counted from ``offset``.
+    """
+    chunk = {}
+    for col, values in cells.items():
+        chunk[col], failed = _to_float32(values)
+        if failed is not None and failed.any():
+            rows = np.flatnonzero(failed)
+            unparsable.append(pd.DataFrame({
+                'row': rows + offset,
+                'column': col,
+                'value': np.asarray(values, dtype=object)[rows].astype(str),
+            }))
+    return chunk
+
+
+def _unparsable_frame(parts):
+    if not parts:
+        return pd.DataFrame({'row': np.array([], dtype=np.int64), 'column': np.array([], dtype=object),
+                             'value': np.array([], dtype=object)})
+    return pd.concat(parts, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+
+
+def decimal_values(series):
+    """``series`` as a float64 array, float32 values rounded to their decimal form."""
+    values = series.to_numpy(np.float64, na_value=np.nan)
+    if series.dtype == np.float32:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exponent = np.floor(np.log10(np.abs(values)))
+        scale = 10.0 ** (FLOAT32_DIGITS - 1 - np.where(np.isfinite(exponent), exponent, 0))
+        values = np.round(values * scale) / scale
+    return values
+
+
+def _share_column(values):
+    """Cement shares as uint8 when they are all whole percentages, else float32."""
+    values = np.asarray(values, dtype=np.float32)
+    if np.isfinite(values).all() and ((values >= 0) & (values <= 255) & (values == np.round(values))).all():
+        return values.astype(np.uint8)
+    return values
+
+
+def compact(df):
+    """Return the known columns with float32 measurements and a categorical Experiment.
+
+    Cement shares become uint8 when they are all whole percentages; the
+    index of ``df`` is kept.
+    """
+    out = pd.DataFrame({col: pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+                        for col in NUMERIC_COLUMNS})
+    out['Cement_share (%)'] = _share_column(out['Cement_share (%)'])
+    out['Experiment'] = df['Experiment'].astype('category')
+    for col in optional_columns(df.columns):
+        out[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    return out
+
+
+def _unparsable_cells(frame):
+    """The unparsable cells of a frame read in one piece."""
+    unparsable = []
+    _numeric_chunk({col: frame[col].to_numpy() for col in NUMERIC_COLUMNS + optional_columns(frame.columns)},
+                   0, unparsable)
+    return _unparsable_frame(unparsable)
+
+
+def _frame_from_chunks(chunks):
+    """Concatenate per-chunk column arrays into one compact frame."""
+    if not chunks:
+        return compact(pd.DataFrame({col: [] for col in REQUIRED_COLUMNS}))
+
+    columns = {col: np.concatenate([chunk[col] for chunk in chunks])
+               for col in NUMERIC_COLUMNS}
+    columns['Cement_share (%)'] = _share_column(columns['Cement_share (%)'])
+    experiment = np.concatenate([chunk['Experiment'] for chunk in chunks])
+    columns['Experiment'] = pd.Categorical(experiment)
+    for col in optional_columns(chunks[0]):
+        columns[col] = np.concatenate([chunk[col] for chunk in chunks])
+    return pd.DataFrame(columns)
+
+
+def read_xlsx(buffer, chunk_rows=CHUNK_ROWS):
+    """Stream the first worksheet of an .xlsx workbook into a compact frame.
+
+    Like every reader, returns the frame and the frame of unparsable cells.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(buffer, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        header = [str(name).strip() if name is not None else '' for name in header]
+        _check_columns(header)
+        positions = {col: header.index(col) for col in REQUIRED_COLUMNS + optional_columns(header)}
+        numeric = [col for col in positions if col != 'Experiment']
+
+        chunks = []
+        unparsable = []
+        block = []
+
+        def flush():
+            cells = list(zip(*block))
+            offset = sum(len(chunk['Experiment']) for chunk in chunks)
+            chunk = _numeric_chunk({col: cells[positions[col]] for col in numeric}, offset, unparsable)
+            chunk['Experiment'] = np.array(
+                [None if v is None else str(v) for v in cells[positions['Experiment']]],
+                dtype=object,
+            )
+            chunks.append(chunk)
+            block.clear()
+
+        width = len(header)
+        for row in rows:
+            if not any(cell is not None for cell in row):
+                continue
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            block.append(row)
+            if len(block) >= chunk_rows:
+                flush()
+        if block:
+            flush()
+    finally:
+        workbook.close()
+
+    return _frame_from_chunks(chunks), _unparsable_frame(unparsable)
+
+
+def _sniff_csv_dialect(buffer):
+    """Guess the delimiter from the first few kilobytes; ';' files use decimal commas."""
+    sample = buffer.read(4096).decode('utf-8-sig', errors='ignore')
+    buffer.seek(0)
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+    except csv.Error:
+        sep = ','
+    return sep, ',' if sep == ';' else '.'
+
+
+def read_csv(buffer, chunk_rows=CHUNK_ROWS):
+    """Read a CSV file in chunks, compacting each chunk as it arrives."""
+    sep, decimal = _sniff_csv_dialect(buffer)
+    header = pd.read_csv(buffer, sep=sep, nrows=0, encoding='utf-8-sig')
+    _check_columns([col.strip() for col in header.columns])
+    numeric = NUMERIC_COLUMNS + optional_columns(col.strip() for col in header.columns)
+    buffer.seek(0)
+
+    reader = pd.read_csv(
+        buffer,
+        sep=sep,
+        decimal=decimal,
+        encoding='utf-8-sig',
+        chunksize=chunk_rows,
+        usecols=lambda col: col.strip() in numeric or col.strip() == 'Experiment',
+        dtype={col: 'string' for col in header.columns if col.strip() == 'Experiment'},
+    )
+    chunks = []
+    unparsable = []
+    offset = 0
+    for frame in reader:
+        frame.columns = [col.strip() for col in frame.columns]
+        chunk = _numeric_chunk({col: frame[col].to_numpy() for col in numeric}, offset, unparsable)
+        chunk['Experiment'] = frame['Experiment'].to_numpy(object, na_value=None)
+        chunks.append(chunk)
+        offset += len(frame)
+
+    return _frame_from_chunks(chunks), _unparsable_frame(unparsable)
+
+
+def read_parquet(buffer):
+    """Read only the known columns of a Parquet file."""
+    import pyarrow.parquet as pq
+
+    schema_names = pq.read_schema(buffer).names
+    _check_columns(schema_names)
+    buffer.seek(0)
+    frame = pd.read_parquet(buffer, columns=REQUIRED_COLUMNS + optional_columns(schema_names))
+    return compact(frame), _unparsable_cells(frame)
+
+
+def read_legacy_excel(buffer):
+    """Fallback for old binary .xls workbooks, which openpyxl cannot stream."""
+    frame = pd.read_excel(buffer)
+    frame.columns = [str(col).strip() for col in frame.columns]
+    _check_columns(frame.columns)
+    return compact(frame), _unparsable_cells(frame)
+
+
+READERS = {
+    'xlsx': read_xlsx,
+    'xls': read_legacy_excel,
+    'csv': read_csv,
+    'parquet': read_parquet,
+}
+
+
+def load_upload(file_name, data, cache_dir=CACHE_DIR):
+    """Parse uploaded file contents into a compact frame, reusing the columnar cache.
+
+    Returns the frame and the cells that held something other than a
+    number (``row``, ``column`` and the cell's text); those cells are NaN
+    in the frame, and ``validation.validate`` reports them as type errors.
+
+    Raises ``MissingColumnsError`` when a required column is absent and
+    ``ValueError`` for unsupported file types.
+    """
+    extension = Path(file_name).suffix.lower().lstrip('.')
+    if extension not in READERS:
+        raise ValueError(f"Unsupported file type: {file_name}")
+
+    cache_path = Path(cache_dir) / f"{content_hash(data)}-v{CACHE_VERSION}.parquet"
+    unparsable_path = cache_path.with_suffix('.unparsable.parquet')
+    if cache_path.exists():
+        try:
+            frame = pd.read_parquet(cache_path).rename(columns=COLUMNS_BY_KEY)
+            unparsable = pd.read_parquet(unparsable_path) if unparsable_path.exists() else _unparsable_frame([])
+            return frame, unparsable
+        except (OSError, ValueError):
+            cache_path.unlink(missing_ok=True)
+
+    frame, unparsable = READERS[extension](BytesIO(data))
+
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # The unparsable cells go first: a cached frame without them means there are none.
+        if len(unparsable):
+            unparsable.to_parquet(unparsable_path, index=False)
+        tmp_path = cache_path.with_suffix('.tmp')
+        frame.rename(columns=KEYS).to_parquet(tmp_path, index=False)
+        tmp_path.replace(cache_path)
+    except (OSError, ImportError):
+        # The cache is an optimisation only; a read-only disk must not break uploads.
+        pass
+
+    return frame, unparsable
@@ -0,0 +1,181 @@
+"""Strength development over curing age and early prediction of Rc28.
+
+Specimens are grouped into mixes and the mean compressive strength of
+every mix is taken at each tested curing age.  Strength-gain curves are
+then fitted to all mixes at once:
+
+* logarithmic, ``S(t) = a + b·ln t``: a weighted linear fit, solved in
+  closed form for every mix;
+* hyperbolic (Carino), ``S(t) = Su·kt / (1 + kt)``: for a given rate
+  ``k`` the ultimate strength ``Su`` is linear, so it is eliminated
+  (variable projection) and only the one-dimensional profile over
+  ``log k`` is minimised, by a golden-section search that advances every
+  mix together.
+
+Each age is weighted by its number of specimens.  Fitting on the early
+ages only and evaluating the curve at 28 days predicts Rc28 before the
+28-day breaks are available.
+"""
+import numpy as np
+
+from groupstats import MIX_FACTORS
+from ingest import AGE_COLUMNS
+
+MODELS = {
+    'hyperbolic': "Гиперболическая (Карино)",
+    'logarithmic': "Логарифмическая",
+}
+
+# Search range of the hyperbolic rate constant, 1/day.
+RATE_BOUNDS = (1e-3, 10.0)
+
+GOLDEN_ITERATIONS = 40
+
+
+def age_columns(df):
+    """``(ages, columns)`` of the curing ages present in ``df``, youngest first."""
+    pairs = [(age, col) for age, col in AGE_COLUMNS.items() if col in df]
+    return np.array([age for age, _ in pairs], dtype=np.float64), [col for _, col in pairs]
+
+
+def has_curing_ages(df):
+    """True when ``df`` has strengths at some age before 28 days to predict from."""
+    return bool((age_columns(df)[0] < 28).any())
+
+
+def strength_table(df, keys=MIX_FACTORS):
+    """Mean strength and specimen count per mix and age.
+
+    Returns ``(mixes, ages, mean, count)``: the mix keys as a frame and two
+    ``(mixes, ages)`` arrays; missing combinations have a zero count.
+    """
+    ages, columns = age_columns(df)
+    grouped = df.groupby(list(keys), sort=True, dropna=True, observed=True)[columns]
+    mean = grouped.mean()
+    count = grouped.count()
+    return (mean.index.to_frame(index=False), ages,
+            mean.to_numpy(np.float64, na_value=np.nan), count.to_numpy(np.float64))
+
+
+def mix_labels(mixes):
+    """Short label of every mix, e.g. ``Cement_share (%) 50 · W_B 0.429``."""
+    return [' · '.join(f"{key} {value:g}" if isinstance(value, (int, float, np.number)) else f"{key} {value}"
+                       for key, value in zip(mixes.columns, row))
+            for row in mixes.itertuples(index=False, name=None)]
+
+
+class MaturityFit:
+    """Strength-gain curves of many mixes fitted with one model.
+
+    ``params`` has one row per mix: ``(a, b)`` for the logarithmic model,
+    ``(Su, k)`` for the hyperbolic one.  Mixes with fewer than two tested
+    ages have NaN parameters.
+    """
+
+    def __init__(self, model, ages, params, rmse, n_ages):
+        self.model = model
+        self.ages = ages
+        self.params = params
+        self.rmse = rmse
+        self.n_ages = n_ages
+
+    def predict(self, t):
+        """Strength of every mix at ages ``t``, ``(mixes, len(t))``."""
+        t = np.asarray(t, dtype=np.float64)[None, :]
+        first, second = self.params[:, :1], self.params[:, 1:]
+        if self.model == 'logarithmic':
+            return first + second * np.log(t)
+        return first * second * t / (1 + second * t)
+
+
+def _weights(Y, W):
+    present = ~np.isnan(Y) & (W > 0)
+    return np.where(present, W, 0.0), np.where(present, Y, 0.0), present.sum(axis=1)
+
+
+def _fit_logarithmic(t, Y, W):
+    x = np.log(t)[None, :]
+    sw, sx, sy = W.sum(axis=1), (W * x).sum(axis=1), (W * Y).sum(axis=1)
+    sxx, sxy = (W * x * x).sum(axis=1), (W * x * Y).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b = (sw * sxy - sx * sy) / (sw * sxx - sx * sx)
+        a = (sy - b * sx) / sw
+    return np.column_stack([a, b])
+
+
+def _fit_hyperbolic(t, Y, W, bounds=RATE_BOUNDS, iterations=GOLDEN_ITERATIONS):
+    t = t[None, :]
+    syy = (W * Y * Y).sum(axis=1)
+
+    def profile(log_rate):
+        """Residual sum of squares with ``Su`` at its optimum for each rate."""
+        kt = np.exp(log_rate)[:, None] * t
+        f = kt / (1 + kt)
+        sfy, sff = (W * f * Y).sum(axis=1), (W * f * f).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return syy - sfy * sfy / sff, sfy / sff
+
+    m = len(Y)
+    inv_phi = (np.sqrt(5) - 1) / 2
+    a, b = np.full(m, np.log(bounds[0])), np.full(m, np.log(bounds[1]))
+    c, d = b - inv_phi * (b - a), a + inv_phi * (b - a)
+    fc, fd = profile(c)[0], profile(d)[0]
+    for _ in range(iterations):
+        left = fc < fd
+        # Minimum in [a, d]: d becomes the upper end and c the new inner point
+        # on the right; otherwise in [c, b], symmetrically.
+        a, b = np.where(left, a, c), np.where(left, d, b)
+        new = np.where(left, b - inv_phi * (b - a), a + inv_phi * (b - a))
+        f_new = profile(new)[0]
+        c, d = np.where(left, new, d), np.where(left, c, new)
+        fc, fd = np.where(left, f_new, fd), np.where(left, fc, f_new)
+
+    log_rate = (a + b) / 2
+    ultimate = profile(log_rate)[1]
+    return np.column_stack([ultimate, np.exp(log_rate)])
+
+
+def fit_curves(ages, Y, W, model='hyperbolic'):
+    """Fit the strength-gain curve of every row of ``Y`` (mixes × ``ages``).
+
+    ``W`` holds the weight of every point (its specimen count); NaN
+    strengths and zero weights are ignored.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown maturity model: {model}")
+    ages = np.asarray(ages, dtype=np.float64)
+    W, Y, n_ages = _weights(np.asarray(Y, dtype=np.float64), np.asarray(W, dtype=np.float64))
+    fit = _fit_logarithmic if model == 'logarithmic' else _fit_hyperbolic
+    params = fit(ages, Y, W)
+    params[n_ages < 2] = np.nan
+
+    result = MaturityFit(model, ages, params, None, n_ages)
+    residual = np.where(W > 0, Y - result.predict(ages), 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result.rmse = np.sqrt((W * residual ** 2).sum(axis=1) / W.sum(axis=1))
+    result.rmse[n_ages < 2] = np.nan
+    return result
+
+
+def predict_rc28(df, model='hyperbolic', max_age=7, keys=MIX_FACTORS):
+    """Predict the 28-day strength of every mix from its breaks up to ``max_age`` days.
+
+    Returns a dict with the per-mix ``table`` (actual and predicted Rc28
+    and the relative error), the early-age ``fit``, and the ``mixes``,
+    ``ages``, ``observed`` means and ``count`` of ``strength_table``.
+    """
+    mixes, ages, observed, count = strength_table(df, keys)
+    early = (ages <= max_age) & (ages < 28)
+    fit = fit_curves(ages[early], observed[:, early], count[:, early], model)
+
+    predicted = fit.predict([28.0])[:, 0]
+    actual = observed[:, list(ages).index(28.0)]
+    table = mixes.copy()
+    table['Образцов'] = count.max(axis=1).astype(int)
+    table['Возрастов в подгонке'] = fit.n_ages
+    table['Rc28 факт'] = actual
+    table['Rc28 прогноз'] = predicted
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['Ошибка (%)'] = (predicted / actual - 1) * 100
+    return {'table': table, 'fit': fit, 'mixes': mixes, 'ages': ages,
+            'observed': observed, 'count': count}
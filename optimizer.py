@@ -0,0 +1,217 @@
+"""Mix-design optimisation over the composition space.
+
+Response surfaces for Rc28, Rt, Rras and PGR are fitted with the batched
+regression engine.  Candidate mixes on a grid over cement share, W/B,
+additive and fiber are then generated and evaluated in vectorized chunks,
+filtered by the user's constraints and priced with a linear cost model;
+only the running best mix and Pareto front are kept between chunks, so
+memory does not grow with the grid.  The best
+feasible grid points can be refined by multi-start local optimisation,
+optionally spread over a process pool, and the feasible candidates are
+reduced to a Pareto front of strength against cost.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import regression
+from groupstats import MIX_FACTORS
+
+SURFACE_RESPONSES = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)', 'PGR (см)']
+
+# Rows of the candidate grid generated and evaluated at once, to bound memory on big grids.
+CHUNK_ROWS = 200_000
+
+
+@dataclass
+class Constraints:
+    """User constraints and component prices of the optimisation problem.
+
+    Prices are per kilogram of component; the cement share, additive and
+    fiber are percentages of the binder mass, and the remainder of the
+    binder is mineral filler.  Cost is therefore per tonne of binder.
+    """
+    min_pgr: float | None = None
+    wb_min: float | None = None
+    wb_max: float | None = None
+    min_strength: dict = field(default_factory=dict)
+    price_cement: float = 8.0
+    price_filler: float = 2.0
+    price_additive: float = 150.0
+    price_fiber: float = 250.0
+
+    def cost(self, X):
+        """Binder cost for candidate rows ``X`` laid out as ``MIX_FACTORS``."""
+        cement, additive, fiber = X[:, 0], X[:, 2], X[:, 3]
+        return 10.0 * (self.price_cement * cement
+                       + self.price_filler * (100.0 - cement)
+                       + self.price_additive * additive
+                       + self.price_fiber * fiber)
+
+    def feasible(self, X, predicted):
+        """Mask of candidates satisfying every constraint."""
+        ok = np.ones(len(X), dtype=bool)
+        if self.wb_min is not None:
+            ok &= X[:, 1] >= self.wb_min
+        if self.wb_max is not None:
+            ok &= X[:, 1] <= self.wb_max
+        if self.min_pgr is not None:
+            ok &= predicted[:, SURFACE_RESPONSES.index('PGR (см)')] >= self.min_pgr
+        for response, minimum in self.min_strength.items():
+            ok &= predicted[:, SURFACE_RESPONSES.index(response)] >= minimum
+        return ok
+
+
+def fit_surfaces(df, degree=2):
+    """Fit response surfaces for all responses over the mix factors.
+
+    The degree is lowered when there are too few specimens to estimate a
+    full quadratic model.
+    """
+    while degree > 1:
+        n_terms = 1 + degree * len(MIX_FACTORS)
+        if len(df) > n_terms + 1:
+            break
+        degree -= 1
+    return regression.fit(df, MIX_FACTORS, SURFACE_RESPONSES, degree=degree)
+
+
+def factor_bounds(df):
+    """Tested range of every mix factor; extrapolating beyond it is not trusted."""
+    values = df[MIX_FACTORS].to_numpy(np.float64, na_value=np.nan)
+    return np.column_stack([np.nanmin(values, axis=0), np.nanmax(values, axis=0)])
+
+
+def grid_axes(bounds, resolution):
+    """Levels of every factor; factors with an empty range get a single level."""
+    return [np.linspace(low, high, resolution) if high > low else np.array([low])
+            for low, high in bounds]
+
+
+def grid_rows(axes, start, stop):
+    """Rows ``start:stop`` of the full grid over ``axes``, built from their flat indices."""
+    shape = tuple(len(axis) for axis in axes)
+    positions = np.unravel_index(np.arange(start, stop), shape)
+    return np.column_stack([axis[position] for axis, position in zip(axes, positions)])
+
+
+def candidate_grid(bounds, resolution):
+    """Full grid over the bounds, for grids small enough to hold at once."""
+    axes = grid_axes(bounds, resolution)
+    return grid_rows(axes, 0, int(np.prod([len(axis) for axis in axes])))
+
+
+def pareto_front(strength, cost):
+    """Indices of candidates not dominated in (maximise strength, minimise cost)."""
+    order = np.lexsort((-strength, cost))
+    best_so_far = np.maximum.accumulate(strength[order])
+    improving = np.empty(len(order), dtype=bool)
+    improving[:1] = True
+    improving[1:] = strength[order][1:] > best_so_far[:-1]
+    return order[improving]
+
+
+def _better(best, row, target_pos):
+    """The row with the higher target prediction; ``best`` wins ties, as the earlier row."""
+    target = len(MIX_FACTORS) + target_pos
+    return row if best is None or row[target] > best[target] else best
+
+
+def _merge_front(front, table, target_pos):
+    """Pareto front of the candidate rows of ``front`` and ``table`` (factors, predictions, cost)."""
+    rows = table if front is None else np.concatenate([front, table])
+    return rows[pareto_front(rows[:, len(MIX_FACTORS) + target_pos], rows[:, -1])]
+
+
+def _top_rows(rows, n, target_pos):
+    """The ``n`` candidate rows with the highest target prediction, best first."""
+    return rows[np.argsort(rows[:, len(MIX_FACTORS) + target_pos], kind='stable')[::-1][:n]]
+
+
+def _penalised_objective(x, surfaces, constraints, target):
+    X = x[None, :]
+    predicted = surfaces.predict(X)
+    value = -predicted[0, target]
+    # Quadratic penalties keep the search inside the constraints.
+    penalty = 0.0
+    if constraints.min_pgr is not None:
+        penalty += max(0.0, constraints.min_pgr - predicted[0, SURFACE_RESPONSES.index('PGR (см)')]) ** 2
+    for response, minimum in constraints.min_strength.items():
+        penalty += max(0.0, minimum - predicted[0, SURFACE_RESPONSES.index(response)]) ** 2
+    return value + 1e3 * penalty
+
+
+def _local_search(args):
+    """Refine one start point with L-BFGS-B inside the bounds (module level for pickling)."""
+    from scipy import optimize
+
+    start, surfaces, constraints, target, bounds = args
+    result = optimize.minimize(
+        _penalised_objective, start,
+        args=(surfaces, constraints, target),
+        method='L-BFGS-B', bounds=[tuple(b) for b in bounds],
+    )
+    return result.x
+
+
+def optimize_mix(df, constraints, target='Rc28 (МПа)', resolution=25, n_starts=0,
+                 processes=None, bounds=None):
+    """Search for the strongest feasible mix and the strength/cost Pareto front.
+
+    Returns a dict with the fitted ``surfaces``, the ``best`` mix as a
+    Series (or ``None`` if nothing is feasible), the ``pareto`` front as a
+    frame and the numbers of evaluated and feasible candidates.
+    """
+    surfaces = fit_surfaces(df)
+    bounds = factor_bounds(df) if bounds is None else np.asarray(bounds, dtype=np.float64)
+    if constraints.wb_min is not None:
+        bounds[1, 0] = max(bounds[1, 0], constraints.wb_min)
+    if constraints.wb_max is not None:
+        bounds[1, 1] = min(bounds[1, 1], constraints.wb_max)
+    target_pos = SURFACE_RESPONSES.index(target)
+
+    # The grid is walked in chunks generated from flat indices; only the best
+    # row, the Pareto front and the start points of the local search are kept.
+    axes = grid_axes(bounds, resolution)
+    n_grid = int(np.prod([len(axis) for axis in axes]))
+    best = front = starts = None
+    n_feasible = 0
+    for start in range(0, n_grid, CHUNK_ROWS):
+        X = grid_rows(axes, start, min(start + CHUNK_ROWS, n_grid))
+        predicted = surfaces.predict(X)
+        ok = constraints.feasible(X, predicted)
+        if not ok.any():
+            continue
+        X, predicted = X[ok], predicted[ok]
+        n_feasible += len(X)
+        table = np.column_stack([X, predicted, constraints.cost(X)])
+        best = _better(best, table[np.argmax(predicted[:, target_pos])], target_pos)
+        front = _merge_front(front, table, target_pos)
+        if n_starts:
+            starts = _top_rows(table if starts is None else np.concatenate([starts, table]), n_starts, target_pos)
+
+    if starts is not None:
+        jobs = [(s, surfaces, constraints, target_pos, bounds) for s in starts[:, :len(MIX_FACTORS)]]
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                refined = np.array(list(pool.map(_local_search, jobs)))
+        else:
+            refined = np.array([_local_search(job) for job in jobs])
+        refined_pred = surfaces.predict(refined)
+        ok = constraints.feasible(refined, refined_pred)
+        if ok.any():
+            n_feasible += int(ok.sum())
+            table = np.column_stack([refined[ok], refined_pred[ok], constraints.cost(refined[ok])])
+            best = _better(best, table[np.argmax(refined_pred[ok][:, target_pos])], target_pos)
+            front = _merge_front(front, table, target_pos)
+
+    columns = MIX_FACTORS + [f"{r} прогноз" for r in SURFACE_RESPONSES] + ['Стоимость']
+    if best is None:
+        return {'surfaces': surfaces, 'best': None, 'pareto': pd.DataFrame(columns=columns),
+                'evaluated': n_grid, 'feasible': 0}
+
+    return {'surfaces': surfaces, 'best': pd.Series(best, index=columns),
+            'pareto': pd.DataFrame(front, columns=columns),
+            'evaluated': n_grid, 'feasible': n_feasible}
@@ -0,0 +1,229 @@
+"""Vectorized detection of outlying specimens and inconsistent replicates.
+
+Specimens of the same mix (equal values of all ``MIX_FACTORS``, across
+every experiment) are replicates of one another.  For each strength
+metric ``detect`` sorts the rows once by (mix, value); medians, MADs,
+means and standard deviations of all mixes then follow from segment
+arithmetic on the sorted array, without a Python loop over groups.  Three
+specimen-level tests are applied within each mix:
+
+* the robust z-score ``0.6745 (x - median) / MAD`` (Iglewicz & Hoaglin),
+* Grubbs' test for the single most extreme value (3..30 replicates),
+* Dixon's Q test (r10) for the lowest and the highest value (3..10 replicates),
+
+all at the 5 % level.  In addition the coefficient of variation of every
+mix is compared with a within-test limit; a mix over the limit is marked
+as inconsistent as a whole.  As in ``validation``, the results are folded
+into one integer code per row with one bit per (metric, check) pair.
+"""
+import numpy as np
+import pandas as pd
+
+from groupstats import MIX_FACTORS
+
+METRICS = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)']
+
+# Checks evaluated for every metric; the bit of a finding is
+# ``metric_position * len(CHECKS) + check_position``.
+CHECKS = ('mad', 'grubbs', 'dixon', 'cv')
+
+CHECK_NAMES = {
+    'mad': "медиана/MAD",
+    'grubbs': "Граббс",
+    'dixon': "Диксон",
+    'cv': "разброс повторов",
+}
+
+# Checks that point at a single specimen; ``cv`` describes the whole mix
+# and never excludes rows on its own.
+SPECIMEN_CHECKS = ('mad', 'grubbs', 'dixon')
+
+# Robust z-score above which a specimen is an outlier (Iglewicz & Hoaglin).
+MAD_Z = 3.5
+
+# Two-sided critical values of Grubbs' statistic G at alpha = 0.05.
+GRUBBS_G95 = {
+    3: 1.154, 4: 1.481, 5: 1.715, 6: 1.887, 7: 2.020, 8: 2.127, 9: 2.215, 10: 2.290,
+    11: 2.355, 12: 2.412, 13: 2.462, 14: 2.507, 15: 2.548, 16: 2.586, 17: 2.620,
+    18: 2.652, 19: 2.681, 20: 2.708, 21: 2.734, 22: 2.758, 23: 2.780, 24: 2.802,
+    25: 2.822, 26: 2.841, 27: 2.859, 28: 2.876, 29: 2.893, 30: 2.908,
+}
+
+# Critical values of Dixon's Q (r10) at the 95 % confidence level.
+DIXON_Q95 = {3: 0.970, 4: 0.829, 5: 0.710, 6: 0.625, 7: 0.568, 8: 0.526, 9: 0.493, 10: 0.466}
+
+# Largest acceptable within-test coefficient of variation of a mix.  6 % is
+# the upper bound of "fair" laboratory trial batches for compressive
+# strength in ACI 214R; tensile and flexural tests scatter more.
+CV_LIMITS = {'Rc28 (МПа)': 0.06, 'Rt (МПа)': 0.10, 'Rras (МПа)': 0.10}
+
+assert len(METRICS) * len(CHECKS) <= 16, "outlier codes are stored in uint16"
+
+
+def _bit(metric_position, check):
+    return np.uint16(1 << (metric_position * len(CHECKS) + CHECKS.index(check)))
+
+
+def _critical(table, counts):
+    """Critical value for every group size in ``counts``; NaN outside the table."""
+    values = np.full(max(table) + 1, np.nan)
+    values[list(table)] = list(table.values())
+    return np.where(counts < len(values), values[np.minimum(counts, len(values) - 1)], np.nan)
+
+
+def _mix_codes(df, keys):
+    """Group number of every row over ``keys``; -1 where a factor is missing."""
+    groups = df.groupby(keys, sort=False, dropna=True, observed=True).ngroup()
+    return groups.fillna(-1).to_numpy(np.int64)
+
+
+def _sort_within(groups, values):
+    """Order sorting by ``groups`` and by ``values`` within a group.
+
+    Two stable sorts instead of ``np.lexsort``: the second one sorts small
+    integers, for which NumPy uses a radix sort.
+    """
+    order = np.argsort(values, kind='stable')
+    return order[np.argsort(groups[order], kind='stable')]
+
+
+def _segment_median(values, starts, counts):
+    """Medians of the sorted segments ``values[start:start + count]``."""
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+
+class OutlierResult:
+    """Per-row outlier codes and per-mix replicate statistics produced by ``detect``."""
+
+    def __init__(self, df, metrics, codes, mixes):
+        self.df = df
+        self.metrics = metrics
+        self.codes = codes
+        self.mixes = mixes
+
+    @property
+    def flagged(self):
+        return self.codes != 0
+
+    @property
+    def outliers(self):
+        """Rows that fail a specimen-level check and may be excluded from averages."""
+        mask = np.uint16(0)
+        for position in range(len(self.metrics)):
+            for check in SPECIMEN_CHECKS:
+                mask |= _bit(position, check)
+        return (self.codes & mask) != 0
+
+    def _decode(self, codes):
+        """Return (row, metric position, check position) for every set bit of ``codes``."""
+        n_bits = len(self.metrics) * len(CHECKS)
+        bits = (codes[:, None] >> np.arange(n_bits, dtype=np.uint16)) & np.uint16(1)
+        row, bit = np.nonzero(bits)
+        return row, bit // len(CHECKS), bit % len(CHECKS)
+
+    def describe(self, codes):
+        """Readable findings for each of ``codes``, e.g. ``"Rc28 (МПа): Граббс, Диксон"``."""
+        unique, inverse = np.unique(codes, return_inverse=True)
+        texts = []
+        for code in unique:
+            _, metric_pos, check_pos = self._decode(np.array([code], dtype=np.uint16))
+            parts = {}
+            for m, c in zip(metric_pos, check_pos):
+                parts.setdefault(self.metrics[m], []).append(CHECK_NAMES[CHECKS[c]])
+            texts.append("; ".join(f"{metric}: {', '.join(names)}" for metric, names in parts.items()))
+        return np.array(texts, dtype=object)[inverse.reshape(-1)]
+
+    def summary(self):
+        """Number of rows found by each (metric, check) pair."""
+        rows = np.flatnonzero(self.flagged)
+        _, metric_pos, check_pos = self._decode(self.codes[rows])
+        counts = pd.DataFrame({'metric': metric_pos, 'check': check_pos}).value_counts().sort_index()
+        return pd.DataFrame({
+            'Показатель': [self.metrics[m] for m, _ in counts.index],
+            'Проверка': [CHECK_NAMES[CHECKS[c]] for _, c in counts.index],
+            'Образцов': counts.to_numpy(),
+        })
+
+    def mix_table(self, only_flagged=True):
+        """Replicate statistics per mix and metric; by default only mixes with findings."""
+        if not only_flagged:
+            return self.mixes
+        return self.mixes[(self.mixes['Выбросов'] > 0) | self.mixes['CV выше предела']].reset_index(drop=True)
+
+
+def detect(df, metrics=METRICS, keys=MIX_FACTORS, mad_z=MAD_Z, cv_limits=CV_LIMITS):
+    """Run every outlier check on ``df`` in one sorted pass per metric."""
+    metrics = [metric for metric in metrics if metric in df]
+    codes = np.zeros(len(df), dtype=np.uint16)
+    groups = _mix_codes(df, keys)
+    known = groups >= 0
+    # Group numbers fit a narrow type, which makes their stable sort a radix sort.
+    groups = groups.astype(np.min_scalar_type(max(int(groups.max(initial=0)), 0)))
+    tables = []
+
+    for position, metric in enumerate(metrics):
+        values = df[metric].to_numpy(np.float64, na_value=np.nan)
+        valid = np.flatnonzero(known & ~np.isnan(values))
+        order = valid[_sort_within(groups[valid], values[valid])]
+        x = values[order]
+        sorted_groups = groups[order]
+        first = np.ones(len(x), dtype=bool)
+        first[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(x)))
+        ends = starts + counts
+        segment = np.repeat(np.arange(len(starts), dtype=groups.dtype), counts)
+
+        median = _segment_median(x, starts, counts)
+        deviation = np.abs(x - median[segment])
+        mad = _segment_median(deviation[_sort_within(segment, deviation)], starts, counts)
+        mean = np.bincount(segment, x, minlength=len(starts)) / counts
+        squares = np.bincount(segment, (x - mean[segment]) ** 2, minlength=len(starts))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(squares / (counts - 1))
+            z = 0.6745 * (x - median[segment]) / mad[segment]
+            mad_flag = (counts[segment] >= 3) & (mad[segment] > 0) & (np.abs(z) > mad_z)
+
+            low, high = x[starts], x[ends - 1]
+            high_side = high - mean >= mean - low
+            grubbs = np.where(high_side, high - mean, mean - low) / std > _critical(GRUBBS_G95, counts)
+
+            # Gaps next to the extremes; indexes are clipped for groups too small to test.
+            spread = high - low
+            q_low = (x[np.minimum(starts + 1, ends - 1)] - low) / spread
+            q_high = (high - x[np.maximum(ends - 2, starts)]) / spread
+            q_critical = _critical(DIXON_Q95, counts)
+            dixon_low, dixon_high = q_low > q_critical, q_high > q_critical
+
+            cv = std / mean
+            cv_flag = cv > cv_limits.get(metric, np.inf)
+
+        # Positions in the sorted array of the specimens found by each check.
+        found = {
+            'mad': np.flatnonzero(mad_flag),
+            'grubbs': np.where(high_side, ends - 1, starts)[grubbs],
+            'dixon': np.concatenate([starts[dixon_low], ends[dixon_high] - 1]),
+            'cv': np.flatnonzero(cv_flag[segment]),
+        }
+        specimen = np.zeros(len(x), dtype=bool)
+        for check, at in found.items():
+            codes[order[at]] |= _bit(position, check)
+            if check in SPECIMEN_CHECKS:
+                specimen[at] = True
+
+        table = df[keys].iloc[order[starts]].reset_index(drop=True)
+        table.insert(len(keys), 'Показатель', metric)
+        tables.append(table.assign(**{
+            'Образцов': counts,
+            'Среднее': mean,
+            'Медиана': median,
+            'MAD': mad,
+            'CV (%)': cv * 100,
+            'Предел CV (%)': cv_limits.get(metric, np.nan) * 100,
+            'CV выше предела': cv_flag,
+            'Выбросов': np.bincount(segment, specimen, minlength=len(starts)).astype(np.int64),
+        }))
+
+    mixes = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    return OutlierResult(df, metrics, codes, mixes)
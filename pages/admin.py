@@ -0,0 +1,55 @@
+import os
+
+import streamlit as st
+
+from shared_cache import MB, get_cache, get_registry
+
+st.set_page_config(
+    page_title="Администрирование",
+    layout="wide"
+)
+
+st.title("Кэш и память сессий")
+
+# Optional guard for shared deployments; without the variable the page is open.
+password = os.environ.get('CONCRETE_ADMIN_PASSWORD')
+if password and st.text_input("Пароль администратора", type="password") != password:
+    st.stop()
+
+cache = get_cache()
+registry = get_registry()
+stats = cache.stats()
+
+calls = stats['Попаданий'].sum() + stats['Промахов'].sum()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Записей в кэше", len(cache))
+col2.metric("Занято", f"{cache.nbytes / MB:.1f} из {cache.max_bytes / MB:.0f} МБ")
+col3.metric("Доля попаданий", f"{stats['Попаданий'].sum() / calls:.0%}" if calls else "—")
+col4.metric("Вытеснено", int(stats['Вытеснено'].sum()))
+
+st.subheader("По функциям")
+st.dataframe(stats, use_container_width=True, hide_index=True)
+
+with st.expander("Записи кэша"):
+    st.dataframe(cache.entries(), use_container_width=True, hide_index=True)
+
+st.subheader("Сессии")
+sessions = registry.sessions()
+st.caption(f"Активных сессий: {len(sessions)}, память вне общего кэша: {registry.total_bytes / MB:.1f} МБ, "
+           f"лимит на сессию: {registry.max_bytes / MB:.0f} МБ")
+st.dataframe(sessions, use_container_width=True, hide_index=True)
+
+st.subheader("Настройки")
+with st.form("limits"):
+    cache_mb = st.number_input("Лимит общего кэша (МБ)", min_value=16,
+                               value=int(cache.max_bytes // MB), step=64)
+    session_mb = st.number_input("Лимит памяти сессии (МБ)", min_value=16,
+                                 value=int(registry.max_bytes // MB), step=64)
+    if st.form_submit_button("Применить"):
+        cache.resize(int(cache_mb) * MB)
+        registry.max_bytes = int(session_mb) * MB
+        st.rerun()
+
+if st.button("Очистить кэш"):
+    cache.clear()
+    st.rerun()
@@ -0,0 +1,146 @@
+"""Server-side filtering, sorting and paging of the specimen tables.
+
+``st.dataframe`` and ``st.data_editor`` serialise every row they are given
+to the browser as Arrow on every rerun.  For long lab histories the
+tables are therefore filtered and sorted here and only the visible page
+is handed to Streamlit.  The editable page reports its changes as a diff
+(edited cells, deleted and added rows), which ``merge_edits`` applies to
+the full frame by specimen id without copying the untouched columns.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZES = [50, 100, 500, 1000]
+
+DEFAULT_PAGE_SIZE = 100
+
+
+@dataclass(frozen=True)
+class TableQuery:
+    """Rows of a specimen table to show and their order.
+
+    Empty ``cement_shares`` or ``experiments`` select everything;
+    ``strength_range`` bounds ``strength_column`` inclusively.
+    """
+    cement_shares: tuple = ()
+    experiments: tuple = ()
+    strength_column: str = 'Rc28 (МПа)'
+    strength_range: tuple | None = None
+    sort_by: str | None = None
+    ascending: bool = True
+
+
+def select_rows(df, query):
+    """Positions of the rows of ``df`` matching ``query``, in display order."""
+    mask = np.ones(len(df), dtype=bool)
+    if query.cement_shares:
+        mask &= df['Cement_share (%)'].isin(query.cement_shares).to_numpy()
+    if query.experiments:
+        mask &= df['Experiment'].isin(query.experiments).to_numpy()
+    if query.strength_range is not None:
+        low, high = query.strength_range
+        values = df[query.strength_column].to_numpy(np.float64, na_value=np.nan)
+        mask &= (values >= low) & (values <= high)
+    positions = np.flatnonzero(mask)
+
+    if query.sort_by is not None:
+        column = df[query.sort_by].iloc[positions]
+        # A stable sort keeps the stored order among equal values; NaNs go last.
+        order = column.reset_index(drop=True).sort_values(
+            ascending=query.ascending, kind='stable', na_position='last').index
+        positions = positions[order.to_numpy()]
+    return positions
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def page_positions(positions, page, page_size):
+    """Positions of the rows on page ``page`` (counted from 1) of ``df[positions]``."""
+    start = (page - 1) * page_size
+    return positions[start:start + page_size]
+
+
+def with_page_ids(page, edited):
+    """Index ``edited`` by the ids of ``page`` again.
+
+    The editor is given the page with a range index (so that rows can be
+    added without typing an index); the rows it returns are labelled by
+    their position in the page.  Added rows get negative ids, which are
+    never stored specimen ids.
+    """
+    ids, n = page.index, len(page)
+    return edited.set_axis([ids[position] if position < n else n - 1 - position
+                            for position in edited.index])
+
+
+def merge_edits(df, page, edited, changes):
+    """Apply the edits of one editor page to the full frame ``df``.
+
+    ``page`` holds the rows shown in the editor, ``edited`` what the editor
+    returned (indexed by ``with_page_ids``) and ``changes`` its widget
+    state, where cell edits and deletions address rows by their position
+    in ``page``.
+    """
+    edited_rows = changes.get('edited_rows', {})
+    deleted_rows = changes.get('deleted_rows', [])
+    if not (edited_rows or deleted_rows or changes.get('added_rows')):
+        return df
+
+    out = df.copy(deep=False)
+    columns = {}
+    for position, cells in edited_rows.items():
+        for col in cells:
+            columns.setdefault(col, []).append(page.index[int(position)])
+    for col, ids in columns.items():
+        ids = [i for i in ids if i in edited.index]
+        # A new experiment name or a fractional share must not hit the compact dtype as is.
+        out[col], values = _conform_column(out[col], edited.loc[ids, col])
+        out.loc[ids, col] = values
+
+    if deleted_rows:
+        out = out.drop(index=page.index[list(deleted_rows)])
+
+    added = edited[edited.index < 0]
+    if len(added):
+        out, added = _conform(out, added)
+        out = pd.concat([out, added])
+    return out
+
+
+def _conform_column(column, values):
+    """Return ``column`` and ``values`` with a common compact dtype.
+
+    Categories are extended with the new values; whole-number columns
+    become float32 when a new value is missing, fractional or out of
+    their range.
+    """
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories.union(pd.Index(values.dropna().unique()))
+        if len(categories) > len(dtype.categories):
+            column = column.cat.set_categories(categories)
+        values = pd.Series(pd.Categorical(values, categories=categories), index=values.index)
+    elif dtype.kind in 'iuf':
+        values = pd.to_numeric(values, errors='coerce')
+        if dtype.kind != 'f':
+            info = np.iinfo(dtype)
+            whole = values.notna() & (values == values.round()) & values.between(info.min, info.max)
+            if not whole.all():
+                column = column.astype(np.float32)
+        values = values.astype(column.dtype)
+    return column, values
+
+
+def _conform(df, rows):
+    """Give added ``rows`` the compact dtypes of ``df`` so that appending keeps them."""
+    columns = {}
+    for col in df.columns:
+        values = rows[col] if col in rows else pd.Series(np.nan, index=rows.index)
+        conformed, columns[col] = _conform_column(df[col], values)
+        if conformed.dtype != df[col].dtype:
+            df = df.assign(**{col: conformed})
+    return df, pd.DataFrame(columns, index=rows.index)
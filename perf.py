@@ -0,0 +1,74 @@
+"""Stage timing for the analysis pipeline.
+
+Each named stage records its wall-clock time and, optionally, the peak
+memory allocated while it ran (via ``tracemalloc``).  The recorder can
+report progress after every stage so the UI progress bar follows the
+real work instead of a timer.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class StageTimer:
+    """Times a fixed sequence of named pipeline stages."""
+
+    def __init__(self, stages, on_progress=None, track_memory=False):
+        self.stages = list(stages)
+        self.on_progress = on_progress
+        self.track_memory = track_memory
+        self.records = []
+
+    @property
+    def completed(self):
+        return len(self.records)
+
+    @contextmanager
+    def stage(self, name):
+        if self.on_progress is not None:
+            self.on_progress(self.completed / len(self.stages), name)
+
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            mem_start = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if self.track_memory:
+                peak = tracemalloc.get_traced_memory()[1] - mem_start
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self.records.append({
+                'stage': name,
+                'seconds': elapsed,
+                'peak_bytes': peak,
+            })
+            if self.on_progress is not None:
+                self.on_progress(self.completed / len(self.stages), name)
+
+    @property
+    def total_seconds(self):
+        return sum(r['seconds'] for r in self.records)
+
+    def to_frame(self):
+        """Return the recorded timings as a display-ready table."""
+        table = pd.DataFrame({
+            'Этап': [r['stage'] for r in self.records],
+            'Время (мс)': [r['seconds'] * 1000 for r in self.records],
+            'Пик памяти (МБ)': [
+                r['peak_bytes'] / 2**20 if r['peak_bytes'] is not None else None
+                for r in self.records
+            ],
+        })
+        return table
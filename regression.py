@@ -0,0 +1,232 @@
+"""Batched multi-response least squares.
+
+All response columns that share the same rows are fitted with one matrix
+solve instead of one ``stats.linregress`` call per metric: the design
+terms are centred and scaled, a single cross-product of ``[terms, Y]``
+is formed with BLAS, and the normal equations are solved by Cholesky.
+Centring keeps the system well conditioned for the low-degree models used
+here, while the data is only read once.  Models can use any of the mix
+factors, polynomial terms and pairwise interactions, and every fit comes
+with standard errors, R² and prediction intervals for all responses.
+SciPy is only imported when a model is actually fitted or evaluated.
+"""
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+RESPONSES = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)']
+
+
+def design_matrix(X, factors, degree=1, interactions=False):
+    """Polynomial design matrix for the columns of ``X``; returns ``(A, terms)``.
+
+    The matrix is column-major so that every term is contiguous in memory.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    terms = ['1']
+    columns = []
+    for power in range(1, degree + 1):
+        for j, name in enumerate(factors):
+            terms.append(name if power == 1 else f"{name}^{power}")
+            columns.append((j,) * power)
+    if interactions:
+        for i, j in combinations(range(len(factors)), 2):
+            terms.append(f"{factors[i]}·{factors[j]}")
+            columns.append((i, j))
+
+    A = np.empty((len(X), len(terms)), order='F')
+    A[:, 0] = 1.0
+    for position, product in enumerate(columns, 1):
+        np.copyto(A[:, position], X[:, product[0]])
+        for j in product[1:]:
+            A[:, position] *= X[:, j]
+    return A, terms
+
+
+class RegressionResult:
+    """Coefficients and fit statistics of a multi-response linear model.
+
+    ``coef`` and ``stderr`` have one row per design term (the intercept
+    first) and one column per response.  Terms dropped as collinear with
+    earlier ones (e.g. a factor that never varies) have a zero coefficient
+    and a NaN standard error.
+    """
+
+    def __init__(self, factors, responses, degree, interactions, terms):
+        self.factors = list(factors)
+        self.responses = list(responses)
+        self.degree = degree
+        self.interactions = interactions
+        self.terms = terms
+        p, m = len(terms), len(responses)
+        self.coef = np.zeros((p, m))
+        self.stderr = np.full((p, m), np.nan)
+        self.r_squared = np.full(m, np.nan)
+        self.sigma = np.full(m, np.nan)
+        self.n_obs = np.zeros(m, dtype=int)
+        self.dof = np.zeros(m, dtype=int)
+        # Per response: the solved system, kept for prediction intervals.
+        self._systems = [None] * m
+
+    def design(self, X):
+        return design_matrix(X, self.factors, self.degree, self.interactions)[0]
+
+    def predict(self, X, alpha=None):
+        """Predict every response at the rows of ``X``.
+
+        Returns an ``(n, m)`` array, or ``(mean, low, high)`` with
+        ``1 - alpha`` prediction intervals when ``alpha`` is given.
+        """
+        A = self.design(X)
+        mean = A @ self.coef
+        if alpha is None:
+            return mean
+
+        from scipy import stats
+
+        half = np.full_like(mean, np.nan)
+        for k, system in enumerate(self._systems):
+            if system is None or self.dof[k] <= 0:
+                continue
+            half[:, k] = (stats.t.ppf(1 - alpha / 2, self.dof[k]) * self.sigma[k]
+                          * np.sqrt(1 + system.leverage(A)))
+        return mean, mean - half, mean + half
+
+    def table(self):
+        """Coefficients and standard errors of every response, one row per term."""
+        p, m = self.coef.shape
+        return pd.DataFrame({
+            'Параметр': np.repeat(self.responses, p),
+            'Член модели': np.tile(self.terms, m),
+            'Коэффициент': self.coef.T.ravel(),
+            'Ст. ошибка': self.stderr.T.ravel(),
+        })
+
+
+class _NormalSystem:
+    """Cholesky factor of the centred, scaled normal equations of one design."""
+
+    def __init__(self, n, keep, mean, scale, chol):
+        self.n = n
+        self.keep = keep
+        self.mean = mean
+        self.scale = scale
+        self.chol = chol
+
+    def _standardize(self, A):
+        return (A[:, 1:][:, self.keep] - self.mean) / self.scale
+
+    def leverage(self, A):
+        """Diagonal of the hat matrix for new design rows ``A``."""
+        if not len(self.keep):
+            return np.full(len(A), 1 / self.n)
+        from scipy import linalg
+
+        V = linalg.solve_triangular(self.chol, self._standardize(A).T, lower=True)
+        return 1 / self.n + np.einsum('ij,ij->j', V, V)
+
+
+# Relative size below which a term's residual variance marks it as collinear.
+COLLINEARITY_TOL = 1e-10
+
+
+def _independent_terms(gram):
+    """Greedily keep terms, in order, that are not linear combinations of earlier ones."""
+    from scipy import linalg
+
+    keep = []
+    chol = np.zeros((0, 0))
+    for j in range(len(gram)):
+        if keep:
+            row = linalg.solve_triangular(chol, gram[keep, j], lower=True)
+            residual = gram[j, j] - row @ row
+        else:
+            row = np.zeros(0)
+            residual = gram[j, j]
+        if residual > COLLINEARITY_TOL * max(gram[j, j], 1.0):
+            size = len(keep)
+            grown = np.zeros((size + 1, size + 1))
+            grown[:size, :size] = chol
+            grown[size, :size] = row
+            grown[size, size] = np.sqrt(residual)
+            chol = grown
+            keep.append(j)
+    return np.array(keep, dtype=int), chol
+
+
+def _solve(A, Y, result, columns):
+    """Fit the responses ``columns`` (all sharing the rows of ``A``) in one solve."""
+    from scipy import linalg
+
+    n, q = len(A), A.shape[1] - 1
+    mean_t = A[:, 1:].mean(axis=0)
+    mean_y = Y.mean(axis=0)
+
+    # One pass over the data: the cross-product of the standardised terms and
+    # the centred responses holds everything the fit needs.
+    Z = np.empty((n, q + Y.shape[1]), order='F')
+    np.subtract(A[:, 1:], mean_t, out=Z[:, :q])
+    np.subtract(Y, mean_y, out=Z[:, q:])
+    scale = np.sqrt(np.einsum('ij,ij->j', Z[:, :q], Z[:, :q]))
+    # A factor that never varies only leaves rounding noise after centring.
+    varying = scale > 1e-9 * np.sqrt(n) * np.maximum(np.abs(mean_t), 1e-300)
+    scale[~varying] = 1.0
+    Z[:, :q] /= scale
+    gram = Z.T @ Z
+    gxx, gxy, tss = gram[:q, :q], gram[:q, q:], np.diag(gram)[q:]
+
+    keep, chol = _independent_terms(np.where(np.outer(varying, varying), gxx, 0.0))
+    beta = linalg.cho_solve((chol, True), gxy[keep]) if len(keep) else np.zeros((0, len(columns)))
+    rss = np.maximum(tss - np.einsum('ij,ij->j', beta, gxy[keep]), 0.0)
+    dof = n - len(keep) - 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = np.sqrt(rss / dof) if dof > 0 else np.full(len(columns), np.nan)
+        r_squared = np.where(tss > 0, 1 - rss / tss, np.nan)
+
+    system = _NormalSystem(n, keep, mean_t[keep], scale[keep], chol)
+    if len(keep):
+        chol_inv = linalg.solve_triangular(chol, np.eye(len(keep)), lower=True)
+        unscaled_var = np.einsum('ij,ij->j', chol_inv, chol_inv)
+        shift = chol_inv @ (mean_t[keep] / scale[keep])
+        intercept_var = 1 / n + shift @ shift
+    else:
+        unscaled_var = np.zeros(0)
+        intercept_var = 1 / n
+
+    slopes = beta / scale[keep][:, None]
+    for j, k in enumerate(columns):
+        result.coef[1 + keep, k] = slopes[:, j]
+        result.coef[0, k] = mean_y[j] - mean_t[keep] @ slopes[:, j]
+        result.stderr[1 + keep, k] = sigma[j] * np.sqrt(unscaled_var) / scale[keep]
+        result.stderr[0, k] = sigma[j] * np.sqrt(intercept_var)
+        result.r_squared[k] = r_squared[j]
+        result.sigma[k] = sigma[j]
+        result.n_obs[k] = n
+        result.dof[k] = dof
+        result._systems[k] = system
+
+
+def fit(df, factors=('Cement_share (%)',), responses=RESPONSES, degree=1, interactions=False):
+    """Fit all ``responses`` against ``factors`` on the raw rows of ``df``."""
+    factors, responses = list(factors), list(responses)
+    X = df[factors].to_numpy(np.float64, na_value=np.nan)
+    Y = df[responses].to_numpy(np.float64, na_value=np.nan)
+
+    rows = ~np.isnan(X).any(axis=1)
+    if not rows.all():
+        X, Y = X[rows], Y[rows]
+    A, terms = design_matrix(X, factors, degree, interactions)
+    result = RegressionResult(factors, responses, degree, interactions, terms)
+
+    missing = np.isnan(Y)
+    complete = np.flatnonzero(~missing.any(axis=0))
+    if len(complete) and len(A):
+        _solve(A, Y[:, complete], result, complete)
+    # Responses with gaps are fitted on their own rows.
+    for k in np.flatnonzero(missing.any(axis=0)):
+        observed = ~missing[:, k]
+        if observed.any():
+            _solve(A[observed], Y[observed][:, [k]], result, [k])
+    return result
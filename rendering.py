@@ -0,0 +1,101 @@
+"""Bounded-size rendering of large point clouds.
+
+Plotly ships every point to the browser as JSON, so big datasets are
+reduced on the server before a figure is built: scatter clouds are
+density-binned to a point budget (one representative per occupied cell,
+with the number of specimens it stands for), ordered series are reduced
+with Largest-Triangle-Three-Buckets, per-point text labels are dropped
+above a threshold and 2D scatters switch to WebGL traces.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_POINT_BUDGET = 5_000
+
+# Above this many points 2D scatters are drawn with WebGL (Scattergl).
+WEBGL_THRESHOLD = 1_000
+
+# Above this many points per-point text labels are not emitted.
+TEXT_LIMIT = 200
+
+
+def density_sample(coords, budget, groups=None):
+    """Pick at most ~``budget`` representative rows of a point cloud.
+
+    ``coords`` is an ``(n, d)`` array.  Space is cut into a regular grid
+    with about ``budget`` cells (shared between ``groups`` if given) and the
+    first point of every occupied cell is kept, so sparse regions and
+    outliers survive while dense clusters are thinned.  Returns the kept
+    row positions and how many rows each of them represents.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    n, d = coords.shape
+    if n <= budget:
+        return np.arange(n), np.ones(n, dtype=np.int64)
+
+    n_groups = 1
+    if groups is not None:
+        group_codes, uniques = pd.factorize(groups)
+        # Missing groups (code -1) get a group of their own.
+        n_groups = len(uniques) + 1
+        group_codes = np.where(group_codes < 0, len(uniques), group_codes)
+    else:
+        group_codes = np.zeros(n, dtype=np.int64)
+
+    finite = np.isfinite(coords).all(axis=1)
+    low = np.nanmin(np.where(finite[:, None], coords, np.nan), axis=0)
+    high = np.nanmax(np.where(finite[:, None], coords, np.nan), axis=0)
+    span = np.where(high > low, high - low, 1.0)
+
+    bins = max(int((budget / n_groups) ** (1 / d)), 1)
+    cells = np.clip(((coords - low) / span * bins).astype(np.int64), 0, bins - 1)
+    cells[~finite] = 0
+
+    # Flatten (group, cell...) into one integer key per row.
+    key = group_codes.astype(np.int64)
+    for axis in range(d):
+        key = key * bins + cells[:, axis]
+
+    _, first, counts = np.unique(key, return_index=True, return_counts=True)
+    return first, counts
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of an ordered series.
+
+    Returns the indices of the kept points; the first and last point are
+    always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        # Twice the triangle area of (previous kept, candidate, next bucket mean).
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def reduce_frame(df, columns, budget, groups=None):
+    """Density-sample ``df`` on ``columns``; adds a 'Образцов' count column."""
+    positions, counts = density_sample(
+        df[columns].to_numpy(np.float64, na_value=np.nan),
+        budget,
+        None if groups is None else df[groups].to_numpy(),
+    )
+    reduced = df.iloc[positions].copy()
+    reduced['Образцов'] = counts
+    return reduced
@@ -0,0 +1,103 @@
+"""Excel report writer.
+
+Rows are streamed into xlsxwriter in ``constant_memory`` mode: each row is
+flushed to a temporary file as soon as it is written, so memory use stays
+flat no matter how many specimens the report contains.
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from ingest import decimal_values
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+CHUNK_ROWS = 10_000
+
+
+def conclusions_table(summary):
+    """Rows of the 'Выводы' sheet built from the analysis summary.
+
+    Values are numbers rounded as shown in the app, with the unit in a
+    column of its own, so that exports can be read back without parsing.
+    """
+    def gain(param):
+        return round((float(summary[f'max_{param}']) / float(summary[f'min_{param}']) - 1) * 100, 1)
+
+    return pd.DataFrame({
+        'Параметр': [
+            'Оптимальная доля цемента',
+            'Максимальная прочность Rc28',
+            'Максимальная прочность Rt',
+            'Максимальная прочность Rras',
+            'Водовяжущее отношение W/B',
+            'Подвижность смеси PGR',
+            'Улучшение Rc28',
+            'Улучшение Rt',
+            'Улучшение Rras'
+        ],
+        'Значение': [
+            float(summary['max_cement']),
+            round(float(summary['max_rc28']), 1),
+            round(float(summary['max_rt']), 1),
+            round(float(summary['max_rras']), 1),
+            round(float(summary['optimal_wb']), 3),
+            round(float(summary['optimal_pgr']), 1),
+            gain('rc28'),
+            gain('rt'),
+            gain('rras')
+        ],
+        'Единица': ['%', 'МПа', 'МПа', 'МПа', '', 'см', '%', '%', '%']
+    }).astype({'Значение': 'float64'})
+
+
+def write_frame(workbook, sheet_name, frame, header_format=None):
+    """Stream a data frame into a new worksheet, one chunk of rows at a time.
+
+    In ``constant_memory`` mode rows must be written in order, which is
+    exactly how the chunks are produced.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(col) for col in frame.columns], header_format)
+
+    row = 1
+    for start in range(0, len(frame), CHUNK_ROWS):
+        chunk = frame.iloc[start:start + CHUNK_ROWS]
+        # float32 columns are written at their decimal value (17.7, not 17.700000762939453).
+        decimals = {col: decimal_values(chunk[col]) for col in chunk.columns if chunk[col].dtype == np.float32}
+        if decimals:
+            chunk = chunk.assign(**decimals)
+        # Missing values become None so xlsxwriter leaves the cell empty.
+        values = chunk.astype(object).where(chunk.notna(), None).to_numpy().tolist()
+        for record in values:
+            worksheet.write_row(row, 0, record)
+            row += 1
+
+    worksheet.freeze_panes(1, 0)
+    return worksheet
+
+
+def build_excel_report(df, df_avg, summary):
+    """Create Excel report with all data and analysis, returned as bytes."""
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+
+    write_frame(workbook, 'Экспериментальные данные', df, header_format)
+    write_frame(workbook, 'Средние значения', df_avg, header_format)
+    write_frame(workbook, 'Выводы', conclusions_table(summary), header_format)
+
+    workbook.close()
+    return output.getvalue()
+
+
+def build_summary_report(frame, sheet_name='Сводка'):
+    """Single-sheet workbook with one row per analysed file, returned as bytes."""
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    write_frame(workbook, sheet_name, frame, header_format)
+    workbook.close()
+    return output.getvalue()
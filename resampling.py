@@ -0,0 +1,366 @@
+"""Bootstrap and permutation uncertainty for the headline results.
+
+The optimum cement share, the percentage gains and the regression slopes
+in the conclusions are point estimates; this module puts confidence
+intervals on them.  Specimens are resampled within each cement share
+(the design is kept fixed), and every statistic is a function of a few
+weighted sums per share, so a whole block of resamples is one weight
+matrix times the per-row sufficient statistics, a single BLAS call per
+share.  Small shares are resampled exactly (multinomial counts); large
+ones use the Poisson bootstrap, whose weights are looked up from raw
+16-bit random words instead of drawing and counting indices.  Blocks can
+be spread over a process pool, and resampling stops early once the
+interval endpoints no longer move.
+
+Permutation tests compare two experiments by shuffling their labels
+within each cement share, and stop early once the p-value is clearly on
+one side of the significance level.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from analysis import AVG_COLUMNS, STRENGTH_PARAMS
+
+STRENGTHS = [param for param, _ in STRENGTH_PARAMS]
+
+N_RESAMPLES = 10_000
+
+# Resamples between two convergence checks, and the least before stopping early.
+CHECK_EVERY = 500
+MIN_RESAMPLES = 1_000
+
+# Interval endpoints that move less than this fraction of the interval width
+# between two checks are considered converged.
+TOLERANCE = 0.02
+
+# Weights held in memory per block: resamples x rows of the largest share.
+BLOCK_CELLS = 1 << 22
+
+# Shares with fewer specimens are resampled exactly instead of with Poisson
+# weights, which could leave a small share empty.
+POISSON_MIN_ROWS = 100
+
+
+def _poisson_table(bits=16):
+    """Poisson(1) variates indexed by a uniform ``bits``-bit integer (inverse CDF)."""
+    probabilities = [math.exp(-1) / math.factorial(k) for k in range(16)]
+    cdf = np.cumsum(probabilities)
+    u = (np.arange(1 << bits) + 0.5) / (1 << bits)
+    return np.searchsorted(cdf, u).astype(np.uint8)
+
+
+POISSON_TABLE = _poisson_table()
+
+
+class _Design:
+    """Rows grouped by cement share with their per-row sufficient statistics.
+
+    For every metric ``m`` the columns of ``stats`` are ``[present,
+    present·y, present·y²]`` with ``y`` centred on the metric mean, so the
+    weighted column sums of a share give its count, mean and spread under
+    any resampling weights.
+    """
+
+    def __init__(self, df, metrics=AVG_COLUMNS):
+        self.metrics = list(metrics)
+        share = df['Cement_share (%)'].to_numpy(np.float64, na_value=np.nan)
+        rows = np.flatnonzero(~np.isnan(share))
+        order = rows[np.argsort(share[rows], kind='stable')]
+        # Positions of the grouped rows in ``df``.
+        self.order = order
+        self.levels, self.sizes = np.unique(share[order], return_counts=True)
+        self.bounds = np.concatenate([[0], np.cumsum(self.sizes)])
+
+        Y = df[self.metrics].to_numpy(np.float64, na_value=np.nan)[order]
+        present = ~np.isnan(Y)
+        self.center = np.array([np.nanmean(Y[:, k]) if present[:, k].any() else 0.0
+                                for k in range(len(self.metrics))])
+        Yc = np.where(present, Y - self.center, 0.0)
+        stats = np.empty((len(order), 3 * len(self.metrics)))
+        stats[:, 0::3] = present
+        stats[:, 1::3] = Yc
+        stats[:, 2::3] = Yc * Yc
+        self.stats = stats
+        # Resampled sums are accumulated in single precision; the data is centred.
+        self.stats32 = stats.astype(np.float32)
+
+    @property
+    def n_rows(self):
+        return int(self.bounds[-1])
+
+    def sums(self, weights=None):
+        """Weighted column sums per share, ``(n_blocks, n_shares, n_stats)``.
+
+        Without ``weights`` these are the plain sums of the original data.
+        """
+        if weights is None:
+            return np.add.reduceat(self.stats, self.bounds[:-1], axis=0)[None]
+        return np.stack([w @ self.stats32[a:b] for w, a, b in
+                         zip(weights, self.bounds[:-1], self.bounds[1:])], axis=1).astype(np.float64)
+
+
+def _share_weights(rng, n_resamples, size):
+    """Resampling weights of one share, ``(n_resamples, size)``."""
+    if size >= POISSON_MIN_ROWS:
+        n = n_resamples * size
+        words = rng.bit_generator.random_raw(-(-n // 4)).view(np.uint16)[:n]
+        return POISSON_TABLE[words].reshape(n_resamples, size).astype(np.float32)
+    index = rng.integers(0, size, (n_resamples, size))
+    index += np.arange(n_resamples)[:, None] * size
+    counts = np.bincount(index.ravel(), minlength=n_resamples * size)
+    return counts.reshape(n_resamples, size).astype(np.float32)
+
+
+def _statistics(design, sums):
+    """Every bootstrapped statistic from the per-share sums of each resample.
+
+    Returns a dict of arrays with one leading entry per resample:
+    ``means`` ``(b, shares, metrics)`` and, per strength parameter, the
+    trend ``slope`` and ``r_squared`` against cement share, the relative
+    ``gain`` of the best share over the worst and, for Rc28, the
+    ``optimum`` share.
+    """
+    count, s1, s2 = sums[..., 0::3], sums[..., 1::3], sums[..., 2::3]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = design.center + s1 / count
+
+        # Simple regression on cement share, from the per-share sums; the share
+        # is constant within a group, so its moments only need the counts.
+        x = (design.levels - design.levels.mean())[None, :, None]
+        n = count.sum(axis=1)
+        sx, sxx = (count * x).sum(axis=1), (count * x * x).sum(axis=1)
+        sy, syy, sxy = s1.sum(axis=1), s2.sum(axis=1), (s1 * x).sum(axis=1)
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        slope = cov / var_x
+        r_squared = cov * cov / (var_x * var_y)
+
+        filled = np.where(np.isnan(means), -np.inf, means)
+        best = filled.max(axis=1)
+        worst = np.where(np.isnan(means), np.inf, means).min(axis=1)
+        gain = best / worst - 1
+
+    result = {'means': means}
+    for param in STRENGTHS:
+        k = design.metrics.index(param)
+        result[('slope', param)] = slope[:, k]
+        result[('r_squared', param)] = r_squared[:, k]
+        result[('gain', param)] = gain[:, k]
+    rc28 = design.metrics.index('Rc28 (МПа)')
+    result[('optimum', 'Rc28 (МПа)')] = design.levels[filled[:, :, rc28].argmax(axis=1)]
+    return result
+
+
+def _bootstrap_block(design, task):
+    seed, n_resamples = task
+    rng = np.random.default_rng(seed)
+    weights = [_share_weights(rng, n_resamples, size) for size in design.sizes]
+    return _statistics(design, design.sums(weights))
+
+
+_worker_design = None
+
+
+def _init_worker(design):
+    global _worker_design
+    _worker_design = design
+
+
+def _worker_block(task):
+    return _bootstrap_block(_worker_design, task)
+
+
+def _block_size(design):
+    return int(np.clip(BLOCK_CELLS // max(int(design.sizes.max()), 1), 1, CHECK_EVERY))
+
+
+def _run_blocks(block, tasks, pool):
+    if pool is None:
+        return [block(task) for task in tasks]
+    return list(pool.map(block, tasks))
+
+
+def _concat(results):
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+
+class BootstrapResult:
+    """Point estimates and bootstrap distributions of the headline statistics.
+
+    ``samples`` maps every statistic of ``_statistics`` to its resampled
+    values; ``estimate`` holds the same statistics on the original data.
+    ``converged`` tells whether resampling stopped early because the
+    intervals had stabilised.
+    """
+
+    LABELS = {
+        'slope': "Наклон тренда {param}, на 1% цемента",
+        'r_squared': "R² тренда {param}",
+        'gain': "Прирост {param}, лучшая доля против худшей",
+        'optimum': "Оптимальная доля цемента по {param}",
+    }
+
+    def __init__(self, design, estimate, samples, confidence, converged):
+        self.levels = design.levels
+        self.metrics = design.metrics
+        self.estimate = estimate
+        self.samples = samples
+        self.confidence = confidence
+        self.converged = converged
+
+    @property
+    def n_resamples(self):
+        return len(self.samples['means'])
+
+    def _quantiles(self, values, axis=0):
+        alpha = 1 - self.confidence
+        return np.nanquantile(values, [alpha / 2, 1 - alpha / 2], axis=axis)
+
+    def interval(self, name):
+        """``(low, high)`` percentile interval of a scalar statistic, e.g. ``('slope', 'Rt (МПа)')``."""
+        low, high = self._quantiles(self.samples[name])
+        return float(low), float(high)
+
+    def optimum_frequencies(self, param='Rc28 (МПа)'):
+        """Share of resamples in which each cement share was the optimum."""
+        optimum = self.samples[('optimum', param)]
+        return pd.Series([np.mean(optimum == level) for level in self.levels],
+                         index=self.levels, name='Доля бутстреп-выборок')
+
+    def means_table(self):
+        """Mean and interval of every metric per cement share, in long format."""
+        low, high = self._quantiles(self.samples['means'])
+        estimate = self.estimate['means'][0]
+        shares, metrics = len(self.levels), len(self.metrics)
+        return pd.DataFrame({
+            'Cement_share (%)': np.repeat(self.levels, metrics),
+            'Параметр': np.tile(self.metrics, shares),
+            'Среднее': estimate.ravel(),
+            'Нижняя граница': low.ravel(),
+            'Верхняя граница': high.ravel(),
+        })
+
+    def table(self):
+        """Estimate and interval of every scalar statistic, one row each."""
+        rows = []
+        for name in self.samples:
+            if name == 'means':
+                continue
+            kind, param = name
+            low, high = self.interval(name)
+            rows.append({
+                'Показатель': self.LABELS[kind].format(param=param),
+                'Оценка': float(self.estimate[name][0]),
+                'Нижняя граница': low,
+                'Верхняя граница': high,
+            })
+        return pd.DataFrame(rows)
+
+
+def _stable(previous, current, tolerance):
+    """True when no interval endpoint moved by more than ``tolerance`` of its width."""
+    width = np.abs(current[1] - current[0])
+    moved = np.abs(current - previous).max(axis=0)
+    return bool(np.all((moved <= tolerance * width) | (moved == 0) | np.isnan(moved)))
+
+
+def bootstrap(df, n_resamples=N_RESAMPLES, confidence=0.95, seed=0, processes=None,
+              tolerance=TOLERANCE, min_resamples=MIN_RESAMPLES):
+    """Bootstrap the group means, trends, gains and optimum of ``df``.
+
+    Specimens are resampled within each cement share.  Up to
+    ``n_resamples`` resamples are drawn in blocks; every ``CHECK_EVERY``
+    resamples the intervals of the scalar statistics are compared with the
+    previous check and resampling stops once they are stable (pass
+    ``tolerance=0`` to always draw all of them).  Results only depend on
+    ``seed``, not on the number of ``processes``.
+    """
+    design = _Design(df)
+    estimate = _statistics(design, design.sums())
+    size = _block_size(design)
+    seeds = np.random.SeedSequence(seed)
+
+    pool = None
+    block = partial(_bootstrap_block, design)
+    if processes and processes > 1 and design.n_rows * n_resamples > BLOCK_CELLS:
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(design,))
+        block = _worker_block
+
+    results, drawn, previous, converged = [], 0, None, False
+    try:
+        while drawn < n_resamples:
+            tasks = []
+            target = min(n_resamples, drawn + max(CHECK_EVERY, size))
+            while drawn < target:
+                tasks.append((seeds.spawn(1)[0], min(size, target - drawn)))
+                drawn += tasks[-1][1]
+            results.extend(_run_blocks(block, tasks, pool))
+            if drawn < min_resamples or not tolerance:
+                continue
+            samples = _concat(results)
+            scalars = np.column_stack([samples[name] for name in samples if name != 'means'])
+            current = np.nanquantile(scalars, [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+            if previous is not None and _stable(previous, current, tolerance):
+                converged = True
+                break
+            previous = current
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return BootstrapResult(design, estimate, _concat(results), confidence, converged)
+
+
+def permutation_test(df, experiments, metrics=STRENGTHS, n_resamples=N_RESAMPLES, alpha=0.05,
+                     seed=0, min_resamples=MIN_RESAMPLES):
+    """Stratified permutation test of the mean difference between two experiments.
+
+    Experiment labels are shuffled within each cement share, so
+    differences explained by the shares tested are not attributed to the
+    experiment.  Resampling stops early once every p-value is more than
+    three Monte Carlo standard errors away from ``alpha``.  Returns a frame
+    with the observed difference ``experiments[0] - experiments[1]`` and
+    the two-sided p-value of every metric.
+    """
+    first, second = experiments
+    subset = df[df['Experiment'].isin([first, second])]
+    design = _Design(subset, metrics)
+    labels = (subset['Experiment'] == first).to_numpy(np.float64)[design.order]
+
+    present, values = design.stats[:, 0::3], design.stats[:, 1::3]
+    total_n, total_sum = present.sum(axis=0), values.sum(axis=0)
+
+    def difference(in_first):
+        n1, s1 = in_first @ present, in_first @ values
+        n2, s2 = total_n - n1, total_sum - s1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return s1 / n1 - s2 / n2
+
+    observed = difference(labels[None])[0]
+    size = _block_size(design)
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(len(metrics))
+    drawn = 0
+    while drawn < n_resamples:
+        b = min(size, n_resamples - drawn)
+        shuffled = np.empty((b, design.n_rows))
+        for a, z in zip(design.bounds[:-1], design.bounds[1:]):
+            shuffled[:, a:z] = rng.permuted(np.broadcast_to(labels[a:z], (b, z - a)), axis=1)
+        exceed += (np.abs(difference(shuffled)) >= np.abs(observed) - 1e-12).sum(axis=0)
+        drawn += b
+        p = np.where(np.isnan(observed), np.nan, (exceed + 1) / (drawn + 1))
+        decided = np.isnan(p) | (np.abs(p - alpha) > 3 * np.sqrt(p * (1 - p) / drawn))
+        if drawn >= min_resamples and decided.all():
+            break
+
+    return pd.DataFrame({
+        'Параметр': list(metrics),
+        'Разность средних': observed,
+        'p-значение': p,
+        'Перестановок': drawn,
+    })
@@ -0,0 +1,400 @@
+"""Process-wide result cache shared by all sessions of the app.
+
+``st.cache_data`` pickles every result and hands each caller its own
+unpickled copy, so thirty sessions looking at the same dataset hold
+thirty copies of every frame and report, and its bound is an entry count
+rather than memory.  ``SharedCache`` instead keeps one object per result
+for the whole server process: every session gets the same object (callers
+must treat it as read-only), entries are evicted least-recently-used once
+their total size exceeds a byte budget, and concurrent requests for the
+same key wait for the first computation instead of repeating it.
+
+``SessionRegistry`` records how much memory each session holds outside
+the shared cache, so the app can enforce a per-session limit and the
+admin page can show who uses what.
+"""
+import hashlib
+import inspect
+import io
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+MB = 2 ** 20
+
+# Budget of the shared cache and the memory one session may hold; both can
+# be set per deployment through the environment.
+CACHE_MAX_BYTES = int(os.environ.get('CONCRETE_CACHE_MB', 1024)) * MB
+SESSION_MAX_BYTES = int(os.environ.get('CONCRETE_SESSION_MB', 512)) * MB
+
+# Sessions not seen for this long are dropped from the registry.
+SESSION_IDLE_SECONDS = 3600
+
+
+def _owner(array):
+    """The object that owns the memory of ``array``: the end of its ``base`` chain."""
+    while isinstance(array, np.ndarray) and array.base is not None:
+        array = array.base
+    return array
+
+
+def _claim(owner, seen, buffers):
+    """Mark ``owner`` as counted; False when it already was or is shared (its id is in ``seen``)."""
+    if id(owner) in seen:
+        return False
+    seen.add(id(owner))
+    if buffers is not None:
+        buffers.add(id(owner))
+    return True
+
+
+def _buffer_size(array, seen, buffers):
+    """Bytes of the buffer behind ``array``, or 0 when it is already counted or shared."""
+    owner = _owner(array)
+    if not _claim(owner, seen, buffers):
+        return 0
+    return owner.nbytes if isinstance(owner, np.ndarray) else array.nbytes
+
+
+def _usage(obj):
+    """Bytes of a Series or Index by pandas' own count, without the Series index."""
+    return int(obj.memory_usage(deep=True) if isinstance(obj, pd.Index) else obj.memory_usage(deep=True, index=False))
+
+
+def _pandas_size(obj, seen, buffers):
+    """Bytes of the buffers behind a pandas object that are not in ``seen``.
+
+    Shallow copies, slices and column selections share their NumPy
+    buffers with the frame they were taken from, so the buffers are
+    counted (and looked up in ``seen``) rather than the pandas objects.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return _pandas_size(obj.index, seen, buffers) + sum(
+            _values_size(obj.iloc[:, position], seen, buffers) for position in range(obj.shape[1])
+        )
+    if isinstance(obj, pd.Series):
+        return _pandas_size(obj.index, seen, buffers) + _values_size(obj, seen, buffers)
+    if isinstance(obj, (pd.RangeIndex, pd.MultiIndex)):
+        return _usage(obj) if _claim(obj, seen, buffers) else 0
+    return _values_size(obj, seen, buffers)
+
+
+def _values_size(obj, seen, buffers):
+    """Bytes of the values of a Series or Index, without the Series index."""
+    values = obj.array
+    if isinstance(values, pd.Categorical):
+        categories = values.categories
+        return (_buffer_size(values.codes, seen, buffers)
+                + (_usage(categories) if _claim(categories, seen, buffers) else 0))
+    if not isinstance(obj.dtype, np.dtype):
+        # Arrow-backed and masked arrays have no NumPy base; views share the array object.
+        return _usage(obj) if _claim(values, seen, buffers) else 0
+    array = obj.to_numpy(copy=False)
+    nbytes = _buffer_size(array, seen, buffers)
+    if nbytes and obj.dtype == object:
+        # The Python objects the array points to.
+        nbytes += _usage(obj) - array.nbytes
+    return nbytes
+
+
+def deep_size(obj, seen=None, buffers=None):
+    """Approximate number of bytes held by ``obj`` and everything it references.
+
+    Objects whose id is in ``seen`` are not counted (again); pass the ids of
+    shared objects to measure only what is private to their holder.  Arrays
+    are counted by the buffer that owns their memory, whose id is also added
+    to ``buffers`` when given.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        return _pandas_size(obj, seen, buffers)
+    if isinstance(obj, np.ndarray):
+        return _buffer_size(obj, seen, buffers)
+    seen.add(id(obj))
+    if isinstance(obj, io.BytesIO):
+        return obj.getbuffer().nbytes
+    if isinstance(obj, (str, bytes, bytearray, int, float, complex, bool)) or obj is None:
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(k, seen, buffers) + deep_size(v, seen, buffers)
+                                        for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_size(item, seen, buffers) for item in obj)
+    if hasattr(obj, 'to_plotly_json'):
+        return deep_size(obj.to_plotly_json(), seen, buffers)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + deep_size(vars(obj), seen, buffers)
+    return sys.getsizeof(obj)
+
+
+def _key_digest(parts):
+    """Stable digest of the hashed arguments; they only need to be picklable."""
+    return hashlib.blake2b(pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('namespace', 'value', 'nbytes', 'buffers', 'hits', 'created', 'last_used', 'compute_seconds')
+
+    def __init__(self, namespace, value, nbytes, buffers, compute_seconds):
+        self.namespace = namespace
+        self.value = value
+        self.nbytes = nbytes
+        self.buffers = buffers
+        self.hits = 0
+        self.created = self.last_used = time.time()
+        self.compute_seconds = compute_seconds
+
+
+class SharedCache:
+    """Byte-bounded LRU cache of computed results, safe to use from many threads."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {}
+
+    def _count(self, namespace, event, n=1):
+        counters = self._stats.setdefault(
+            namespace, {'hits': 0, 'misses': 0, 'evictions': 0, 'rejected': 0, 'compute_seconds': 0.0}
+        )
+        counters[event] += n
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, namespace, key, compute, on_miss=None):
+        """Return the cached value of ``(namespace, key)``, computing it once if needed.
+
+        ``on_miss`` is an optional context-manager factory (e.g. a spinner)
+        entered only while the value is being computed.
+        """
+        full_key = (namespace, key)
+        while True:
+            with self._lock:
+                entry = self._entries.get(full_key)
+                if entry is not None:
+                    self._entries.move_to_end(full_key)
+                    entry.hits += 1
+                    entry.last_used = time.time()
+                    self._count(namespace, 'hits')
+                    return entry.value
+                pending = self._pending.get(full_key)
+                if pending is None:
+                    pending = self._pending[full_key] = threading.Event()
+                    self._count(namespace, 'misses')
+                    break
+            # Another session is computing the same result; wait and look again.
+            pending.wait()
+
+        try:
+            start = time.perf_counter()
+            with (on_miss() if on_miss is not None else nullcontext()):
+                value = compute()
+            seconds = time.perf_counter() - start
+            self._store(full_key, value, seconds)
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(full_key).set()
+
+    def get(self, namespace, key, default=None):
+        """The cached value of ``(namespace, key)``, or ``default`` without computing anything."""
+        full_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(full_key)
+            entry.hits += 1
+            entry.last_used = time.time()
+            self._count(namespace, 'hits')
+            return entry.value
+
+    def contains(self, namespace, key):
+        """Whether ``(namespace, key)`` is cached, without counting a hit."""
+        with self._lock:
+            return (namespace, key) in self._entries
+
+    def _store(self, full_key, value, seconds):
+        namespace = full_key[0]
+        buffers = set()
+        nbytes = deep_size(value, buffers=buffers)
+        with self._lock:
+            self._count(namespace, 'compute_seconds', seconds)
+            if nbytes > self.max_bytes:
+                self._count(namespace, 'rejected')
+                return
+            self._entries[full_key] = _Entry(namespace, value, nbytes, buffers, seconds)
+            self._bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self._count(entry.namespace, 'evictions')
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def value_ids(self):
+        """Ids of the cached values and of their array buffers, to exclude them from per-session accounting.
+
+        The buffers make views of cached frames (shallow copies, slices,
+        selected columns) count as shared too.
+        """
+        with self._lock:
+            ids = {id(entry.value) for entry in self._entries.values()}
+            for entry in self._entries.values():
+                ids |= entry.buffers
+            return ids
+
+    def memoize(self, func=None, *, on_miss=None):
+        """Decorator caching ``func`` here, keyed by its name and arguments.
+
+        As with ``st.cache_data``, arguments whose name starts with an
+        underscore are not part of the key; pass a content hash instead.
+        """
+        if func is None:
+            return lambda f: self.memoize(f, on_miss=on_miss)
+        signature = inspect.signature(func)
+        namespace = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            parts = tuple((name, value) for name, value in bound.arguments.items()
+                          if not name.startswith('_'))
+            return self.get_or_compute(namespace, _key_digest(parts),
+                                       lambda: func(*args, **kwargs), on_miss)
+
+        return wrapper
+
+    def stats(self):
+        """Hit, miss and eviction counts and cached bytes per cached function."""
+        with self._lock:
+            sizes, counts = {}, {}
+            for entry in self._entries.values():
+                sizes[entry.namespace] = sizes.get(entry.namespace, 0) + entry.nbytes
+                counts[entry.namespace] = counts.get(entry.namespace, 0) + 1
+            rows = []
+            for namespace, counters in sorted(self._stats.items()):
+                calls = counters['hits'] + counters['misses']
+                rows.append({
+                    'Функция': namespace.rsplit('.', 1)[-1],
+                    'Записей': counts.get(namespace, 0),
+                    'Размер (МБ)': sizes.get(namespace, 0) / MB,
+                    'Попаданий': counters['hits'],
+                    'Промахов': counters['misses'],
+                    'Доля попаданий': counters['hits'] / calls if calls else np.nan,
+                    'Вытеснено': counters['evictions'],
+                    'Слишком крупных': counters['rejected'],
+                    'Время вычислений (с)': counters['compute_seconds'],
+                })
+        return pd.DataFrame(rows, columns=['Функция', 'Записей', 'Размер (МБ)', 'Попаданий', 'Промахов',
+                                           'Доля попаданий', 'Вытеснено', 'Слишком крупных',
+                                           'Время вычислений (с)'])
+
+    def entries(self):
+        """Every cached entry, most recently used first."""
+        with self._lock:
+            rows = [{
+                'Функция': namespace.rsplit('.', 1)[-1],
+                'Ключ': key[:12],
+                'Размер (МБ)': entry.nbytes / MB,
+                'Попаданий': entry.hits,
+                'Создана': pd.Timestamp(entry.created, unit='s'),
+                'Последнее обращение': pd.Timestamp(entry.last_used, unit='s'),
+                'Вычисление (мс)': entry.compute_seconds * 1000,
+            } for (namespace, key), entry in reversed(self._entries.items())]
+        return pd.DataFrame(rows, columns=['Функция', 'Ключ', 'Размер (МБ)', 'Попаданий', 'Создана',
+                                           'Последнее обращение', 'Вычисление (мс)'])
+
+
+class SessionRegistry:
+    """Memory held privately by every live session, as last reported by the session."""
+
+    def __init__(self, max_bytes=SESSION_MAX_BYTES, idle_seconds=SESSION_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def report(self, session_id, nbytes, trimmed=False):
+        """Record the usage of one session; returns True when it is over the limit."""
+        now = time.time()
+        with self._lock:
+            record = self._sessions.setdefault(session_id, {'bytes': 0, 'peak': 0, 'trimmed': 0})
+            record['bytes'] = nbytes
+            record['peak'] = max(record['peak'], nbytes)
+            record['trimmed'] += int(trimmed)
+            record['last_seen'] = now
+            for stale in [sid for sid, r in self._sessions.items() if now - r['last_seen'] > self.idle_seconds]:
+                del self._sessions[stale]
+        return nbytes > self.max_bytes
+
+    def sessions(self):
+        with self._lock:
+            rows = [{
+                'Сессия': session_id[:8],
+                'Память (МБ)': record['bytes'] / MB,
+                'Пик (МБ)': record['peak'] / MB,
+                'Очисток по лимиту': record['trimmed'],
+                'Последняя активность': pd.Timestamp(record['last_seen'], unit='s'),
+            } for session_id, record in self._sessions.items()]
+        return pd.DataFrame(rows, columns=['Сессия', 'Память (МБ)', 'Пик (МБ)', 'Очисток по лимиту',
+                                           'Последняя активность'])
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(record['bytes'] for record in self._sessions.values())
+
+
+_cache = None
+_registry = None
+_singleton_lock = threading.Lock()
+
+
+def get_cache():
+    """The cache shared by every session of this server process."""
+    global _cache
+    with _singleton_lock:
+        if _cache is None:
+            _cache = SharedCache()
+        return _cache
+
+
+def get_registry():
+    """The session registry of this server process."""
+    global _registry
+    with _singleton_lock:
+        if _registry is None:
+            _registry = SessionRegistry()
+        return _registry
@@ -0,0 +1,367 @@
+"""Statistical process control of strength over time, per mix design.
+
+A subgroup is the set of specimens of one mix tested in one batch on one
+day.  For every mix and metric ``ControlChart`` runs an X̄-R chart whose
+centre line and sigma come from the trailing window of the last
+``WINDOW`` in-control subgroups (sigma = mean of R / d2(n)), an EWMA and
+a tabular CUSUM of the standardized subgroup means, and the Western
+Electric run rules.  Mixes tested one specimen at a time get an
+individuals chart instead: the range of a single value is meaningless, so
+the moving range between consecutive specimens takes its place (sigma =
+mean of MR / d2(2)).  All state lives in fixed-size ring buffers with
+running sums, so adding a subgroup costs O(1) however long the history is.
+
+``SpcIndex`` feeds the charts from the store: on every update it compares
+the batch revisions with the ones it has seen and only aggregates (in
+SQLite) the subgroups of new batches.  A batch that was replaced or edited
+afterwards makes it rebuild all charts from scratch.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from groupstats import MIX_FACTORS
+from ingest import KEYS
+
+METRICS = ['Rc28 (МПа)', 'Rt (МПа)', 'Rras (МПа)']
+
+# Subgroups the control limits are estimated from, and the fewest with
+# which a chart starts to judge new subgroups.
+WINDOW = 25
+MIN_BASELINE = 10
+
+# Subgroups kept per chart for plotting and alerts.
+HISTORY = 5000
+
+EWMA_LAMBDA = 0.2
+EWMA_L = 3.0
+
+# Reference value and decision interval of the CUSUM, in standard errors.
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+
+# Control chart constants d2(n) and d3(n) of the range of n normal values.
+D2 = {2: 1.128, 3: 1.693, 4: 2.059, 5: 2.326, 6: 2.534, 7: 2.704, 8: 2.847, 9: 2.970, 10: 3.078,
+      11: 3.173, 12: 3.258, 13: 3.336, 14: 3.407, 15: 3.472, 16: 3.532, 17: 3.588, 18: 3.640,
+      19: 3.689, 20: 3.735, 21: 3.778, 22: 3.819, 23: 3.858, 24: 3.895, 25: 3.931}
+D3 = {2: 0.853, 3: 0.888, 4: 0.880, 5: 0.864, 6: 0.848, 7: 0.833, 8: 0.820, 9: 0.808, 10: 0.797,
+      11: 0.787, 12: 0.778, 13: 0.770, 14: 0.763, 15: 0.756, 16: 0.750, 17: 0.744, 18: 0.739,
+      19: 0.733, 20: 0.729, 21: 0.724, 22: 0.720, 23: 0.716, 24: 0.712, 25: 0.708}
+
+# Rules checked for every new subgroup; the bit of a rule is its position.
+RULES = ('beyond_limits', 'two_of_three', 'four_of_five', 'run_of_eight', 'trend_of_six',
+         'range', 'ewma', 'cusum')
+
+RULE_NAMES = {
+    'beyond_limits': "точка за пределами 3σ",
+    'two_of_three': "2 из 3 точек за 2σ",
+    'four_of_five': "4 из 5 точек за 1σ",
+    'run_of_eight': "8 точек подряд по одну сторону",
+    'trend_of_six': "6 точек подряд растут или падают",
+    'range': "размах вне пределов",
+    'ewma': "EWMA вне пределов",
+    'cusum': "CUSUM выше порога",
+}
+
+# The longest run a rule looks at.
+RULE_SPAN = 8
+
+POINT_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'), ('batch', 'i8'), ('n', 'i8'), ('mean', 'f8'), ('range', 'f8'),
+    ('center', 'f8'), ('sigma', 'f8'), ('ewma', 'f8'), ('ewma_limit', 'f8'),
+    ('cusum_high', 'f8'), ('cusum_low', 'f8'), ('rules', 'u2'),
+])
+
+BASELINE_DTYPE = np.dtype([('n', 'i8'), ('mean', 'f8'), ('sigma', 'f8')])
+
+
+def _bit(rule):
+    return 1 << RULES.index(rule)
+
+
+# Rules after which a subgroup is kept out of the baseline, so that a
+# shifted process does not widen its own limits.
+OUT_OF_CONTROL = _bit('beyond_limits') | _bit('range')
+
+
+class RingBuffer:
+    """Fixed-capacity FIFO of records in a structured array; the oldest record is overwritten.
+
+    The array grows by doubling up to ``capacity``, so thousands of short
+    histories do not each reserve the full capacity.
+    """
+
+    def __init__(self, capacity, dtype):
+        self.capacity = capacity
+        self._data = np.zeros(min(capacity, 16), dtype=dtype)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, record):
+        """Add ``record``; returns the record it displaced, or None."""
+        if self._size < self.capacity:
+            # Until the buffer is full the records are stored in order from 0.
+            if self._size == len(self._data):
+                self._data = np.concatenate([self._data, np.zeros_like(self._data)])[:self.capacity]
+            self._data[self._size] = record
+            self._size += 1
+            return None
+        evicted = self._data[self._start].copy()
+        self._data[self._start] = record
+        self._start = (self._start + 1) % self.capacity
+        return evicted
+
+    def values(self):
+        """The records, oldest first."""
+        if self._size < self.capacity:
+            return self._data[:self._size].copy()
+        return np.roll(self._data, -self._start)
+
+
+class ControlChart:
+    """X̄-R, EWMA and CUSUM state of one metric of one mix, updated one subgroup at a time."""
+
+    def __init__(self, window=WINDOW, history=HISTORY):
+        self.points = RingBuffer(history, POINT_DTYPE)
+        self._baseline = RingBuffer(window, BASELINE_DTYPE)
+        # The last standardized means; eight floats are faster in a deque than in NumPy.
+        self._recent = deque(maxlen=RULE_SPAN)
+        # Running sums over the baseline window.
+        self._sum_n = 0
+        self._sum_total = 0.0
+        self._sum_sigma = 0.0
+        self._n_sigma = 0
+        self._ewma = 0.0
+        self._ewma_steps = 0
+        self._cusum_high = 0.0
+        self._cusum_low = 0.0
+        # Size and mean of the last subgroup, for moving ranges of single specimens.
+        self._previous = (0, np.nan)
+        self.n_subgroups = 0
+
+    def limits(self):
+        """Centre line and within-subgroup sigma of the baseline; NaN until it is long enough."""
+        if len(self._baseline) < MIN_BASELINE or self._n_sigma < 2:
+            return np.nan, np.nan
+        return self._sum_total / self._sum_n, self._sum_sigma / self._n_sigma
+
+    def _run_rules(self):
+        u = list(self._recent)
+        rules = 0
+        if abs(u[-1]) > 3:
+            rules |= _bit('beyond_limits')
+        for side in (1, -1):
+            v = [side * value for value in u]
+            if v[-1] > 2 and sum(value > 2 for value in v[-3:]) >= 2:
+                rules |= _bit('two_of_three')
+            if v[-1] > 1 and len(v) >= 5 and sum(value > 1 for value in v[-5:]) >= 4:
+                rules |= _bit('four_of_five')
+            if len(v) >= 8 and all(value > 0 for value in v[-8:]):
+                rules |= _bit('run_of_eight')
+            if len(v) >= 6 and all(a < b for a, b in zip(v[-6:], v[-5:])):
+                rules |= _bit('trend_of_six')
+        return rules
+
+    def add(self, date, batch, n, mean, value_range, std=np.nan):
+        """Judge one subgroup against the limits of the ones before it, then record it.
+
+        Sigma is estimated from the range for subgroups of up to 25
+        specimens and from the standard deviation ``std`` of larger ones,
+        where the range is inefficient.  A single specimen is judged by its
+        moving range to the previous one when that was single too, and the
+        moving range is recorded as its range.
+        """
+        center, sigma = self.limits()
+        range_n = n
+        if n == 1:
+            previous_n, previous_mean = self._previous
+            value_range = abs(mean - previous_mean) if previous_n == 1 else np.nan
+            range_n = 2
+        self._previous = (n, mean)
+        range_sigma = value_range / D2[range_n] if range_n in D2 else std
+        rules = 0
+        ewma_limit = np.nan
+        if sigma > 0:
+            u = float((mean - center) / (sigma / np.sqrt(n)))
+            self._recent.append(u)
+            rules |= self._run_rules()
+
+            self._ewma_steps += 1
+            self._ewma = EWMA_LAMBDA * u + (1 - EWMA_LAMBDA) * self._ewma
+            ewma_limit = EWMA_L * np.sqrt(EWMA_LAMBDA / (2 - EWMA_LAMBDA)
+                                          * (1 - (1 - EWMA_LAMBDA) ** (2 * self._ewma_steps)))
+            if abs(self._ewma) > ewma_limit:
+                rules |= _bit('ewma')
+
+            self._cusum_high = max(0.0, self._cusum_high + u - CUSUM_K)
+            self._cusum_low = max(0.0, self._cusum_low - u - CUSUM_K)
+            cusum = (self._cusum_high, self._cusum_low)
+            if max(cusum) > CUSUM_H:
+                rules |= _bit('cusum')
+                # Restart after a signal, so that one shift is reported once.
+                self._cusum_high = self._cusum_low = 0.0
+
+            if range_n in D2 and abs(value_range - D2[range_n] * sigma) > 3 * D3[range_n] * sigma:
+                rules |= _bit('range')
+        else:
+            cusum = (np.nan, np.nan)
+
+        self.points.append((date, batch, n, mean, value_range, center, sigma,
+                            self._ewma if sigma > 0 else np.nan, ewma_limit, *cusum, rules))
+        self.n_subgroups += 1
+        if not rules & OUT_OF_CONTROL:
+            self._enter_baseline((n, mean, range_sigma))
+        return rules
+
+    def _enter_baseline(self, record):
+        n, mean, range_sigma = record
+        self._sum_n += n
+        self._sum_total += n * mean
+        if np.isfinite(range_sigma):
+            self._sum_sigma += range_sigma
+            self._n_sigma += 1
+        evicted = self._baseline.append(record)
+        if evicted is not None:
+            self._sum_n -= int(evicted['n'])
+            self._sum_total -= float(evicted['n'] * evicted['mean'])
+            if np.isfinite(evicted['sigma']):
+                self._sum_sigma -= float(evicted['sigma'])
+                self._n_sigma -= 1
+
+    def frame(self):
+        """Recorded subgroups with their control limits, oldest first."""
+        points = pd.DataFrame(self.points.values())
+        n = points['n'].to_numpy(np.float64)
+        sigma, center = points['sigma'].to_numpy(), points['center'].to_numpy()
+        # The range of a single specimen is its moving range, a range of two values.
+        range_n = points['n'].clip(lower=2)
+        d2 = range_n.map(D2).to_numpy(np.float64, na_value=np.nan)
+        d3 = range_n.map(D3).to_numpy(np.float64, na_value=np.nan)
+        return points.assign(
+            ucl=center + 3 * sigma / np.sqrt(n),
+            lcl=center - 3 * sigma / np.sqrt(n),
+            range_center=d2 * sigma,
+            range_ucl=(d2 + 3 * d3) * sigma,
+            range_lcl=np.maximum(d2 - 3 * d3, 0) * sigma,
+        )
+
+
+def describe_rules(codes):
+    """Readable rule names for each code of ``codes``."""
+    return ["; ".join(RULE_NAMES[rule] for position, rule in enumerate(RULES) if code >> position & 1)
+            for code in codes]
+
+
+class SpcIndex:
+    """Control charts of every mix and metric, fed incrementally from an ``ExperimentStore``."""
+
+    def __init__(self, metrics=METRICS, keys=MIX_FACTORS, window=WINDOW, history=HISTORY):
+        self.metrics = list(metrics)
+        self.keys = list(keys)
+        self.window = window
+        self.history = history
+        self.charts = {}
+        self._revisions = {}
+        self._last = None
+        self._lock = threading.Lock()
+
+    def update(self, store):
+        """Feed the subgroups of batches not seen yet; returns how many subgroups were added."""
+        with self._lock:
+            revisions = store.batch_revisions()
+            stale = any(revisions.get(batch) != revision for batch, revision in self._revisions.items())
+            new = [batch for batch in revisions if batch not in self._revisions]
+            if not stale and not new:
+                return 0
+            # A (re)build reads every batch without a filter: an IN list of the
+            # whole history would outgrow SQLite's limit on bound parameters.
+            rebuild = stale or not self._revisions
+            subgroups = self._subgroups(store, revisions, None if rebuild else new)
+            if not rebuild and len(subgroups) and self._last is not None:
+                first = (subgroups['tested_on'].iat[0], subgroups['batch_id'].iat[0])
+                # A batch dated before the charted history cannot be appended; start over.
+                if first < self._last:
+                    stale = True
+                    subgroups = self._subgroups(store, revisions, None)
+            if stale:
+                self.charts, self._last = {}, None
+            self._feed(subgroups)
+            self._revisions = revisions
+            return len(subgroups)
+
+    def _subgroups(self, store, revisions, batch_ids):
+        """Subgroups of ``batch_ids`` (all when None), limited to the batches of ``revisions``.
+
+        Batches stored after ``revisions`` was read are left for the next update.
+        """
+        subgroups = store.subgroups(self.keys, self.metrics, batch_ids=batch_ids)
+        if batch_ids is None:
+            subgroups = subgroups[subgroups['batch_id'].isin(list(revisions))].reset_index(drop=True)
+        return subgroups
+
+    def _feed(self, subgroups):
+        if not len(subgroups):
+            return
+        dates = subgroups['tested_on'].to_numpy().astype('datetime64[D]')
+        batches = subgroups['batch_id'].to_numpy()
+        mixes = list(subgroups[self.keys].itertuples(index=False, name=None))
+        for metric in self.metrics:
+            key = KEYS[metric]
+            counts = subgroups[f'n_{key}'].to_numpy()
+            means = subgroups[f'mean_{key}'].to_numpy(np.float64)
+            ranges = subgroups[f'range_{key}'].to_numpy(np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                variances = (subgroups[f'square_{key}'].to_numpy(np.float64) - means ** 2) * counts / (counts - 1)
+            stds = np.sqrt(np.maximum(variances, 0))
+            for row in np.flatnonzero(counts > 0):
+                chart = self.charts.get((mixes[row], metric))
+                if chart is None:
+                    chart = self.charts[(mixes[row], metric)] = ControlChart(self.window, self.history)
+                chart.add(dates[row], batches[row], int(counts[row]), means[row], ranges[row], stds[row])
+        self._last = (subgroups['tested_on'].iat[-1], subgroups['batch_id'].iat[-1])
+
+    def frame(self, mix, metric):
+        """The control chart frame of one mix and metric (see ``ControlChart.frame``)."""
+        with self._lock:
+            return self.charts[(mix, metric)].frame()
+
+    def mixes(self, metric):
+        """Charted mixes of ``metric`` with their subgroup and alert counts, longest history first."""
+        rows = []
+        with self._lock:
+            for (mix, chart_metric), chart in self.charts.items():
+                if chart_metric != metric:
+                    continue
+                points = chart.points.values()
+                rows.append((*mix, chart.n_subgroups, points['date'][-1],
+                             int((points['rules'] != 0).sum()), bool(points['rules'][-1])))
+        table = pd.DataFrame(rows, columns=self.keys + ['Подгрупп', 'Последнее испытание', 'Сигналов',
+                                                        'Сигнал в последней подгруппе'])
+        return table.sort_values('Подгрупп', ascending=False, kind='stable').reset_index(drop=True)
+
+    def alerts(self, limit=100):
+        """The latest subgroups that broke a rule, over all charts, newest first."""
+        with self._lock:
+            histories = [(key, chart.points.values()) for key, chart in self.charts.items()]
+        tables = []
+        for (mix, metric), points in histories:
+            points = points[points['rules'] != 0][-limit:]
+            if len(points):
+                table = pd.DataFrame(points[['date', 'batch', 'n', 'mean', 'rules']])
+                tables.append(table.assign(**dict(zip(self.keys, mix)), metric=metric))
+        if not tables:
+            return pd.DataFrame(columns=['Дата', *self.keys, 'Показатель', 'Образцов', 'Среднее', 'Нарушения'])
+        alerts = pd.concat(tables, ignore_index=True).sort_values(['date', 'batch'], ascending=False).head(limit)
+        return pd.DataFrame({
+            'Дата': alerts['date'].to_numpy(),
+            **{key: alerts[key].to_numpy() for key in self.keys},
+            'Показатель': alerts['metric'].to_numpy(),
+            'Образцов': alerts['n'].to_numpy(),
+            'Среднее': alerts['mean'].to_numpy(),
+            'Нарушения': describe_rules(alerts['rules'].to_numpy()),
+        })
@@ -0,0 +1,329 @@
+"""Persistent SQLite store for specimens and test batches.
+
+Every upload (and the manual edits made in the app) is kept as a batch of
+specimens in a local SQLite database, so the lab history survives between
+sessions and a workbook is only parsed and inserted once: batches are
+keyed by the content hash of their source.  Specimens are indexed by
+cement share, experiment and test date, bulk inserts run as batched
+``executemany`` calls inside a single transaction, and group aggregates
+are computed by SQL instead of loading the rows into pandas.
+"""
+import datetime
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis import AVG_COLUMNS
+from ingest import (KEYS, NUMERIC_COLUMNS, OPTIONAL_COLUMNS, REQUIRED_COLUMNS, compact, decimal_values,
+                    optional_columns)
+
+STORE_PATH = Path(__file__).parent / 'data' / 'experiments.db'
+
+# Rows per executemany call during bulk inserts.
+INSERT_CHUNK = 10_000
+
+# Laboratory results the app ships with; they seed an empty store.
+SEED_DATA = {
+    'Cement_share (%)': [50, 60, 70, 80, 50, 60, 70, 80],
+    'W_B': [0.429, 0.429, 0.358, 0.286, 0.429, 0.429, 0.322, 0.268],
+    'Additive (%)': [0.09, 0.09, 0.10, 0.10, 0.09, 0.09, 0.10, 0.10],
+    'Fiber (%)': [0.40, 0.40, 0.40, 0.40, 0.40, 0.40, 0.40, 0.40],
+    'Rc28 (МПа)': [17.7, 18.1, 20.3, 22.9, 17.1, 18.3, 19.8, 22.6],
+    'Rt (МПа)': [1.7, 1.9, 2.1, 3.2, 1.6, 2.0, 2.3, 3.4],
+    'Rras (МПа)': [0.9, 1.0, 1.9, 2.5, 0.9, 1.1, 1.8, 2.9],
+    'PGR (см)': [7.2, 7.2, 7.4, 7.3, 7.3, 7.1, 7.5, 7.4],
+    'Experiment': ['Опыт 1', 'Опыт 1', 'Опыт 1', 'Опыт 1',
+                   'Опыт 2', 'Опыт 2', 'Опыт 2', 'Опыт 2']
+}
+
+SEED_KEY = 'seed'
+EDITOR_KEY = 'editor'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    data_hash TEXT,
+    created_on TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS specimens (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    tested_on TEXT NOT NULL,
+    cement_share REAL,
+    w_b REAL,
+    additive REAL,
+    fiber REAL,
+    rc28 REAL,
+    rt REAL,
+    rras REAL,
+    pgr REAL,
+    experiment TEXT,
+    rc1 REAL,
+    rc3 REAL,
+    rc7 REAL,
+    rc14 REAL,
+    rc90 REAL
+);
+CREATE INDEX IF NOT EXISTS specimens_cement_share ON specimens (cement_share);
+CREATE INDEX IF NOT EXISTS specimens_experiment ON specimens (experiment);
+CREATE INDEX IF NOT EXISTS specimens_tested_on ON specimens (tested_on);
+CREATE INDEX IF NOT EXISTS specimens_batch ON specimens (batch_id);
+"""
+
+
+def _float64(df, columns):
+    """``df[columns]`` as a float64 array, float32 columns at their decimal value."""
+    out = np.empty((len(df), len(columns)))
+    for j, col in enumerate(columns):
+        out[:, j] = decimal_values(df[col])
+    return out
+
+
+def _where(batch_ids=None, experiments=None, cement_range=None, date_range=None):
+    """SQL filter on the indexed specimen columns and its parameters."""
+    clauses, params = [], []
+    for column, values in (('batch_id', batch_ids), ('experiment', experiments)):
+        if values is not None:
+            values = list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+            params.extend(values)
+    if cement_range is not None:
+        clauses.append("cement_share BETWEEN ? AND ?")
+        params.extend(float(bound) for bound in cement_range)
+    if date_range is not None:
+        clauses.append("tested_on BETWEEN ? AND ?")
+        params.extend(str(bound) for bound in date_range)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class ExperimentStore:
+    """Specimens grouped into batches in a local SQLite database.
+
+    One connection is shared by all threads of the app, guarded by a lock;
+    the database runs in WAL mode so reads from other processes (e.g. the
+    batch CLI) do not block.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = Path(path)
+        if str(path) != ':memory:':
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._writes = 0
+
+    def _migrate(self):
+        """Add the curing-age and batch revision columns to databases created before they existed."""
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(specimens)")}
+        batch_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(batches)")}
+        with self._conn:
+            for col in OPTIONAL_COLUMNS:
+                if KEYS[col] not in existing:
+                    self._conn.execute(f"ALTER TABLE specimens ADD COLUMN {KEYS[col]} REAL")
+            if 'revision' not in batch_columns:
+                self._conn.execute("ALTER TABLE batches ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def revision(self):
+        """Changes whenever the data changes, through this store or another connection."""
+        with self._lock:
+            return self._writes, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @property
+    def empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT NOT EXISTS (SELECT 1 FROM specimens)").fetchone()[0] == 1
+
+    def seed(self):
+        """Insert the shipped laboratory results into an empty store."""
+        if self.empty:
+            self.put_batch(SEED_KEY, "Данные по умолчанию", pd.DataFrame(SEED_DATA))
+
+    def _insert(self, batch_id, tested_on, df):
+        numeric_columns = NUMERIC_COLUMNS + optional_columns(df.columns)
+        columns = [KEYS[col] for col in numeric_columns + ['Experiment']]
+        sql = (f"INSERT INTO specimens (batch_id, tested_on, {', '.join(columns)}) "
+               f"VALUES (?, ?, {', '.join('?' * len(columns))})")
+        numeric = _float64(df, numeric_columns)
+        experiment = df['Experiment'].astype(object).where(df['Experiment'].notna(), None).to_numpy()
+        for start in range(0, len(df), INSERT_CHUNK):
+            block = numeric[start:start + INSERT_CHUNK]
+            # SQLite stores NaN as NULL.
+            rows = ((batch_id, tested_on, *values, name) for values, name in
+                    zip(block.tolist(), experiment[start:start + INSERT_CHUNK]))
+            self._conn.executemany(sql, rows)
+
+    def put_batch(self, key, source, df, data_hash=None, tested_on=None):
+        """Store ``df`` as the batch ``key``, replacing its rows if the content changed.
+
+        Returns the batch id.  Re-sending the same content (same
+        ``data_hash``) is a no-op, so the app can call this on every rerun.
+        """
+        tested_on = str(tested_on or datetime.date.today())
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id, data_hash FROM batches WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                batch_id, stored_hash = row
+                if data_hash is not None and stored_hash == data_hash:
+                    return batch_id
+                self._conn.execute("DELETE FROM specimens WHERE batch_id = ?", (batch_id,))
+                self._conn.execute("UPDATE batches SET source = ?, data_hash = ?, revision = revision + 1 "
+                                   "WHERE id = ?",
+                                   (source, data_hash, batch_id))
+            else:
+                batch_id = self._conn.execute(
+                    "INSERT INTO batches (key, source, data_hash, created_on) VALUES (?, ?, ?, ?)",
+                    (key, source, data_hash, tested_on),
+                ).lastrowid
+            self._insert(batch_id, tested_on, df)
+            self._writes += 1
+        return batch_id
+
+    def _batch_id(self, key, source):
+        row = self._conn.execute("SELECT id FROM batches WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self._conn.execute(
+            "INSERT INTO batches (key, source, created_on) VALUES (?, ?, ?)",
+            (key, source, str(datetime.date.today())),
+        ).lastrowid
+
+    def apply_edits(self, before, after):
+        """Write the difference between two specimen frames indexed by specimen id.
+
+        Rows missing from ``after`` are deleted, changed rows are updated in
+        place, and rows whose index is not a stored id (added in the editor)
+        go into the manual-entry batch.  Returns the number of rows touched.
+        """
+        known = before.index
+        deleted = known.difference(after.index)
+        present = after.index.isin(known)
+        added = after[~present]
+        common = after[present]
+
+        columns = REQUIRED_COLUMNS + [col for col in optional_columns(after.columns) if col in before]
+        # Categorical experiments of two frames need not share their categories.
+        old = before.loc[common.index, columns].astype({'Experiment': object})
+        new = common[columns].astype({'Experiment': object})
+        changed = ~((old == new) | (old.isna() & new.isna())).all(axis=1)
+        updated = common[columns][changed.to_numpy()]
+        numeric = [col for col in columns if col != 'Experiment']
+        values = np.column_stack([_float64(updated, numeric).astype(object),
+                                  updated['Experiment'].astype(object).to_numpy()])
+
+        assignments = ', '.join(f"{KEYS[col]} = ?" for col in numeric + ['Experiment'])
+        with self._lock, self._conn:
+            # Batches whose rows change get a new revision, so that derived indexes rebuild them.
+            self._conn.executemany(
+                "UPDATE batches SET revision = revision + 1 WHERE id = (SELECT batch_id FROM specimens WHERE id = ?)",
+                ((int(i),) for i in deleted.union(updated.index)),
+            )
+            self._conn.executemany("DELETE FROM specimens WHERE id = ?",
+                                   ((int(i),) for i in deleted))
+            self._conn.executemany(
+                f"UPDATE specimens SET {assignments} WHERE id = ?",
+                ((*[None if pd.isna(v) else v for v in row], int(i))
+                 for i, row in zip(updated.index, values.tolist())),
+            )
+            if len(added):
+                batch_id = self._batch_id(EDITOR_KEY, "Ручной ввод")
+                self._insert(batch_id, str(datetime.date.today()), added)
+                self._conn.execute("UPDATE batches SET revision = revision + 1 WHERE id = ?", (batch_id,))
+            self._writes += 1
+        return len(deleted) + len(updated) + len(added)
+
+    def load(self, batch_ids=None, experiments=None, cement_range=None, date_range=None, limit=None):
+        """Specimens matching the filters, indexed by specimen id, in insertion order.
+
+        The frame is compacted like an upload (see ``ingest.compact``).
+        Curing-age columns are only included when some loaded specimen has them.
+        """
+        where, params = _where(batch_ids, experiments, cement_range, date_range)
+        columns = ', '.join(f'{key} AS "{col}"' for col, key in KEYS.items())
+        sql = f"SELECT id, {columns} FROM specimens{where} ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            df = pd.read_sql_query(sql, self._conn, params=params, index_col='id')
+        empty = [col for col in OPTIONAL_COLUMNS if df[col].isna().all()]
+        df = compact(df.drop(columns=empty))
+        df.index.name = None
+        return df
+
+    def batches(self):
+        """Every batch with its specimen count and test dates, newest first."""
+        sql = """
+            SELECT b.id, b.source, b.created_on, COUNT(s.id) AS n_rows,
+                   MIN(s.tested_on) AS first_test, MAX(s.tested_on) AS last_test
+            FROM batches b LEFT JOIN specimens s ON s.batch_id = b.id
+            GROUP BY b.id ORDER BY b.id DESC
+        """
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn)
+
+    def batch_revisions(self):
+        """Revision of every batch; it changes whenever rows of the batch are replaced or edited."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, revision FROM batches").fetchall())
+
+    def subgroups(self, keys, metrics, batch_ids=None):
+        """Specimen count, mean, range and mean square of ``metrics`` per batch, test date and group of ``keys``.
+
+        Rows are ordered by test date and batch, the order in which the
+        subgroups were tested; columns are ``batch_id``, ``tested_on``, the
+        keys and ``n_<key>``, ``mean_<key>``, ``range_<key>`` and the mean
+        square ``square_<key>`` for every metric, with the short keys of
+        ``ingest.KEYS``.
+        """
+        keys, metrics = list(keys), list(metrics)
+        where, params = _where(batch_ids=batch_ids)
+        group = ', '.join(['batch_id', 'tested_on'] + [KEYS[col] for col in keys])
+        selected = ['batch_id', 'tested_on'] + [f'{KEYS[col]} AS "{col}"' for col in keys]
+        for col in metrics:
+            key = KEYS[col]
+            selected += [f'COUNT({key}) AS n_{key}', f'AVG({key}) AS mean_{key}',
+                         f'MAX({key}) - MIN({key}) AS range_{key}', f'AVG({key} * {key}) AS square_{key}']
+        sql = (f"SELECT {', '.join(selected)} FROM specimens{where} "
+               f"GROUP BY {group} HAVING {' AND '.join(f'{KEYS[col]} IS NOT NULL' for col in keys)} "
+               f"ORDER BY tested_on, batch_id")
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def experiments(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT experiment FROM specimens WHERE experiment IS NOT NULL ORDER BY experiment"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def group_means(self, keys=('Cement_share (%)',), metrics=AVG_COLUMNS, **filters):
+        """Per-group specimen count and metric means, computed by SQLite.
+
+        ``filters`` are those of ``load``.  The result has the layout of
+        ``df.groupby(keys).mean().reset_index()`` plus an 'Образцов' column.
+        """
+        keys, metrics = list(keys), list(metrics)
+        where, params = _where(**filters)
+        group = ', '.join(KEYS[col] for col in keys)
+        selected = [f'{KEYS[col]} AS "{col}"' for col in keys]
+        selected += [f'AVG({KEYS[col]}) AS "{col}"' for col in metrics if col not in keys]
+        selected.append('COUNT(*) AS "Образцов"')
+        sql = (f"SELECT {', '.join(selected)} FROM specimens{where} "
+               f"GROUP BY {group} HAVING {' AND '.join(f'{KEYS[col]} IS NOT NULL' for col in keys)} "
+               f"ORDER BY {group}")
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
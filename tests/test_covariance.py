@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from covariance import CovarianceIndex
+
+COLUMNS = ['a', 'b', 'c']
+
+
+def _frame(n=200, seed=5):
+    rng = np.random.default_rng(seed)
+    a = rng.normal(1000, 1, n)
+    df = pd.DataFrame({'a': a, 'b': 2 * a + rng.normal(0, 0.5, n), 'c': rng.normal(0, 1, n)})
+    df.loc[rng.choice(n, 20, replace=False), 'b'] = np.nan
+    df.loc[rng.choice(n, 10, replace=False), 'c'] = np.nan
+    return df
+
+
+def test_hand_checked_pair():
+    index = CovarianceIndex.from_frame(pd.DataFrame({'a': [1.0, 2.0, 3.0], 'b': [2.0, 4.0, 6.0]}), ['a', 'b'])
+
+    # var(a) = 1, var(b) = 4, cov(a, b) = 2: a perfect correlation.
+    assert np.allclose(index.covariance().to_numpy(), [[1, 2], [2, 4]])
+    assert np.allclose(index.correlation().to_numpy(), 1)
+
+
+def test_matches_pandas_with_pairwise_missing_values():
+    df = _frame()
+    index = CovarianceIndex.from_frame(df, COLUMNS, chunk_rows=37)
+
+    pd.testing.assert_frame_equal(index.covariance(), df.cov(), rtol=1e-9)
+    pd.testing.assert_frame_equal(index.correlation(), df.corr(), rtol=1e-9)
+    assert index.counts.loc['b', 'c'] == (df['b'].notna() & df['c'].notna()).sum()
+
+
+def test_updates_match_a_full_recompute():
+    old = _frame()
+    new = old.copy()
+    new.loc[[3, 8], 'a'] = [1005.0, 995.0]          # edits
+    new.loc[10, 'b'] = np.nan                       # a value cleared
+    new = new.drop(index=range(50, 80))             # deleted rows
+    new.loc[500] = [1000.5, 2001.0, 0.3]            # an added row
+
+    index = CovarianceIndex.from_frame(old, COLUMNS)
+    index.update(old, new)
+
+    pd.testing.assert_frame_equal(index.covariance(), new.cov(), rtol=1e-9)
+    pd.testing.assert_frame_equal(index.correlation(), new.corr(), rtol=1e-9)
+
+
+def test_merged_chunks_with_different_shifts_match_the_whole():
+    df = _frame()
+    first = CovarianceIndex.from_frame(df.iloc[:60], COLUMNS)
+    second = CovarianceIndex.from_frame(df.iloc[60:] + 3.0, COLUMNS)
+    second.remove(df.iloc[60:] + 3.0)
+    second.add(df.iloc[60:])
+
+    merged = first.merge(second)
+
+    pd.testing.assert_frame_equal(merged.correlation(), df.corr(), rtol=1e-9)
+
+
+def test_a_constant_column_has_no_correlation():
+    df = pd.DataFrame({'a': [1.0, 2.0, 3.0, 4.0], 'b': [5.0, 5.0, 5.0, 5.0]})
+    index = CovarianceIndex.from_frame(df, ['a', 'b'])
+
+    assert np.isnan(index.correlation().loc['a', 'b'])
+    assert index.covariance().loc['b', 'b'] == 0
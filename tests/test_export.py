@@ -0,0 +1,35 @@
+from export import MAX_FINISHED_JOBS, ExportQueue
+from shared_cache import SharedCache
+
+
+def test_failed_exports_are_reported_once_and_can_be_retried():
+    queue = ExportQueue(SharedCache())
+    attempts = []
+
+    def build(progress):
+        attempts.append(progress)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        return b'data'
+
+    queue.submit('csv', 'hash', build).future.exception()
+    assert isinstance(queue.job('csv', 'hash').error, OSError)
+    assert queue.job('csv', 'hash') is None
+    assert queue.artifact('csv', 'hash') is None
+
+    queue.submit('csv', 'hash', build).future.result()
+    assert queue.artifact('csv', 'hash') == b'data'
+    assert queue.job('csv', 'hash') is None
+    assert len(attempts) == 2
+
+
+def test_finished_jobs_are_bounded():
+    queue = ExportQueue(SharedCache(max_bytes=0))
+    jobs = [queue.submit('csv', key, lambda progress: b'too large for the cache')
+            for key in range(MAX_FINISHED_JOBS + 5)]
+    for job in jobs:
+        job.future.result()
+
+    assert queue.job('csv', 0) is None
+    assert queue.artifact('csv', MAX_FINISHED_JOBS + 4) == b'too large for the cache'
+    assert sum(queue.job('csv', key) is not None for key in range(MAX_FINISHED_JOBS + 5)) == MAX_FINISHED_JOBS
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from groupstats import GroupStatsIndex, frame_delta
+
+KEYS = ['Cement_share (%)']
+METRICS = ['Rc28 (МПа)', 'Rt (МПа)']
+
+
+def _frame():
+    return pd.DataFrame({
+        'Cement_share (%)': [50, 50, 50, 60, 60, 70],
+        'Rc28 (МПа)': [1.0, 2.0, 3.0, 10.0, 12.0, 20.0],
+        'Rt (МПа)': [0.5, np.nan, 0.7, 1.0, 1.2, 2.0],
+    }, index=[1, 2, 3, 4, 5, 6])
+
+
+def test_describe_hand_checked():
+    stats = GroupStatsIndex.from_frame(_frame(), KEYS, METRICS).describe('Rc28 (МПа)')
+
+    assert stats['Cement_share (%)'].tolist() == [50, 60, 70]
+    assert stats['n'].tolist() == [3, 2, 1]
+    assert np.allclose(stats['mean'], [2.0, 11.0, 20.0])
+    # [1, 2, 3]: s = 1; [10, 12]: s = sqrt(2); a single specimen has no spread.
+    assert np.allclose(stats['std'].iloc[:2], [1.0, np.sqrt(2)])
+    assert np.isnan(stats['std'].iat[2])
+    # t(0.975, 2) = 4.3027: 2 ± 4.3027 / sqrt(3).
+    assert np.isclose(stats['ci_high'].iat[0], 2 + 4.302653 / np.sqrt(3), atol=1e-5)
+
+
+def test_means_skip_missing_values_like_groupby():
+    df = _frame()
+    expected = df.groupby(KEYS)[METRICS].mean().reset_index()
+
+    pd.testing.assert_frame_equal(GroupStatsIndex.from_frame(df, KEYS, METRICS).means(), expected,
+                                  check_dtype=False)
+
+
+def test_updates_match_a_full_recompute():
+    old = _frame()
+    new = old.copy()
+    new.loc[2, 'Rc28 (МПа)'] = 5.0           # edited value
+    new.loc[4, 'Cement_share (%)'] = 70      # moved to another group
+    new = new.drop(index=[6, 5])             # the 70 and 60 groups lose rows
+    new.loc[7] = [80, 30.0, 3.0]             # a new group
+
+    index = GroupStatsIndex.from_frame(old, KEYS, METRICS)
+    changed = index.update(old, new)
+    full = GroupStatsIndex.from_frame(new, KEYS, METRICS)
+
+    assert changed == 2 * 2 + 2 + 1          # two edited rows out and back in, two removed, one added
+    pd.testing.assert_frame_equal(index.means(), full.means(), check_dtype=False)
+    for metric in METRICS:
+        pd.testing.assert_frame_equal(index.describe(metric), full.describe(metric), check_dtype=False)
+    # The 60 group lost both rows and is gone.
+    assert index.means()['Cement_share (%)'].tolist() == [50, 70, 80]
+
+
+def test_frame_delta_lists_only_changed_rows():
+    old = _frame()
+    new = old.copy()
+    new.loc[3, 'Rt (МПа)'] = 0.9
+
+    removed, added = frame_delta(old, new, KEYS + METRICS)
+
+    assert removed.index.tolist() == added.index.tolist() == [3]
+    assert added.loc[3, 'Rt (МПа)'] == 0.9
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import optimizer
+from optimizer import Constraints, candidate_grid, grid_axes, grid_rows, optimize_mix
+
+
+def _specimens(n=60, seed=3):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Cement_share (%)': rng.choice([50, 60, 70, 80], n).astype(np.float64),
+        'W_B': rng.uniform(0.25, 0.35, n),
+        'Additive (%)': rng.uniform(0, 2, n),
+        'Fiber (%)': rng.uniform(0, 1, n),
+    })
+    df['Rc28 (МПа)'] = 10 + 0.15 * df['Cement_share (%)'] - 20 * (df['W_B'] - 0.3) + rng.normal(0, 0.5, n)
+    df['Rt (МПа)'] = 1 + 0.02 * df['Cement_share (%)'] + rng.normal(0, 0.1, n)
+    df['Rras (МПа)'] = 0.8 + 0.02 * df['Cement_share (%)'] + rng.normal(0, 0.1, n)
+    df['PGR (см)'] = 9 - 0.03 * df['Cement_share (%)'] + 5 * df['W_B'] + rng.normal(0, 0.2, n)
+    return df
+
+
+def test_grid_rows_match_the_full_grid():
+    bounds = np.array([[50, 80], [0.25, 0.35], [1, 1], [0, 1]])
+    axes = grid_axes(bounds, 4)
+    full = candidate_grid(bounds, 4)
+    assert full.shape == (4 * 4 * 1 * 4, 4)
+    assert np.array_equal(np.concatenate([grid_rows(axes, 0, 10), grid_rows(axes, 10, 64)]), full)
+
+
+def test_chunked_search_matches_one_chunk(monkeypatch):
+    df = _specimens()
+    constraints = Constraints(min_pgr=float(df['PGR (см)'].median()), wb_max=0.32)
+    whole = optimize_mix(df, constraints, resolution=9)
+
+    monkeypatch.setattr(optimizer, 'CHUNK_ROWS', 97)
+    chunked = optimize_mix(df, constraints, resolution=9)
+
+    assert chunked['evaluated'] == whole['evaluated'] == 9 ** 4
+    assert chunked['feasible'] == whole['feasible']
+    pd.testing.assert_series_equal(chunked['best'], whole['best'])
+    pd.testing.assert_frame_equal(chunked['pareto'], whole['pareto'])
+    pareto = whole['pareto']
+    assert (pareto['Rc28 (МПа) прогноз'].diff().dropna() > 0).all()
+    assert (pareto['Стоимость'].diff().dropna() >= 0).all()
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from groupstats import MIX_FACTORS
+from outliers import _bit, detect
+
+METRIC = 'Rc28 (МПа)'
+
+
+def _mixes(*groups):
+    """One mix per list of strength values, the mixes told apart by their cement share."""
+    rows = [{'Cement_share (%)': share, 'W_B': 0.3, 'Additive (%)': 1.0, 'Fiber (%)': 0.5, METRIC: value}
+            for share, values in zip(range(50, 100, 10), groups) for value in values]
+    return pd.DataFrame(rows)
+
+
+def _checks(result, row):
+    return {check for check in ('mad', 'grubbs', 'dixon', 'cv') if result.codes[row] & _bit(0, check)}
+
+
+def test_one_high_value_among_four_replicates():
+    # mean 10.825, s = 1.4523: G = 2.175 / 1.4523 = 1.498 > 1.481;
+    # Q = (13.0 - 10.2) / (13.0 - 10.0) = 0.933 > 0.829;
+    # median 10.15, MAD 0.1: z = 0.6745 * 2.85 / 0.1 = 19.2 > 3.5.
+    result = detect(_mixes([10.0, 10.1, 10.2, 13.0]), metrics=[METRIC], keys=MIX_FACTORS)
+
+    assert _checks(result, 3) == {'mad', 'grubbs', 'dixon', 'cv'}
+    assert result.outliers.tolist() == [False, False, False, True]
+    table = result.mix_table()
+    assert table['Выбросов'].tolist() == [1]
+    assert np.isclose(table['MAD'].iat[0], 0.1)
+
+
+def test_mix_with_zero_mad():
+    # MAD = median(0, 0, 0, 5) = 0, so the robust z-score is not applied;
+    # G = (25 - 21.25) / 2.5 = 1.5 > 1.481 and Q = 5 / 5 = 1 > 0.829 still are.
+    result = detect(_mixes([20.0, 20.0, 20.0, 25.0]), metrics=[METRIC], keys=MIX_FACTORS)
+
+    assert _checks(result, 3) == {'grubbs', 'dixon', 'cv'}
+    assert result.outliers.tolist() == [False, False, False, True]
+    assert result.mix_table()['MAD'].iat[0] == 0
+
+
+def test_low_value_among_ten_replicates():
+    values = [30.0, 30.2, 29.9, 30.1, 30.0, 29.8, 30.3, 30.1, 29.9, 26.0]
+    # Q = (29.8 - 26.0) / (30.3 - 26.0) = 0.884 > 0.466 for ten replicates.
+    result = detect(_mixes(values), metrics=[METRIC], keys=MIX_FACTORS)
+
+    assert {'grubbs', 'dixon', 'mad'} <= _checks(result, 9)
+    assert np.flatnonzero(result.outliers).tolist() == [9]
+
+
+def test_consistent_and_small_mixes_are_not_flagged():
+    # The second mix has two replicates, too few for any test.
+    result = detect(_mixes([20.0, 20.2, 19.9, 20.1, 20.05], [15.0, 25.0]), metrics=[METRIC], keys=MIX_FACTORS)
+
+    assert not result.flagged[:5].any()
+    assert not result.outliers.any()
+    # Its scatter is still reported: CV = 7.07 / 20 = 35 %.
+    assert result.flagged[5:].all()
+    assert _checks(result, 5) == {'cv'}
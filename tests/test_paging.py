@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from ingest import compact
+from paging import merge_edits, with_page_ids
+
+
+def _slice():
+    df = compact(pd.DataFrame({
+        'Cement_share (%)': [50, 60, 70], 'W_B': [0.3, 0.3, 0.3], 'Additive (%)': [1, 1, 1],
+        'Fiber (%)': [0, 0, 0], 'Rc28 (МПа)': [17.7, 18.0, 19.0], 'Rt (МПа)': [2, 2, 2],
+        'Rras (МПа)': [3, 3, 3], 'PGR (см)': [7, 7, 7], 'Experiment': ['Опыт 1', 'Опыт 1', 'Опыт 2'],
+    }))
+    return df.set_axis([10, 11, 12])
+
+
+def _edit(df, page, cells):
+    """What the editor reports after ``cells`` ({position: {column: value}}) were typed into ``page``."""
+    edited = page.reset_index(drop=True).astype(object)
+    for position, row in cells.items():
+        for col, value in row.items():
+            edited.loc[position, col] = value
+    return merge_edits(df, page, with_page_ids(page, edited), {'edited_rows': cells})
+
+
+def test_edits_extend_categories_and_upcast_whole_number_columns():
+    df = _slice()
+    page = df.iloc[[1, 2]]
+
+    out = _edit(df, page, {0: {'Experiment': 'Опыт 3'}, 1: {'Cement_share (%)': 55.5}})
+
+    assert out.loc[11, 'Experiment'] == 'Опыт 3'
+    assert list(out['Experiment'].cat.categories) == ['Опыт 1', 'Опыт 2', 'Опыт 3']
+    assert out['Cement_share (%)'].dtype == np.float32
+    assert out['Cement_share (%)'].tolist() == [50, 60, 55.5]
+    # The slice the edits were made on is left alone.
+    assert df['Cement_share (%)'].dtype == np.uint8
+    assert df.loc[11, 'Experiment'] == 'Опыт 1'
+
+
+def test_whole_number_edits_keep_the_compact_dtype():
+    df = _slice()
+
+    out = _edit(df, df.iloc[[0]], {0: {'Cement_share (%)': 80, 'Rc28 (МПа)': 21.5}})
+
+    assert out['Cement_share (%)'].dtype == np.uint8
+    assert out.loc[10, 'Cement_share (%)'] == 80
+    assert out.loc[10, 'Rc28 (МПа)'] == np.float32(21.5)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import regression
+from regression import design_matrix
+
+
+def test_exact_line_is_recovered():
+    df = pd.DataFrame({'x': [1.0, 2.0, 3.0, 4.0], 'y': [5.0, 8.0, 11.0, 14.0]})
+
+    result = regression.fit(df, ['x'], ['y'])
+
+    assert np.allclose(result.coef[:, 0], [2.0, 3.0])
+    assert np.isclose(result.r_squared[0], 1.0)
+    assert result.dof[0] == 2
+
+
+def test_matches_least_squares():
+    rng = np.random.default_rng(11)
+    n = 80
+    df = pd.DataFrame({'x1': rng.uniform(50, 80, n), 'x2': rng.uniform(0.25, 0.35, n)})
+    df['y1'] = 5 + 0.2 * df['x1'] - 30 * df['x2'] + 0.01 * df['x1'] * df['x2'] + rng.normal(0, 0.3, n)
+    df['y2'] = 1 + 0.03 * df['x1'] ** 2 + rng.normal(0, 0.1, n)
+    df.loc[[4, 9], 'y2'] = np.nan
+
+    result = regression.fit(df, ['x1', 'x2'], ['y1', 'y2'], degree=2, interactions=True)
+
+    X = df[['x1', 'x2']].to_numpy()
+    A, _ = design_matrix(X, ['x1', 'x2'], 2, True)
+    for k, response in enumerate(['y1', 'y2']):
+        y = df[response].to_numpy()
+        rows = ~np.isnan(y)
+        coef, rss, *_ = np.linalg.lstsq(A[rows], y[rows], rcond=None)
+        dof = rows.sum() - A.shape[1]
+        cov = rss[0] / dof * np.linalg.inv(A[rows].T @ A[rows])
+        assert np.allclose(result.coef[:, k], coef, rtol=1e-7, atol=1e-9)
+        assert np.allclose(result.stderr[:, k], np.sqrt(np.diag(cov)), rtol=1e-6)
+        assert np.isclose(result.sigma[k], np.sqrt(rss[0] / dof))
+        assert result.n_obs[k] == rows.sum()
+
+
+def test_a_constant_factor_is_dropped():
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({'x': rng.uniform(0, 1, 20), 'fixed': 0.4})
+    df['y'] = 1 + 2 * df['x'] + rng.normal(0, 0.01, 20)
+
+    result = regression.fit(df, ['x', 'fixed'], ['y'])
+
+    assert result.coef[2, 0] == 0
+    assert np.isnan(result.stderr[2, 0])
+    assert np.isclose(result.coef[1, 0], 2, atol=0.05)
@@ -0,0 +1,28 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from report import build_excel_report
+
+
+def test_float32_values_are_written_at_their_decimal_value():
+    df = pd.DataFrame({
+        'Cement_share (%)': np.array([50, 60], dtype=np.uint8),
+        'Rc28 (МПа)': np.array([17.7, 22.8], dtype=np.float32),
+        'Experiment': pd.Categorical(['Опыт 1', 'Опыт 2']),
+    })
+    df_avg = pd.DataFrame({'Cement_share (%)': [50, 60],
+                           'Rc28 (МПа)': np.array([17.4, 22.8], dtype=np.float32)})
+    summary = {'max_cement': 60, 'min_cement': 50, 'max_rc28': 22.8, 'min_rc28': 17.4,
+               'max_rt': 3.4, 'min_rt': 1.7, 'max_rras': 2.9, 'min_rras': 0.9,
+               'optimal_wb': 0.268, 'optimal_pgr': 7.4}
+
+    workbook = load_workbook(BytesIO(build_excel_report(df, df_avg, summary)))
+
+    data = list(workbook['Экспериментальные данные'].iter_rows(min_row=2, values_only=True))
+    assert [row[1] for row in data] == [17.7, 22.8]
+    assert data[0][2] == 'Опыт 1'
+    means = list(workbook['Средние значения'].iter_rows(min_row=2, values_only=True))
+    assert [row[1] for row in means] == [17.4, 22.8]
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from shared_cache import SharedCache, deep_size
+
+
+def test_views_of_cached_frames_are_not_counted_as_private():
+    cache = SharedCache()
+    n = 100_000
+    cached = cache.get_or_compute('slice', 1, lambda: pd.DataFrame({
+        'Rc28 (МПа)': np.random.rand(n).astype(np.float32),
+        'Rt (МПа)': np.random.rand(n).astype(np.float32),
+        'Experiment': pd.Categorical(np.random.choice(['Опыт 1', 'Опыт 2'], n)),
+    }))
+    shared = cache.value_ids()
+    # Own bytes besides the arrays: a new RangeIndex and the like.
+    overhead = 1000
+
+    numbered = cached.copy(deep=False)
+    numbered.insert(0, '№', np.arange(1, n + 1, dtype=np.int64))
+    assert n * 8 <= deep_size(numbered, set(shared)) < n * 8 + overhead
+
+    edited = numbered.copy(deep=False)
+    edited.loc[[3], 'Rt (МПа)'] = 1.0
+    assert n * 12 <= deep_size(edited, set(shared)) < n * 12 + overhead
+
+    assert deep_size(cached.iloc[:10], set(shared)) < overhead
+    assert n * 12 <= deep_size([numbered, edited], set(shared)) < n * 12 + overhead
@@ -0,0 +1,56 @@
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from spc import MIN_BASELINE, ControlChart, SpcIndex, _bit
+from store import SEED_DATA, ExperimentStore
+
+
+def _feed(chart, values):
+    dates = np.datetime64('2026-01-01') + np.arange(len(values))
+    return [chart.add(date, batch, 1, value, 0.0) for batch, (date, value) in enumerate(zip(dates, values))]
+
+
+def test_single_specimen_subgroups_use_the_moving_range():
+    rng = np.random.default_rng(7)
+    values = np.concatenate([rng.normal(30, 1.5, 40), rng.normal(36, 1.5, 20)])
+
+    baseline = ControlChart()
+    _feed(baseline, values[:MIN_BASELINE])
+    center, sigma = baseline.limits()
+    assert np.isclose(center, values[:MIN_BASELINE].mean())
+    assert np.isclose(sigma, np.abs(np.diff(values[:MIN_BASELINE])).mean() / 1.128)
+
+    chart = ControlChart()
+    rules = _feed(chart, values)
+    assert any(code & (_bit('beyond_limits') | _bit('cusum')) for code in rules[40:45])
+
+    frame = chart.frame()
+    assert np.isnan(frame['range'].iat[0])
+    assert frame['range'].iat[1] == abs(values[1] - values[0])
+    assert (frame['range_ucl'].dropna() > frame['range_center'].dropna()).all()
+
+
+def test_index_rebuilds_without_listing_every_batch():
+    store = ExperimentStore(':memory:')
+    # Enough bound parameters for a specimen row, fewer than the batches.
+    store._conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 20)
+    mixes = pd.DataFrame(SEED_DATA).iloc[:4]
+    day = datetime.date(2026, 1, 1)
+    for k in range(24):
+        store.put_batch(f'batch {k}', 'lab', mixes, tested_on=day + datetime.timedelta(days=k))
+
+    index = SpcIndex()
+    assert index.update(store) == 24 * len(mixes)
+    assert index.update(store) == 0
+
+    store.put_batch('batch 24', 'lab', mixes, tested_on=day + datetime.timedelta(days=24))
+    assert index.update(store) == len(mixes)
+
+    # Replacing an old batch makes the whole index stale.
+    store.put_batch('batch 3', 'lab', mixes.assign(**{'Rc28 (МПа)': 1.0}), tested_on=day + datetime.timedelta(days=3))
+    assert index.update(store) == 25 * len(mixes)
+    chart = next(iter(index.charts.values()))
+    assert chart.n_subgroups == 25
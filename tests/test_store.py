@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from ingest import KEYS, REQUIRED_COLUMNS
+from paging import merge_edits, with_page_ids
+from store import SEED_DATA, ExperimentStore
+
+EDITS = {'Cement_share (%)': 55.5, 'W_B': 0.41, 'Additive (%)': 0.12, 'Fiber (%)': 0.35,
+         'Rc28 (МПа)': 21.3, 'Rt (МПа)': np.nan, 'Rras (МПа)': 2.7, 'PGR (см)': 6.9, 'Experiment': 'Опыт 9'}
+
+
+def _store():
+    store = ExperimentStore(':memory:')
+    store.put_batch('batch', 'lab', pd.DataFrame(SEED_DATA).iloc[:3])
+    return store
+
+
+def _stored(store, specimen_id):
+    columns = ', '.join(KEYS[col] for col in REQUIRED_COLUMNS)
+    row = store._conn.execute(f"SELECT {columns} FROM specimens WHERE id = ?", (int(specimen_id),)).fetchone()
+    return dict(zip(REQUIRED_COLUMNS, row))
+
+
+def test_editing_every_column_of_a_compact_frame_round_trips():
+    store = _store()
+    page = store.load()
+    assert page['Cement_share (%)'].dtype == np.uint8 and page['W_B'].dtype == np.float32
+    specimen = page.index[1]
+
+    # What the editor hands back: the page by position, cells as typed.
+    edited = page.reset_index(drop=True).astype(object)
+    for col, value in EDITS.items():
+        edited.loc[1, col] = value
+    edited = with_page_ids(page, edited)
+    merged = merge_edits(page, page, edited, {'edited_rows': {1: EDITS}})
+
+    assert store.apply_edits(page, edited) == 1
+    # Values are stored at their decimal value, not float32 noise.
+    assert _stored(store, specimen) == {**EDITS, 'Rt (МПа)': None}
+    # Untouched rows stay as they were.
+    assert _stored(store, page.index[0])['W_B'] == float(SEED_DATA['W_B'][0])
+
+    reloaded = store.load()
+    pd.testing.assert_frame_equal(reloaded.astype({'Experiment': object}), merged.astype({'Experiment': object}),
+                                  check_dtype=False)
+    # Saving the merged slice again finds nothing left to write.
+    assert store.apply_edits(reloaded, merged) == 0
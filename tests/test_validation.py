@@ -0,0 +1,34 @@
+import numpy as np
+
+from ingest import load_upload
+from validation import SCHEMA, ColumnRule, validate
+
+HEADER = "Cement_share (%);W_B;Additive (%);Fiber (%);Rc28 (МПа);Rt (МПа);Rras (МПа);PGR (см);Experiment\n"
+
+
+def test_unparsable_cells_are_type_errors(tmp_path):
+    data = (HEADER + "50;0,3;1;0;17,7a;2;3;7;Опыт 1\n"
+                     "60;0,3;1;0;;2;3;7;Опыт 1\n"
+                     "70;0,3;1;0;20;2;3;7;Опыт 2\n").encode()
+
+    for _ in range(2):  # parsed, then read back from the cache
+        df, unparsable = load_upload('batch.csv', data, cache_dir=tmp_path)
+        report = validate(df, unparsable=unparsable).report()
+
+        assert report[['Строка', 'Ошибка']].values.tolist() == [
+            [1, "значение не является числом"],
+            [2, "пустое значение"],
+        ]
+        assert report['Значение'].iat[0] == '17,7a'
+
+
+def test_experiment_names_outside_the_allowed_list_are_reported(tmp_path):
+    data = (HEADER + "50;0,3;1;0;17;2;3;7;Опыт 1\n60;0,3;1;0;18;2;3;7;Опыт X\n").encode()
+    df, unparsable = load_upload('batch.csv', data, cache_dir=tmp_path)
+    schema = tuple(ColumnRule('Experiment', numeric=False, allowed=('Опыт 1',)) if rule.name == 'Experiment'
+                   else rule for rule in SCHEMA)
+
+    result = validate(df, schema, unparsable)
+
+    assert np.flatnonzero(result.invalid).tolist() == [1]
+    assert result.report()['Ошибка'].tolist() == ["недопустимое значение"]
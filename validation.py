@@ -0,0 +1,247 @@
+"""Declarative, vectorized validation of experimental data.
+
+The schema lists one ``ColumnRule`` per known column; rules of optional
+columns that a file does not have are skipped.  ``validate``
+evaluates every rule as NumPy masks over whole columns and folds the
+results into a single ``uint64`` violation code per row, one bit per
+(column, check) pair.  The row-level report is only decoded for the rows
+that actually have violations.
+
+Uploads arrive already parsed, with unreadable numbers turned into NaN;
+``ingest.load_upload`` lists those cells, and ``validate`` reports them
+as type errors with the original text.  The names accepted in the
+Experiment column can be fixed per deployment through
+``CONCRETE_EXPERIMENTS`` (names separated by ``;``); unset, any non-empty
+name is accepted.
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from ingest import OPTIONAL_COLUMNS
+
+# Checks evaluated for every column; the bit of a violation is
+# ``column_position * len(CHECKS) + check_position``.
+CHECKS = ('null', 'type', 'range', 'allowed')
+
+CHECK_MESSAGES = {
+    'null': "пустое значение",
+    'type': "значение не является числом",
+    'range': "значение вне допустимого диапазона {bounds}",
+    'allowed': "недопустимое значение",
+}
+
+ACTIONS = {
+    'keep': "Оставить как есть",
+    'drop': "Удалить строки с ошибками",
+    'quarantine': "Переместить в карантин",
+    'coerce': "Исправить, где возможно",
+}
+
+
+@dataclass(frozen=True)
+class ColumnRule:
+    """Constraints for one column of the experimental data table."""
+    name: str
+    numeric: bool = True
+    min: float | None = None
+    max: float | None = None
+    min_inclusive: bool = True
+    max_inclusive: bool = True
+    nullable: bool = False
+    allowed: tuple | None = None
+
+    def bounds(self):
+        left = '[' if self.min_inclusive and self.min is not None else '('
+        right = ']' if self.max_inclusive and self.max is not None else ')'
+        low = '-∞' if self.min is None else f"{self.min:g}"
+        high = '+∞' if self.max is None else f"{self.max:g}"
+        return f"{left}{low}; {high}{right}"
+
+
+ALLOWED_EXPERIMENTS = tuple(
+    name.strip() for name in os.environ.get('CONCRETE_EXPERIMENTS', '').split(';') if name.strip()
+) or None
+
+SCHEMA = (
+    ColumnRule('Cement_share (%)', min=0, max=100),
+    ColumnRule('W_B', min=0, min_inclusive=False),
+    ColumnRule('Additive (%)', min=0, max=100),
+    ColumnRule('Fiber (%)', min=0, max=100),
+    ColumnRule('Rc28 (МПа)', min=0),
+    ColumnRule('Rt (МПа)', min=0),
+    ColumnRule('Rras (МПа)', min=0),
+    ColumnRule('PGR (см)', min=0),
+    ColumnRule('Experiment', numeric=False, allowed=ALLOWED_EXPERIMENTS),
+    *(ColumnRule(col, min=0, nullable=True) for col in OPTIONAL_COLUMNS),
+)
+
+assert len(SCHEMA) * len(CHECKS) <= 64, "violation codes are stored in uint64"
+
+
+def _bit(column_position, check):
+    return np.uint64(1) << np.uint64(column_position * len(CHECKS) + CHECKS.index(check))
+
+
+def _column_masks(series, rule, failed=None):
+    """Return ``{check: bool mask}`` for one column.
+
+    ``failed`` marks cells that were unparsable before ``series`` was
+    converted to numbers; they count as type errors, not as empty.
+    """
+    if rule.numeric:
+        values = pd.to_numeric(series, errors='coerce').to_numpy(np.float64, na_value=np.nan)
+        missing = series.isna().to_numpy()
+        unparsable = np.isnan(values) & ~missing
+        if failed is not None:
+            unparsable = unparsable | failed
+            missing = missing & ~failed
+
+        with np.errstate(invalid='ignore'):
+            out_of_range = np.zeros(len(values), dtype=bool)
+            if rule.min is not None:
+                out_of_range |= values < rule.min if rule.min_inclusive else values <= rule.min
+            if rule.max is not None:
+                out_of_range |= values > rule.max if rule.max_inclusive else values >= rule.max
+    else:
+        missing = series.isna().to_numpy()
+        if not missing.all():
+            missing = missing | series.astype('string').str.strip().eq('').fillna(False).to_numpy(bool)
+        unparsable = np.zeros(len(series), dtype=bool)
+        out_of_range = unparsable
+
+    masks = {'type': unparsable, 'range': out_of_range}
+    masks['null'] = missing if not rule.nullable else np.zeros(len(series), dtype=bool)
+    if rule.allowed is not None:
+        masks['allowed'] = ~series.isin(rule.allowed).to_numpy() & ~missing
+    return masks
+
+
+class ValidationResult:
+    """Per-row violation codes produced by ``validate``."""
+
+    def __init__(self, df, schema, codes, unparsable=None):
+        self.df = df
+        self.schema = schema
+        self.codes = codes
+        self.unparsable = unparsable
+
+    @property
+    def invalid(self):
+        return self.codes != 0
+
+    @property
+    def ok(self):
+        return not self.invalid.any()
+
+    def _decode(self, rows):
+        """Yield (row, column, check) for every set bit of the given rows."""
+        codes = self.codes[rows]
+        n_bits = len(self.schema) * len(CHECKS)
+        bits = (codes[:, None] >> np.arange(n_bits, dtype=np.uint64)) & np.uint64(1)
+        row_pos, bit = np.nonzero(bits)
+        return rows[row_pos], bit // len(CHECKS), bit % len(CHECKS)
+
+    def summary(self):
+        """Number of rows failing each (column, check) pair."""
+        rows = np.flatnonzero(self.invalid)
+        _, column_pos, check_pos = self._decode(rows)
+        counts = pd.DataFrame({'column': column_pos, 'check': check_pos}).value_counts().sort_index()
+        return pd.DataFrame({
+            'Колонка': [self.schema[c].name for c, _ in counts.index],
+            'Ошибка': [self._message(self.schema[c], CHECKS[k]) for c, k in counts.index],
+            'Строк': counts.to_numpy(),
+        })
+
+    def report(self, limit=None):
+        """Row-level violation list (1-based row numbers of the validated frame)."""
+        rows = np.flatnonzero(self.invalid)
+        if limit is not None:
+            rows = rows[:limit]
+        row_idx, column_pos, check_pos = self._decode(rows)
+        columns = [self.schema[c].name for c in column_pos]
+        values = [self.df[col].iat[r] for col, r in zip(columns, row_idx)]
+        if self.unparsable is not None and len(self.unparsable):
+            # Unparsable cells are NaN in the frame; show what the file had.
+            cells = self.unparsable[self.unparsable['row'].isin(rows)]
+            text = dict(zip(zip(cells['row'], cells['column']), cells['value']))
+            values = [text.get((r, col), value) for col, r, value in zip(columns, row_idx, values)]
+        return pd.DataFrame({
+            'Строка': row_idx + 1,
+            'Колонка': columns,
+            'Значение': values,
+            'Ошибка': [self._message(self.schema[c], CHECKS[k])
+                       for c, k in zip(column_pos, check_pos)],
+            'Код': self.codes[row_idx],
+        })
+
+    @staticmethod
+    def _message(rule, check):
+        return CHECK_MESSAGES[check].format(bounds=rule.bounds())
+
+
+def validate(df, schema=SCHEMA, unparsable=None):
+    """Check every schema rule against ``df`` in one vectorized pass.
+
+    ``unparsable`` is the frame of unparsable cells returned by
+    ``ingest.load_upload`` together with ``df``.
+    """
+    codes = np.zeros(len(df), dtype=np.uint64)
+    for position, rule in enumerate(schema):
+        if rule.name not in df:
+            continue
+        failed = None
+        if unparsable is not None and len(unparsable):
+            failed = np.zeros(len(df), dtype=bool)
+            failed[unparsable['row'][unparsable['column'] == rule.name].to_numpy(np.int64)] = True
+        for check, mask in _column_masks(df[rule.name], rule, failed).items():
+            codes |= mask.astype(np.uint64) * _bit(position, check)
+    return ValidationResult(df, schema, codes, unparsable)
+
+
+def coerce(df, schema=SCHEMA):
+    """Repair what can be repaired: clip numbers into range and blank unparsable cells."""
+    out = df.copy()
+    for rule in schema:
+        if rule.name not in out:
+            continue
+        if not rule.numeric:
+            if rule.allowed is not None:
+                out[rule.name] = out[rule.name].where(out[rule.name].isin(rule.allowed))
+            continue
+        values = pd.to_numeric(out[rule.name], errors='coerce')
+        # Open bounds cannot be clipped onto; those rows stay invalid.
+        low = rule.min if rule.min_inclusive else None
+        high = rule.max if rule.max_inclusive else None
+        out[rule.name] = values.clip(lower=low, upper=high).astype(values.dtype)
+    return out
+
+
+def apply_action(df, result, action):
+    """Apply a validation action; returns ``(clean, quarantined)`` frames.
+
+    ``quarantined`` is empty unless ``action`` is ``'quarantine'``.  For
+    ``'coerce'`` the rows that remain invalid after repair are dropped.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown validation action: {action}")
+
+    empty = df.iloc[:0]
+    if action == 'keep':
+        return df, empty
+
+    if action == 'coerce':
+        repaired = coerce(df, result.schema)
+        still_invalid = validate(repaired, result.schema).invalid
+        return repaired.loc[~still_invalid].reset_index(drop=True), empty
+
+    invalid = result.invalid
+    clean = df.loc[~invalid].reset_index(drop=True)
+    if action == 'drop':
+        return clean, empty
+
+    quarantined = df.loc[invalid].copy()
+    quarantined.insert(0, 'Код ошибки', result.codes[invalid])
+    return clean, quarantined.reset_index(drop=True)